@@ -4,11 +4,32 @@ import time
 import sqlite3
 from datetime import datetime
 
+from bet_writer import BetWriter
+from checkpoint import WalCheckpointer
+from clusters import ClusterIndex
+from enrichment import ApiLimiter, EnrichmentPool
+from http_client import ApiClient, CircuitOpen
+from ingest import PollScheduler, TradeCursor, TradePager
+from intel_cache import WalletIntelCache
+from ladder import LadderBook
+from market_registry import MarketRegistry
+from metrics import MetricsPublisher
+from partitions import BetsArchive
+from pipeline import DualPipeline
+from profiler import SamplingProfiler, install_toggle
+from scoring import AnomalyScorer
+from tape import TapeRecorder
+from timeseries import VelocityDownsampler
+import checkpoint
+import metrics
+import schema
+
 # ==========================================
 # CONFIGURAÇÃO DO SISTEMA
 # ==========================================
-DATA_API = "https://data-api.polymarket.com"
-GAMMA_API = "https://gamma-api.polymarket.com"
+DATA_API = os.getenv("DATA_API", "https://data-api.polymarket.com")  # Sobrescrevível (ex.: benchmarks/stub_api.py)
+GAMMA_API = os.getenv("GAMMA_API", "https://gamma-api.polymarket.com")
+POLYGONSCAN_API = os.getenv("POLYGONSCAN_API", "https://api.polygonscan.com")
 DB_MAIN = "whale_hunter.db"
 DB_INSIDER = "insider_intel.db"
 
@@ -31,6 +52,146 @@ ACCUMULATION_FLOOR = 500  # Valor mínimo para iniciar a agregação em buckets
 LADDER_WINDOW = 600  # Janela de tempo (segundos) para lógica de agregação
 INSIDER_TRIGGER = 3000  # Gatilho para marcar carteira como "Ponto de Interesse"
 CRITICAL_TRIGGER = 5000  # Gatilho de alerta imediato para anomalias significativas
+THRESHOLDS = {
+    "STREAM_NOISE_FLOOR": STREAM_NOISE_FLOOR,
+    "STREAM_MIN_SIZE": STREAM_MIN_SIZE,
+    "ACCUMULATION_FLOOR": ACCUMULATION_FLOOR,
+    "LADDER_WINDOW": LADDER_WINDOW,
+    "INSIDER_TRIGGER": INSIDER_TRIGGER,
+    "CRITICAL_TRIGGER": CRITICAL_TRIGGER,
+}  # Conjunto usado pelo motor de classificação (o replay parte destes valores)
+LADDER_MAX_BUCKETS = 50000  # Teto de memória; acima dele o bucket menos recente é liquidado antecipadamente
+LADDER_SNAPSHOT_INTERVAL = 60  # Intervalo (s) entre snapshots dos buckets (clusters e linhas de base) em disco
+
+# --- CLUSTERS DE CARTEIRAS (POSIÇÃO FRACIONADA ENTRE CARTEIRAS) ---
+CLUSTER_WINDOW = 60  # Trades no mesmo cid/lado com até N segundos de diferença ligam as carteiras
+CLUSTER_MIN_HITS = 2  # Co-ocorrências necessárias antes de ligar duas carteiras
+CLUSTER_MAX_SIZE = 25  # Teto por cluster (evita fundir market makers)
+CLUSTER_TRIGGER = CRITICAL_TRIGGER  # Acumulação conjunta que dispara a detecção insider
+CLUSTER_MAX_WALLETS = 200000  # Teto de carteiras indexadas; acima disso os clusters menos ativos saem (LRU)
+CLUSTER_SETTINGS = {
+    "CLUSTER_WINDOW": CLUSTER_WINDOW,
+    "CLUSTER_MIN_HITS": CLUSTER_MIN_HITS,
+    "CLUSTER_MAX_SIZE": CLUSTER_MAX_SIZE,
+    "CLUSTER_TRIGGER": CLUSTER_TRIGGER,
+}  # O replay e o backfill usam um índice em memória com os mesmos valores
+
+# --- GATILHOS ADAPTATIVOS POR MERCADO (scoring.py) ---
+ANOMALY_SCORING = os.getenv("ANOMALY_SCORING", "1") == "1"  # 0 volta aos gatilhos fixos em todos os mercados
+ANOMALY_HALFLIFE = 500  # Meia-vida (em trades) das médias móveis de cada mercado
+ANOMALY_WARMUP = 50  # Trades observados antes de trocar INSIDER/CRITICAL_TRIGGER pelos gatilhos do mercado
+ANOMALY_Z_INSIDER = 3.0  # Desvios (log do tamanho) acima do típico do mercado para a detecção insider
+ANOMALY_Z_CRITICAL = 4.0  # Idem para o alerta imediato
+ANOMALY_MIN_USD = INSIDER_MIN_SIZE  # Piso absoluto dos gatilhos adaptativos (mercados finos)
+ANOMALY_QUANTILE = 0.99  # Quantil do tamanho por trade que os gatilhos nunca ficam abaixo
+ANOMALY_SETTINGS = {
+    "ANOMALY_HALFLIFE": ANOMALY_HALFLIFE,
+    "ANOMALY_WARMUP": ANOMALY_WARMUP,
+    "ANOMALY_Z_INSIDER": ANOMALY_Z_INSIDER,
+    "ANOMALY_Z_CRITICAL": ANOMALY_Z_CRITICAL,
+    "ANOMALY_MIN_USD": ANOMALY_MIN_USD,
+    "ANOMALY_QUANTILE": ANOMALY_QUANTILE,
+}  # Mesmas linhas de base no replay e no backfill (com ANOMALY_SCORING ligado)
+
+# --- PIPELINE DE ESCRITA (BATCH) ---
+FLUSH_MAX_ROWS = 200  # Grava o lote ao atingir N registros pendentes
+FLUSH_MAX_LATENCY = 5.0  # Latência máxima (segundos) de um registro na fila antes do flush
+FLUSH_MAX_RETRIES = 10  # Flushes seguidos com o banco ocupado antes de descartar o lote
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "dead_letter.jsonl")  # Lotes descartados pelo BetWriter (JSONL)
+
+# --- ENRIQUECIMENTO FORENSE (ASSÍNCRONO) ---
+ENRICH_WORKERS = 4  # Workers em segundo plano executando get_wallet_intel
+ENRICH_QUEUE_SIZE = 500  # Fila limitada; excedentes são descartados para não travar a ingestão
+# Limites por API: (chamadas simultâneas, chamadas por segundo)
+API_LIMITS = {
+    "gamma": (4, 10.0),
+    "data": (4, 10.0),
+    "polygonscan": (1, 4.0),  # Plano gratuito: 5 req/s
+}
+
+# --- CAMADA HTTP (http_client.py) ---
+API_HOSTS = {"gamma": GAMMA_API, "data": DATA_API, "polygonscan": POLYGONSCAN_API}  # Uma sessão keep-alive por host
+API_ENDPOINTS = {  # (timeout em s, novas tentativas em falhas transitórias)
+    ("data", "trades"): (10, 2),
+    ("data", "value"): (4, 1),
+    ("data", "positions"): (4, 1),
+    ("gamma", "users"): (4, 1),
+    ("gamma", "events"): (15, 2),
+    ("polygonscan", "txlist"): (5, 1),
+}
+API_BREAKERS = {  # (falhas seguidas até abrir o disjuntor, resfriamento inicial em s; dobra a cada reabertura)
+    "gamma": (10, 15.0),
+    "data": (10, 10.0),
+    "polygonscan": (3, 60.0),  # Parar de insistir quando o plano gratuito nos limita
+}
+API_POOL_SIZE = ENRICH_WORKERS + 4  # Conexões mantidas por host
+
+# --- CACHE DE INTELIGÊNCIA DE CARTEIRAS ---
+# TTL por campo em segundos (None = nunca expira)
+INTEL_CACHE_TTLS = {
+    "profile": None,  # Data de criação da conta não muda
+    "funding": None,  # Primeiro financiador não muda
+    "portfolio": 6 * 3600,
+}
+INTEL_NEGATIVE_TTL = 300  # Backoff inicial após falha (dobra a cada nova falha)
+INTEL_NEGATIVE_MAX_TTL = 86400
+
+# --- INGESTÃO PAGINADA (CURSOR) ---
+TRADES_PAGE_SIZE = 500  # Trades por página no /trades
+TRADES_MAX_PAGES = 10  # Páginas por ciclo antes de registrar lacuna
+CURSOR_OVERLAP = 120  # Janela (s) de deduplicação por identidade abaixo do cursor
+POLL_BASE_INTERVAL = 15.0
+POLL_MIN_INTERVAL = 2.0  # Sob carga
+POLL_MAX_INTERVAL = 60.0  # Fita parada
+
+# --- FITA BRUTA (OPCIONAL) ---
+TAPE_DIR = os.getenv("TAPE_DIR")  # Diretório das fitas .ptape; vazio desativa a gravação
+TAPE_ROTATION = os.getenv("TAPE_ROTATION", "hour")  # "hour" ou "day"
+TAPE_CHUNK_ROWS = 5000  # Trades por chunk comprimido
+TAPE_MAX_LATENCY = 300  # Segundos máximos de trades em buffer antes de gravar
+
+# --- REGISTRO DE MERCADOS ---
+# Tags monitoradas (slugs separados por vírgula; vazio = todos os eventos)
+MARKET_TAGS = os.getenv("MARKET_TAGS", "politics,us-election").split(",")
+MARKET_PAGE_SIZE = 500  # Eventos por página no /events
+MARKET_REFRESH_INTERVAL = 300  # Atualização incremental (s) em segundo plano
+MARKET_FULL_SYNC_INTERVAL = 6 * 3600  # Sincronização completa (remove mercados sumidos)
+
+# --- PARTIÇÕES E RETENÇÃO DE BETS (partitions.py) ---
+BETS_ARCHIVE_DIR = os.getenv("BETS_ARCHIVE_DIR", "archive")  # Partições mensais das apostas antigas
+BETS_HOT_DAYS = 14  # Dias mantidos na tabela quente `bets` (o dashboard lê as últimas 24h)
+BETS_RETENTION_DAYS = 180  # Partições mais antigas viram resumos diários (bets_summary)
+BETS_ARCHIVE_BATCH = 5000  # Linhas movidas por transação (o scanner não espera pelo lock)
+BETS_ARCHIVE_INTERVAL = 3600  # Intervalo (s) entre execuções do arquivamento
+
+# --- SÉRIES DE VELOCIDADE (timeseries.py) ---
+VELOCITY_DOWNSAMPLE_INTERVAL = 60  # Intervalo (s) da derivação das resoluções grossas e da retenção
+
+# --- CHECKPOINT DO WAL ---
+WAL_CHECKPOINT_INTERVAL = 30  # Checkpoints PASSIVE em segundo plano (0 = auto-checkpoint do SQLite)
+WAL_TRUNCATE_BYTES = 64 * 2 ** 20  # Acima disto, tenta truncar o arquivo -wal
+
+# --- SUPERVISOR MULTIPROCESSO (supervisor.py) ---
+SHARD_COUNT = int(os.getenv("SCANNER_SHARDS", max(1, (os.cpu_count() or 2) - 2)))  # Reserva núcleos p/ supervisor e escritor
+SHARD_QUEUE_SIZE = 64  # Lotes pendentes por shard antes de o supervisor bloquear (backpressure)
+WRITER_QUEUE_SIZE = 20000  # Operações pendentes no processo escritor
+SHARD_TICK_INTERVAL = 5.0  # Avaliação dos buckets de agregação em cada shard (s)
+SHARD_HEALTH_INTERVAL = 10.0  # Intervalo (s) dos relatórios de saúde dos shards
+SHARD_STALE_AFTER = 60  # Shard sem heartbeat por N segundos é reportado como travado
+SHARD_SHUTDOWN_TIMEOUT = 60  # Espera máxima (s) pelo esvaziamento das filas no encerramento
+
+# --- MÉTRICAS E PROFILER (metrics.py / profiler.py) ---
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")  # Snapshot por processo, exposto pelo /metrics do servidor
+METRICS_INTERVAL = 10  # Intervalo (s) entre publicações do snapshot
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # Perfis .folded gravados ao desligar o profiler
+PROFILE_INTERVAL = 0.005  # Período de amostragem (s)
+PROFILE_ON_START = os.getenv("SCANNER_PROFILE", "0") == "1"  # Liga já na partida; SIGUSR2 alterna
+
+# Instrumentos do caminho quente
+POLL_SECONDS = metrics.REGISTRY.histogram("sentinel_poll_seconds", "Duração da paginação do /trades por ciclo (s)")
+TRADES_PER_CYCLE = metrics.REGISTRY.histogram("sentinel_trades_per_cycle", "Trades novos por ciclo de varredura",
+                                              buckets=metrics.COUNT_BUCKETS)
+LADDER_SECONDS = metrics.REGISTRY.histogram("sentinel_process_ladders_seconds", "Duração de process_ladders (s)")
 
 # Whitelist de Entidades Conhecidas para identificação de fonte de fundos
 KNOWN_WALLETS = {
@@ -44,195 +205,293 @@ KNOWN_WALLETS = {
 }
 
 
+def configure_wal():
+    """
+    Com o WalCheckpointer ligado, nenhuma conexão deste processo faz checkpoint
+    no commit (o pragma vale por conexão). Chamada antes de abrir qualquer banco.
+    """
+    checkpoint.set_autocheckpoint(0 if WAL_CHECKPOINT_INTERVAL else None)
+
+
+def polygonscan_throttled(response):
+    """PolygonScan sinaliza o limite de taxa com HTTP 200 e status "0"."""
+    body = response.json()
+    return body.get('status') == '0' and "rate limit" in str(body.get('result', '')).lower()
+
+
 class WhaleSentinel:
     def __init__(self):
-        self.market_cache = {}
-        self.politics_ids = set()
-        self.ladder_buckets = {}
-        self.last_seen_ts = int(time.time())
+        configure_wal()
         self.initialize_databases()
+        self.open_markets(self.fetch_events_page)
+        self.open_ladder(LADDER_MAX_BUCKETS)
+        self.open_ingest()
+        self.checkpointer = None
+        if WAL_CHECKPOINT_INTERVAL:
+            self.checkpointer = WalCheckpointer([DB_MAIN, DB_INSIDER], interval=WAL_CHECKPOINT_INTERVAL,
+                                                truncate_bytes=WAL_TRUNCATE_BYTES)
+            self.checkpointer.start()
+        self.writer = BetWriter(DB_MAIN, DB_INSIDER, max_rows=FLUSH_MAX_ROWS, max_latency=FLUSH_MAX_LATENCY,
+                                max_retries=FLUSH_MAX_RETRIES, dead_letter=DEAD_LETTER_PATH)
+        self.open_maintenance()
+        self.open_api(API_LIMITS)
+        self.open_clusters()
+        self.open_tape()
+        self.open_pipeline()
+        self.start_instrumentation("scanner")
+
+    # --- MONTAGEM (compartilhada com ShardWorker/ShardSupervisor em supervisor.py) ---
+
+    def open_markets(self, fetch_page):
+        """Registro de mercados e suas visões vivas (atualizadas no lugar pela sincronização)."""
+        self.markets = MarketRegistry(DB_MAIN, fetch_page, MARKET_TAGS, page_size=MARKET_PAGE_SIZE,
+                                      refresh_interval=MARKET_REFRESH_INTERVAL,
+                                      full_sync_interval=MARKET_FULL_SYNC_INTERVAL)
+        self.market_cache = self.markets.markets
+        self.politics_ids = self.markets.ids
+
+    def open_ladder(self, max_buckets, owns=None):
+        self.ladder_buckets = LadderBook(DB_MAIN, LADDER_WINDOW, max_buckets=max_buckets,
+                                         market_lookup=self.market_cache.get, owns=owns)
+
+    def open_ingest(self):
+        """Cursor, paginador do /trades e agendador do polling."""
+        self.cursor = TradeCursor(DB_MAIN, overlap=CURSOR_OVERLAP)
+        self.pager = TradePager(self.fetch_trades_page, page_size=TRADES_PAGE_SIZE, max_pages=TRADES_MAX_PAGES)
+        self.poller = PollScheduler(POLL_BASE_INTERVAL, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL)
+
+    def open_maintenance(self):
+        """Arquivamento de partições de bets e downsampling das séries de velocidade."""
+        self.archive = BetsArchive(DB_MAIN, BETS_ARCHIVE_DIR, hot_days=BETS_HOT_DAYS,
+                                   retention_days=BETS_RETENTION_DAYS, batch=BETS_ARCHIVE_BATCH,
+                                   interval=BETS_ARCHIVE_INTERVAL)
+        self.downsampler = VelocityDownsampler(DB_MAIN, interval=VELOCITY_DOWNSAMPLE_INTERVAL)
+
+    def open_api(self, limits):
+        self.limiter = ApiLimiter(limits)
+        self.api = self.make_api_client(self.limiter)
+
+    def open_clusters(self, readonly=False):
+        self.clusters = ClusterIndex(DB_MAIN, window=CLUSTER_WINDOW, min_hits=CLUSTER_MIN_HITS,
+                                     max_size=CLUSTER_MAX_SIZE, trigger=CLUSTER_TRIGGER, bucket_window=LADDER_WINDOW,
+                                     max_wallets=CLUSTER_MAX_WALLETS,
+                                     ignore_funders=KNOWN_WALLETS,  # Exchanges financiam milhares de carteiras
+                                     readonly=readonly)
+
+    def open_tape(self):
+        self.tape = None
+        if TAPE_DIR:
+            self.tape = TapeRecorder(TAPE_DIR, rotation=TAPE_ROTATION, chunk_rows=TAPE_CHUNK_ROWS,
+                                     max_latency=TAPE_MAX_LATENCY)
+
+    def open_pipeline(self, owns=None):
+        """Forense (cache + workers), linhas de base e o motor de classificação sobre o ladder e os clusters."""
+        self.intel_cache = WalletIntelCache(DB_INSIDER, INTEL_CACHE_TTLS,
+                                            neg_base=INTEL_NEGATIVE_TTL, neg_max=INTEL_NEGATIVE_MAX_TTL)
+        self.enricher = EnrichmentPool(self.get_wallet_intel, self.on_intel,
+                                       workers=ENRICH_WORKERS, max_queue=ENRICH_QUEUE_SIZE)
+        self.scorer = self.make_scorer(owns=owns) if ANOMALY_SCORING else None
+        self.pipeline = DualPipeline(THRESHOLDS, self.market_cache, self.politics_ids, self.ladder_buckets, self,
+                                     clusters=self.clusters, scorer=self.scorer)
+
+    def make_api_client(self, limiter):
+        """Cliente HTTP compartilhado do processo (pools keep-alive, retries e disjuntores por host)."""
+        return ApiClient(API_HOSTS, API_ENDPOINTS, breakers=API_BREAKERS, limiter=limiter, pool_size=API_POOL_SIZE)
+
+    def make_scorer(self, owns=None):
+        """Linhas de base por mercado para os gatilhos adaptativos (restauradas do último snapshot)."""
+        return AnomalyScorer(DB_MAIN, fixed=(INSIDER_TRIGGER, CRITICAL_TRIGGER), halflife=ANOMALY_HALFLIFE,
+                             warmup=ANOMALY_WARMUP, z_insider=ANOMALY_Z_INSIDER, z_critical=ANOMALY_Z_CRITICAL,
+                             min_usd=ANOMALY_MIN_USD, quantile=ANOMALY_QUANTILE, owns=owns)
+
+    def start_instrumentation(self, process):
+        """Publicação das métricas deste processo e toggle do profiler por SIGUSR2."""
+        metrics.REGISTRY.register_collector(self.collect_metrics)
+        self.metrics = MetricsPublisher(METRICS_DIR, process, interval=METRICS_INTERVAL)
+        self.metrics.start()
+        self.profiler = SamplingProfiler(PROFILE_DIR, process, interval=PROFILE_INTERVAL)
+        install_toggle(self.profiler)
+        if PROFILE_ON_START:
+            self.profiler.start()
+
+    def stop_instrumentation(self):
+        self.profiler.stop()
+        self.metrics.close()
+
+    def collect_metrics(self):
+        """Contadores `stats` dos componentes presentes neste processo (supervisor e shards têm subconjuntos)."""
+        families = []
+        for attr, name, help in (
+            ("pager", "sentinel_trades_total", "Trades paginados do /trades, por resultado"),
+            ("pipeline", "sentinel_pipeline_total", "Eventos do motor de classificação"),
+            ("intel_cache", "sentinel_intel_cache_total", "Consultas ao cache de inteligência de carteiras"),
+            ("enricher", "sentinel_enrichment_total", "Tarefas do pool de enriquecimento forense"),
+            ("ladder_buckets", "sentinel_ladder_total", "Buckets de agregação liquidados fora do fluxo normal"),
+            ("clusters", "sentinel_clusters_total", "Ligações e gatilhos do índice de clusters"),
+            ("scorer", "sentinel_anomaly_total", "Trades observados e gatilhos consultados (adaptativos ou fixos)"),
+            ("checkpointer", "sentinel_wal_checkpoint_total", "Checkpoints do WAL em segundo plano"),
+            ("downsampler", "sentinel_velocity_downsample_total", "Execuções e buckets derivados/apagados das séries"),
+            ("tape", "sentinel_tape_total", "Gravação da fita bruta"),
+        ):
+            component = getattr(self, attr, None)
+            if component is not None:
+                families.append(metrics.stats_family(name, help, component.stats))
+        gauges = []
+        if getattr(self, "ladder_buckets", None) is not None:
+            gauges.append(("sentinel_ladder_buckets", "Buckets de agregação ativos", len(self.ladder_buckets)))
+        if getattr(self, "enricher", None) is not None:
+            gauges.append(("sentinel_enrichment_backlog", "Carteiras na fila forense", self.enricher.backlog()))
+        if getattr(self, "poller", None) is not None:
+            gauges.append(("sentinel_poll_interval_seconds", "Intervalo adaptativo de varredura", self.poller.interval))
+        if getattr(self, "scorer", None) is not None:
+            gauges.append(("sentinel_anomaly_baselines", "Mercados com linha de base de anomalia", len(self.scorer)))
+        gauges.append(("sentinel_markets", "Mercados monitorados", len(self.politics_ids)))
+        families += [(name, "gauge", help, [({}, value)]) for name, help, value in gauges]
+        if getattr(self, "api", None) is not None:
+            families += self.api.collect()
+        return families
 
     def get_db_connection(self, db_path):
         """
         Cria uma conexão SQLite robusta com WAL ativado.
         O timeout de 30s previne erros de 'database locked' durante leituras do servidor.
         """
-        conn = sqlite3.connect(db_path, timeout=30.0)
-        conn.execute("PRAGMA journal_mode=WAL;")
+        conn = checkpoint.connect(db_path)
         conn.execute("PRAGMA synchronous=NORMAL;")
         return conn
 
     def initialize_databases(self):
-        """Inicializa o esquema (schema) para ambas as camadas de persistência se não existirem."""
-
-        # Inicializa Banco Principal (Stream)
-        conn = self.get_db_connection(DB_MAIN)
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS whales (
-                address TEXT PRIMARY KEY, 
-                first_seen INTEGER, 
-                last_seen INTEGER, 
-                total_volume REAL DEFAULT 0, 
-                funding_source TEXT
-            )
-        ''')
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS bets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                whale_address TEXT, 
-                timestamp INTEGER, 
-                market_question TEXT, 
-                category TEXT, 
-                position TEXT, 
-                size_usd REAL, 
-                bet_link TEXT, 
-                tx_hash TEXT, 
-                processed_by_analyst BOOLEAN DEFAULT 0, 
-                FOREIGN KEY(whale_address) REFERENCES whales(address)
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
-        # Inicializa Banco Insider (Forense)
-        conn = self.get_db_connection(DB_INSIDER)
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS intel_whales (
-                address TEXT PRIMARY KEY, 
-                funding_source TEXT, 
-                account_created_ts INTEGER, 
-                portfolio_value REAL, 
-                total_scanned_volume REAL DEFAULT 0, 
-                last_active_ts INTEGER
-            )
-        ''')
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS intel_bets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                whale_address TEXT, 
-                timestamp INTEGER, 
-                market_question TEXT, 
-                position TEXT, 
-                size_usd REAL, 
-                FOREIGN KEY(whale_address) REFERENCES intel_whales(address)
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        """Aplica as migrações de esquema pendentes em ambas as camadas de persistência."""
+        schema.migrate_all(DB_MAIN, DB_INSIDER)
 
     def get_wallet_intel(self, wallet):
         """
         Executa análise forense em um endereço de carteira específico.
         Agrega dados da Gamma API, Data API e PolygonScan.
+        Executada pelos workers do EnrichmentPool, sob os limites de API_LIMITS.
+        Cada campo passa pelo WalletIntelCache: só campos expirados geram chamadas externas.
         """
         intel = {"source": "Desconhecido", "created": 0, "portfolio": 0}
 
-        # A. ANÁLISE DE PERFIL (Gamma API)
+        created = self.intel_cache.get_or_fetch(wallet, "profile", self._fetch_profile)
+        if created:
+            intel['created'] = created
+
+        portfolio = self.intel_cache.get_or_fetch(wallet, "portfolio", self._fetch_portfolio)
+        if portfolio is not None:
+            intel['portfolio'] = portfolio
+
+        funding = self.intel_cache.get_or_fetch(wallet, "funding", self._fetch_funding)
+        if funding:
+            intel['source'] = funding['source']
+            intel['funder'] = funding.get('funder')
+            if intel['created'] == 0:
+                intel['created'] = funding['first_ts']
+
+        return intel
+
+    def on_intel(self, wallet, intel):
+        """Resultado do worker forense: grava no banco e liga carteiras com o mesmo financiador."""
+        self.writer.update_intel(wallet, intel)
+        if intel.get('funder') and self.clusters.link_funder(wallet, intel['funder']):
+            print(f"\n>> 🔗 CLUSTER: {wallet} compartilha financiador com {len(self.clusters.cluster_of(wallet)) - 1} carteira(s).")
+
+    def _fetch_profile(self, wallet):
+        """A. ANÁLISE DE PERFIL (Gamma API). Retorna o timestamp de criação (0 se ausente) ou None em falha."""
         try:
-            r = requests.get(f"{GAMMA_API}/users/{wallet}", timeout=4)
+            r = self.api.get("gamma", "users", f"/users/{wallet}")
             if r.status_code == 200:
-                data = r.json()
-                joined_str = data.get('createdAt')
+                joined_str = r.json().get('createdAt')
                 if joined_str:
                     dt = datetime.fromisoformat(joined_str.replace('Z', '+00:00'))
-                    intel['created'] = int(dt.timestamp())
-        except Exception:
-            pass
-
-        # B. VALUATION DO PORTFÓLIO (Data API)
+                    return int(dt.timestamp())
+                return 0
+            metrics.error("api_gamma_http")
+        except (requests.RequestException, ValueError, AttributeError) as e:
+            self.api_error("gamma", e)
+        return None
+
+    def _fetch_portfolio(self, wallet):
+        """B. VALUATION DO PORTFÓLIO (Data API). Retorna o valor em USD ou None em falha."""
         try:
-            pv = requests.get(f"{DATA_API}/value?user={wallet}", timeout=4).json()
+            pv = self.api.get_json("data", "value", "/value", params={"user": wallet})
+            if isinstance(pv, list):  # A API responde uma lista com um item por usuário
+                pv = pv[0] if pv else {}
             val = float(pv.get('value', 0))
             if val == 0:
                 # Fallback para agregação de posições se o endpoint principal falhar
-                pos = requests.get(f"{DATA_API}/positions?user={wallet}&sizeThreshold=1", timeout=4).json()
+                pos = self.api.get_json("data", "positions", "/positions", params={"user": wallet, "sizeThreshold": 1})
                 for p in pos: val += float(p.get('currentValue', 0))
-            intel['portfolio'] = val
-        except Exception:
-            pass
+            return val
+        except (requests.RequestException, ValueError, TypeError, AttributeError) as e:
+            self.api_error("data", e)
+            return None
 
-        # C. RASTREAMENTO DE FONTE DE FUNDOS (PolygonScan)
+    def _fetch_funding(self, wallet):
+        """C. RASTREAMENTO DE FONTE DE FUNDOS (PolygonScan). Retorna a primeira transação classificada ou None."""
         try:
-            url = "https://api.polygonscan.com/api"
             params = {
                 "module": "account", "action": "txlist", "address": wallet,
                 "startblock": 0, "endblock": 99999999, "page": 1, "offset": 1,
                 "sort": "asc", "apikey": POLYGONSCAN_API_KEY
             }
-            time.sleep(0.2)  # Respeitando limite de taxa (rate limit)
-            r = requests.get(url, params=params, timeout=5).json()
+            # Limite de taxa do plano vem como 200 + "Max rate limit reached": conta para o disjuntor
+            r = self.api.get_json("polygonscan", "txlist", "/api", params=params, throttled=polygonscan_throttled)
 
             if r['status'] == '1' and len(r['result']) > 0:
                 first_tx = r['result'][0]
-                if intel['created'] == 0:
-                    intel['created'] = int(first_tx['timeStamp'])
-
                 funder = first_tx['from'].lower()
 
                 # Correspondência heurística contra hot wallets conhecidas
                 if funder in KNOWN_WALLETS:
-                    intel['source'] = KNOWN_WALLETS[funder]
+                    source = KNOWN_WALLETS[funder]
                 elif "binance" in str(first_tx).lower():
-                    intel['source'] = "Binance"
+                    source = "Binance"
                 elif "coinbase" in str(first_tx).lower():
-                    intel['source'] = "Coinbase"
+                    source = "Coinbase"
                 else:
-                    intel['source'] = "Carteira Privada"
-        except Exception:
-            pass
+                    source = "Carteira Privada"
 
-        return intel
+                return {"source": source, "funder": funder, "first_ts": int(first_tx['timeStamp'])}
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            self.api_error("polygonscan", e)
+        return None
+
+    def api_error(self, api, e):
+        """Falha de enriquecimento: contada por API; recusas do disjuntor aberto à parte (já contadas no cliente)."""
+        metrics.error(f"api_{api}_circuit" if isinstance(e, CircuitOpen) else f"api_{api}")
+
+    def fetch_events_page(self, params):
+        """Uma página do /events da Gamma API."""
+        return self.api.get_json("gamma", "events", "/events", params=params)
 
     def map_markets(self):
-        """Faz cache dos mercados políticos ativos para otimizar buscas em tempo de execução."""
+        """Carrega o mapa de mercados do snapshot e agenda a atualização em segundo plano."""
         print(">> [Sistema] Inicializando Mapa de Mercados...")
-        try:
-            params = {"limit": 5000, "active": "true", "closed": "false"}
-            response = requests.get(f"{GAMMA_API}/events", params=params, timeout=15).json()
-
-            for event in response:
-                tags = [t.get('slug').lower() for t in event.get('tags', [])]
-                if 'politics' in tags or 'us-election' in tags:
-                    for market in event.get('markets', []):
-                        c_id = market.get('conditionId')
-                        if c_id:
-                            self.market_cache[c_id] = {
-                                "q": market.get('question'),
-                                "c": event.get('slug'),
-                                "url": f"https://polymarket.com/event/{event.get('slug')}"
-                            }
-                            self.politics_ids.add(c_id)
-            print(f">> [Sistema] Monitorando {len(self.politics_ids)} mercados políticos.")
-        except Exception:
-            print("!! [Erro] Falha ao mapear mercados.")
+        cached = self.markets.load()
+        if cached:
+            # Cold start instantâneo; a rede é consultada logo em seguida pela thread
+            print(f">> [Sistema] {cached} mercados carregados do snapshot local.")
+            self.markets.start(initial_delay=0)
+        else:
+            self.markets.sync(full=True)
+            self.markets.start(initial_delay=MARKET_REFRESH_INTERVAL)
+        if not self.politics_ids:
+            print("!! [Erro] Nenhum mercado mapeado; nova tentativa em segundo plano.")
+        print(f">> [Sistema] Monitorando {len(self.politics_ids)} mercados ({', '.join(MARKET_TAGS) or 'todas as tags'}).")
 
     def save_whale(self, b, is_insider):
-        """Persiste os dados da aposta na camada de banco de dados apropriada."""
+        """Enfileira os dados da aposta no pipeline de escrita da camada apropriada."""
         value = b['value']
 
         # --- CAMINHO 1: MODO INSIDER/FORENSE ---
         if is_insider:
             print(f">> 🐳 INSIDER DETECTADO (${value:,.0f}). Iniciando Análise Forense.")
-            intel = self.get_wallet_intel(b['wallet'])
-
-            try:
-                conn = self.get_db_connection(DB_INSIDER)
-                c = conn.cursor()
-                c.execute(
-                    '''INSERT OR IGNORE INTO intel_whales (address, funding_source, account_created_ts, portfolio_value) VALUES (?, ?, ?, ?)''',
-                    (b['wallet'], intel['source'], intel['created'], intel['portfolio']))
-                c.execute(
-                    '''UPDATE intel_whales SET total_scanned_volume = total_scanned_volume + ?, last_active_ts = ?, portfolio_value = ? WHERE address = ?''',
-                    (b['value'], b['last_ts'], intel['portfolio'], b['wallet']))
-                c.execute(
-                    '''INSERT INTO intel_bets (whale_address, timestamp, market_question, position, size_usd) VALUES (?, ?, ?, ?, ?)''',
-                    (b['wallet'], b['last_ts'], b['question'], b['position'], b['value']))
-                conn.commit()
-                conn.close()
-            except Exception as e:
-                print(f"!! [Erro] Falha na gravação do DB Insider: {e}")
+            # A aposta é gravada já; a forense preenche os campos quando o worker terminar
+            intel = {"source": "Pendente", "created": 0, "portfolio": 0}
+            self.writer.add_insider(b, intel)
+            if not self.enricher.submit(b['wallet']):
+                print(f"!! [Aviso] Fila forense cheia. Enriquecimento de {b['wallet']} descartado.")
 
         else:
             # --- CAMINHO 2: MODO STREAM GERAL ---
@@ -240,128 +499,120 @@ class WhaleSentinel:
             intel = {"source": "Varejo", "created": int(time.time()), "portfolio": 0}
 
         # --- PERSISTÊNCIA GLOBAL (Stream Visual) ---
-        try:
-            conn = self.get_db_connection(DB_MAIN)
-            c = conn.cursor()
-            c.execute(
-                '''INSERT OR IGNORE INTO whales (address, first_seen, last_seen, funding_source) VALUES (?, ?, ?, ?)''',
-                (b['wallet'], intel['created'], b['last_ts'], intel['source']))
-            c.execute(
-                '''UPDATE whales SET last_seen=?, total_volume=total_volume+?, funding_source=? WHERE address=?''',
-                (b['last_ts'], b['value'], intel['source'], b['wallet']))
-            c.execute(
-                '''INSERT INTO bets (whale_address, timestamp, market_question, category, position, size_usd, bet_link) VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                (b['wallet'], b['last_ts'], b['question'], b['category'], b['position'], b['value'], b['link']))
-            conn.commit()
-            conn.close()
-        except Exception:
-            pass
+        self.writer.add_bet(b, intel)
+
+    def emit(self, kind, payload):
+        """Eventos do feed ao vivo gerados pelo motor de classificação."""
+        self.writer.emit(kind, payload)
 
     def process_ladders(self):
         """Avalia os buckets de agregação contra janelas de tempo e limites de valor."""
-        now = int(time.time())
-        removals = []
-
-        for key, b in self.ladder_buckets.items():
-            if now - b['last_ts'] > LADDER_WINDOW:
-                # Janela expirada. Verificar contra os limites (thresholds).
-                if b['value'] >= INSIDER_TRIGGER:
-                    self.save_whale(b, is_insider=True)
-                elif b['value'] >= STREAM_MIN_SIZE:
-                    self.save_whale(b, is_insider=False)
-                removals.append(key)
-
-        for k in removals:
-            del self.ladder_buckets[k]
+        with LADDER_SECONDS.time():
+            self.pipeline.tick()
+
+    def shutdown(self):
+        """Libera os recursos do motor, gravando o que ainda estiver na fila."""
+        self.markets.close()
+        self.archive.close()
+        self.downsampler.close()
+        self.ladder_buckets.close()
+        self.enricher.close()
+        self.clusters.close()
+        if self.scorer is not None:
+            self.scorer.close()
+        self.writer.close()
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+        self.cursor.close()
+        self.api.close()
+        self.intel_cache.close()
+        print(f">> [Sistema] Cache Intel: {self.intel_cache.stats}")
+        if self.tape is not None:
+            self.tape.close()
+            print(f">> [Sistema] Fita bruta: {self.tape.report()}")
+        self.stop_instrumentation()
+
+    def fetch_trades_page(self, limit, offset):
+        """Uma página do /trades, do trade mais novo para o mais antigo."""
+        return self.api.get_json("data", "trades", "/trades", params={"limit": limit, "offset": offset})
+
+    def cycle_error(self, e):
+        """Conta e reporta a falha de um ciclo de varredura (o motor segue rodando)."""
+        if isinstance(e, requests.RequestException):
+            category = "cycle_api"
+        elif isinstance(e, sqlite3.Error):
+            category = "cycle_db"
+        else:
+            category = "cycle"
+        metrics.error(category)
+        print(f"\n!! [Erro] Falha no ciclo de varredura ({category}): {e}")
 
     def watch(self):
         """Loop principal de eventos para monitoramento do mercado em tempo real."""
-        print(f">> MOTOR SENTINEL ONLINE (Taxa de Atualização: 15s)")
+        print(f">> MOTOR SENTINEL ONLINE (Taxa de Atualização: adaptativa {POLL_MIN_INTERVAL:.0f}-{POLL_MAX_INTERVAL:.0f}s)")
         print(f">> Limite Stream: >${STREAM_MIN_SIZE} | Limite Forense: >${INSIDER_MIN_SIZE}")
 
-        self.last_seen_ts = int(time.time())
+        if self.cursor.last_ts is None:
+            self.cursor.start_at(int(time.time()))
+        else:
+            print(f">> [Sistema] Retomando ingestão a partir do cursor {datetime.fromtimestamp(self.cursor.last_ts)}")
+
+        # Buckets restaurados do snapshot voltam a apontar para o market_cache já mapeado
+        self.ladder_buckets.resolve_markets()
+        self.archive.start()
+        self.downsampler.start()
+        last_snapshot = time.time()
 
         while True:
             self.process_ladders()
             active = len(self.ladder_buckets)
-            print(f"\rEscaneando... | Agregações Ativas: {active}   ", end="", flush=True)
+            hit_rate = self.intel_cache.hit_rate() * 100
+            st = self.pager.stats
+            print(f"\rEscaneando... | Mercados: {len(self.politics_ids)} | Agregações Ativas: {active} | Cache Intel: {hit_rate:.0f}% hits "
+                  f"| Trades: {st['new']} novos / {st['deduped']} dup / {st['dropped']} desc. "
+                  f"| Intervalo: {self.poller.interval:.0f}s   ", end="", flush=True)
 
             try:
-                trades = requests.get(f"{DATA_API}/trades?limit=50", timeout=10).json()
-                trades.reverse()  # Processar do mais antigo para o mais novo
-
-                new_max_ts = self.last_seen_ts
-
-                for t in trades:
-                    ts = int(t['timestamp'])
-                    if ts <= self.last_seen_ts: continue
-                    if ts > new_max_ts: new_max_ts = ts
-
-                    usd = float(t['size']) * float(t['price'])
-                    if usd < STREAM_NOISE_FLOOR: continue
-
-                    cid = t.get('conditionId')
-                    if cid not in self.politics_ids: continue
-
-                    wallet = t.get('proxyWallet') or t.get('taker')
-                    side = f"{t['side']} {t['outcome']}"
-                    key = f"{wallet}_{cid}_{side}"
-
-                    # --- LÓGICA DE DUPLO PIPELINE ---
-
-                    # 1. PIPELINE STREAM (Instantâneo > $20)
-                    # Ingestão direta para feedback visual, ignorando a lógica de agregação
-                    if usd >= STREAM_MIN_SIZE and usd < ACCUMULATION_FLOOR:
-                        md = self.market_cache.get(cid, {})
-                        temp_b = {
-                            "wallet": wallet,
-                            "question": md.get("q", "..."),
-                            "category": md.get("c", "Politics"),
-                            "link": md.get("url", "#"),
-                            "position": side,
-                            "value": usd,
-                            "last_ts": ts
-                        }
-                        self.save_whale(temp_b, is_insider=False)
-                        continue
-
-                    # 2. PIPELINE INSIDER (Acumulação > $500)
-                    # Agregação em bucket para detectar ordens fracionadas (split orders)
-                    if usd >= ACCUMULATION_FLOOR:
-                        if key not in self.ladder_buckets:
-                            md = self.market_cache.get(cid, {})
-                            self.ladder_buckets[key] = {
-                                "wallet": wallet,
-                                "question": md.get("q"),
-                                "category": md.get("c"),
-                                "link": md.get("url"),
-                                "position": side,
-                                "value": 0,
-                                "last_ts": ts
-                            }
-
-                        b = self.ladder_buckets[key]
-                        b['value'] += usd
-                        b['last_ts'] = ts
-
-                        # GATILHO DE LIMITE CRÍTICO
-                        if b['value'] >= CRITICAL_TRIGGER:
-                            self.save_whale(b, is_insider=True)
-                            del self.ladder_buckets[key]
-
-                self.last_seen_ts = new_max_ts
-                time.sleep(15)
+                with POLL_SECONDS.time():
+                    fresh, pages = self.pager.fetch_new(self.cursor)
+                TRADES_PER_CYCLE.observe(len(fresh))
+                if self.tape is not None:
+                    # Todos os trades novos, antes de qualquer filtro (mercado, poeira)
+                    self.tape.record(t for _, _, t in fresh)
+
+                for key, ts, t in fresh:
+                    try:
+                        self.pipeline.ingest(t, ts)
+                    except (KeyError, TypeError, ValueError):
+                        self.pager.stats["dropped"] += 1
+                    # Trade já aplicado ao motor (buckets, clusters, linhas de base): nunca é reprocessado
+                    self.cursor.mark(key, ts)
+
+                # Uma transação por ciclo de varredura. Lotes descartados vão para o arquivo de mensagens
+                # mortas; com um lote de volta na fila (banco ocupado), o cursor espera a próxima gravação
+                if self.writer.flush():
+                    self.cursor.save()
+                if time.time() - last_snapshot >= LADDER_SNAPSHOT_INTERVAL:
+                    self.ladder_buckets.save()
+                    self.clusters.save()
+                    if self.scorer is not None:
+                        self.scorer.save()
+                    last_snapshot = time.time()
+                time.sleep(self.poller.update(len(fresh), pages, TRADES_PAGE_SIZE))
 
             except KeyboardInterrupt:
                 print("\n>> Encerrando Motor Sentinel...")
                 break
             except Exception as e:
                 # Logar erro mas manter o motor rodando
-                # print(f"Erro: {e}")
-                time.sleep(15)
+                self.cycle_error(e)
+                time.sleep(self.poller.interval)
 
 
 if __name__ == "__main__":
     bot = WhaleSentinel()
     bot.map_markets()
-    bot.watch()
\ No newline at end of file
+    try:
+        bot.watch()
+    finally:
+        bot.shutdown()
\ No newline at end of file
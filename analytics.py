@@ -0,0 +1,398 @@
+"""
+Análises em lote do histórico de apostas (bets / intel_bets) com NumPy.
+
+O histórico é lido em chunks de `chunk_rows` linhas, ordenado por
+(whale_address, timestamp), e convertido em colunas NumPy (códigos
+inteiros para textos). Todas as métricas são agregações vetorizadas
+(bincount, unique, lexsort, produto de matrizes) acumuladas entre chunks.
+Como a leitura é ordenada por carteira, os pares carteira×mercado de uma
+carteira só ficam em memória até a carteira terminar: o consumo depende do
+chunk e do número de carteiras/mercados, não do número de linhas.
+
+Resultados (substituídos a cada execução, no banco de origem):
+    analytics_wallets     exposição por carteira (bruta, líquida direcional,
+                          hedge), concentração, intervalos entre apostas
+    analytics_markets     viés Sim/Não por mercado
+    analytics_comovement  pares de carteiras (top por volume) que apostam na
+                          mesma direção nos mesmos mercados
+
+Uso:
+    python analytics.py                       # bets e intel_bets
+    python analytics.py --source bets --chunk-rows 500000 --top-wallets 2000
+"""
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+
+import partitions
+
+DB_MAIN = "whale_hunter.db"
+DB_INSIDER = "insider_intel.db"
+
+SOURCES = {
+    "bets": DB_MAIN,
+    "intel_bets": DB_INSIDER,
+}
+
+CHUNK_ROWS = 250_000
+TOP_WALLETS = 1000  # Carteiras (por volume) consideradas no co-movimento
+MIN_SHARED_MARKETS = 3
+MAX_PAIRS = 5000
+
+# Limites (s) dos intervalos entre apostas consecutivas da mesma carteira
+GAP_EDGES = np.array([60, 600, 3600, 86400])
+GAP_LABELS = ("gaps_1m", "gaps_10m", "gaps_1h", "gaps_1d", "gaps_long")
+BURST_GAP = 600  # Intervalos abaixo disto contam como rajada
+
+# NOT INDEXED: o sorter do SQLite lê a tabela sequencialmente (com spill em disco),
+# bem mais rápido que seguir idx_bets_whale_ts com um acesso aleatório por linha
+HISTORY_SQL = """SELECT whale_address, timestamp, market_question, position, size_usd
+                 FROM {table} NOT INDEXED
+                 WHERE whale_address IS NOT NULL
+                 ORDER BY whale_address, timestamp"""
+
+
+class Vocab:
+    """Dicionário texto -> código inteiro, estável entre chunks."""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, column):
+        new = set(column).difference(self.index)
+        for v in sorted(new, key=lambda x: (x is None, x or "")):
+            self.index[v] = len(self.values)
+            self.values.append(v)
+        return np.fromiter(map(self.index.__getitem__, column), dtype=np.int64, count=len(column))
+
+
+class Accumulator:
+    """Colunas numéricas indexadas por código, crescendo conforme o vocabulário."""
+
+    def __init__(self, fill=0.0, dtype=np.float64, width=None):
+        self.fill = fill
+        self.dtype = dtype
+        self.width = width
+        self.data = self._new(0)
+
+    def _new(self, n):
+        shape = (n,) if self.width is None else (n, self.width)
+        return np.full(shape, self.fill, dtype=self.dtype)
+
+    def reserve(self, n):
+        if n > len(self.data):
+            grown = self._new(max(n, int(len(self.data) * 1.5)))
+            grown[:len(self.data)] = self.data
+            self.data = grown
+
+    def add(self, codes, weights=None, size=None):
+        size = size if size is not None else (int(codes.max()) + 1 if len(codes) else 0)
+        self.reserve(size)
+        self.data[:size] += np.bincount(codes, weights=weights, minlength=size)[:size]
+
+    def view(self, n):
+        self.reserve(n)
+        return self.data[:n]
+
+
+def position_signs(positions):
+    """Direção em relação ao 'Sim': BUY Yes/SELL No = +1, BUY No/SELL Yes = -1, outros = 0."""
+    signs = np.zeros(len(positions), dtype=np.int8)
+    for i, p in enumerate(positions):
+        side, _, outcome = (p or "").partition(" ")
+        outcome = outcome.strip().lower()
+        if outcome in ("yes", "no"):
+            direction = 1 if outcome == "yes" else -1
+            signs[i] = direction if side.upper() == "BUY" else -direction
+    return signs
+
+
+class HistoryAnalyzer:
+    """Acumula as métricas de uma tabela de apostas, chunk a chunk."""
+
+    def __init__(self):
+        self.wallets = Vocab()
+        self.markets = Vocab()
+        self.positions = Vocab()
+        self.rows = 0
+
+        # Por carteira
+        self.w_bets = Accumulator(dtype=np.int64, fill=0)
+        self.w_gross = Accumulator()
+        self.w_net_abs = Accumulator()
+        self.w_markets = Accumulator(dtype=np.int64, fill=0)
+        self.w_top_market = Accumulator(dtype=np.int64, fill=-1)
+        self.w_top_gross = Accumulator()
+        self.w_first = Accumulator(dtype=np.int64, fill=np.iinfo(np.int64).max)
+        self.w_last = Accumulator(dtype=np.int64, fill=np.iinfo(np.int64).min)
+        self.w_gaps = Accumulator(dtype=np.int64, fill=0, width=len(GAP_LABELS))
+
+        # Por mercado
+        self.m_bets = Accumulator(dtype=np.int64, fill=0)
+        self.m_volume = Accumulator()
+        self.m_yes = Accumulator()
+        self.m_no = Accumulator()
+        self.m_wallets = Accumulator(dtype=np.int64, fill=0)
+
+        # Pares carteira×mercado da última carteira do chunk (ainda incompleta)
+        self._carry_keys = np.empty(0, dtype=np.int64)
+        self._carry_gross = np.empty(0)
+        self._carry_net = np.empty(0)
+        self._carry_wallet = -1
+        self._carry_ts = 0
+
+    def add_chunk(self, wallets, timestamps, markets, positions, sizes):
+        n = len(wallets)
+        if not n:
+            return
+        self.rows += n
+        w = self.wallets.encode(wallets)
+        m = self.markets.encode(markets)
+        p = self.positions.encode(positions)
+        ts = np.asarray(timestamps, dtype=np.int64)
+        size = np.asarray(sizes, dtype=np.float64)
+        sign = position_signs(self.positions.values)[p]
+        nw, nm = len(self.wallets), len(self.markets)
+
+        # --- CARTEIRAS: contagens, volume, primeira/última aposta ---
+        self.w_bets.add(w, size=nw)
+        self.w_gross.add(w, size, size=nw)
+        starts = np.flatnonzero(np.r_[True, w[1:] != w[:-1]])
+        ends = np.r_[starts[1:] - 1, n - 1]
+        seg = w[starts]
+        first, last = self.w_first.view(nw), self.w_last.view(nw)
+        first[seg] = np.minimum(first[seg], ts[starts])
+        last[seg] = np.maximum(last[seg], ts[ends])
+
+        # --- INTERVALOS ENTRE APOSTAS (mesma carteira, ordem temporal) ---
+        prev_w = np.r_[self._carry_wallet, w[:-1]]
+        prev_ts = np.r_[self._carry_ts, ts[:-1]]
+        same = prev_w == w
+        gaps = (ts - prev_ts)[same]
+        bins = np.digitize(gaps, GAP_EDGES)
+        gap_counts = np.bincount(w[same] * len(GAP_LABELS) + bins, minlength=nw * len(GAP_LABELS))
+        self.w_gaps.view(nw)[:] += gap_counts[:nw * len(GAP_LABELS)].reshape(nw, len(GAP_LABELS))
+        self._carry_wallet, self._carry_ts = int(w[-1]), int(ts[-1])
+
+        # --- MERCADOS: volume e viés Sim/Não ---
+        self.m_bets.add(m, size=nm)
+        self.m_volume.add(m, size, size=nm)
+        self.m_yes.add(m, np.where(sign > 0, size, 0.0), size=nm)
+        self.m_no.add(m, np.where(sign < 0, size, 0.0), size=nm)
+
+        # --- PARES CARTEIRA×MERCADO ---
+        keys = np.concatenate([self._carry_keys, (w << 32) | m])
+        gross = np.concatenate([self._carry_gross, size])
+        net = np.concatenate([self._carry_net, size * sign])
+        uk, inv = np.unique(keys, return_inverse=True)
+        pair_gross = np.bincount(inv, weights=gross, minlength=len(uk))
+        pair_net = np.bincount(inv, weights=net, minlength=len(uk))
+
+        # A última carteira pode continuar no próximo chunk: seus pares ficam pendentes
+        pair_w = uk >> 32
+        pending = pair_w == self._carry_wallet
+        self._carry_keys = uk[pending]
+        self._carry_gross = pair_gross[pending]
+        self._carry_net = pair_net[pending]
+        done = ~pending
+        self._finalize_pairs(uk[done], pair_gross[done], pair_net[done])
+
+    def _finalize_pairs(self, keys, gross, net):
+        """Pares completos (a carteira não aparece mais): concentração, exposição líquida, carteiras por mercado."""
+        if not len(keys):
+            return
+        nw, nm = len(self.wallets), len(self.markets)
+        pw = keys >> 32
+        pm = keys & 0xFFFFFFFF
+
+        self.w_markets.add(pw, size=nw)
+        self.w_net_abs.add(pw, np.abs(net), size=nw)
+        self.m_wallets.add(pm, size=nm)
+
+        # Mercado principal de cada carteira: maior volume bruto
+        order = np.lexsort((-gross, pw))
+        heads = order[np.r_[True, pw[order][1:] != pw[order][:-1]]]
+        self.w_top_market.view(nw)[pw[heads]] = pm[heads]
+        self.w_top_gross.view(nw)[pw[heads]] = gross[heads]
+
+    def finish(self):
+        self._finalize_pairs(self._carry_keys, self._carry_gross, self._carry_net)
+        self._carry_keys = np.empty(0, dtype=np.int64)
+        self._carry_gross = self._carry_net = np.empty(0)
+
+    # --- RESULTADOS ---
+
+    def wallet_rows(self):
+        nw = len(self.wallets)
+        gross = self.w_gross.view(nw)
+        net_abs = self.w_net_abs.view(nw)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            hedge = np.where(gross > 0, 1 - net_abs / gross, 0.0)
+            top_share = np.where(gross > 0, self.w_top_gross.view(nw) / gross, 0.0)
+        gaps = self.w_gaps.view(nw)
+        total_gaps = gaps.sum(axis=1)
+        burst = gaps[:, :int(np.searchsorted(GAP_EDGES, BURST_GAP)) + 1].sum(axis=1)
+        burst_ratio = np.where(total_gaps > 0, burst / np.maximum(total_gaps, 1), 0.0)
+        top = self.w_top_market.view(nw)
+        markets = self.markets.values
+
+        columns = (self.w_bets.view(nw).tolist(), gross.round(2).tolist(), net_abs.round(2).tolist(),
+                   hedge.round(4).tolist(), self.w_markets.view(nw).tolist(),
+                   [markets[i] if i >= 0 else None for i in top.tolist()], top_share.round(4).tolist(),
+                   self.w_first.view(nw).tolist(), self.w_last.view(nw).tolist(),
+                   *(gaps[:, i].tolist() for i in range(len(GAP_LABELS))), burst_ratio.round(4).tolist())
+        return list(zip(self.wallets.values, *columns))
+
+    def market_rows(self):
+        nm = len(self.markets)
+        yes, no = self.m_yes.view(nm), self.m_no.view(nm)
+        directional = yes + no
+        skew = np.where(directional > 0, (yes - no) / np.maximum(directional, 1e-12), 0.0)
+        return list(zip(self.markets.values, self.m_bets.view(nm).tolist(), self.m_wallets.view(nm).tolist(),
+                        self.m_volume.view(nm).round(2).tolist(), yes.round(2).tolist(), no.round(2).tolist(),
+                        skew.round(4).tolist()))
+
+    def top_wallets(self, k):
+        nw = len(self.wallets)
+        gross = self.w_gross.view(nw)
+        idx = np.argsort(-gross, kind="stable")[:k]
+        return [self.wallets.values[i] for i in idx]
+
+
+def read_chunks(conn, sql, params=(), chunk_rows=CHUNK_ROWS):
+    """Executa `sql` e devolve as linhas em blocos de colunas (tuplas transpostas)."""
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield list(zip(*rows))
+
+
+def comovement(conn, table, wallets, min_shared=MIN_SHARED_MARKETS, max_pairs=MAX_PAIRS, chunk_rows=CHUNK_ROWS):
+    """
+    Pares de carteiras que apostam na mesma direção nos mesmos mercados.
+
+    Monta a matriz de sinais carteira×mercado (apenas as `wallets` dadas e
+    mercados com ao menos duas delas) e obtém as contagens de mercados
+    compartilhados e concordantes por produto de matrizes.
+    """
+    if len(wallets) < 2:
+        return []
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _analytics_top (address TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM _analytics_top")
+    conn.executemany("INSERT OR IGNORE INTO _analytics_top (address) VALUES (?)", [(w,) for w in wallets])
+
+    wallet_code = {w: i for i, w in enumerate(wallets)}
+    markets = Vocab()
+    positions = Vocab()
+    keys, nets = [], []
+    sql = f"""SELECT whale_address, market_question, position, size_usd FROM {table}
+              WHERE whale_address IN (SELECT address FROM _analytics_top)"""
+    for w_col, m_col, p_col, s_col in read_chunks(conn, sql, chunk_rows=chunk_rows):
+        w = np.fromiter(map(wallet_code.__getitem__, w_col), dtype=np.int64, count=len(w_col))
+        m = markets.encode(m_col)
+        p = positions.encode(p_col)
+        sign = position_signs(positions.values)[p]
+        key = (w << 32) | m
+        uk, inv = np.unique(key, return_inverse=True)
+        keys.append(uk)
+        nets.append(np.bincount(inv, weights=np.asarray(s_col, dtype=np.float64) * sign, minlength=len(uk)))
+    if not keys:
+        return []
+
+    uk, inv = np.unique(np.concatenate(keys), return_inverse=True)
+    net = np.bincount(inv, weights=np.concatenate(nets), minlength=len(uk))
+    direction = np.sign(net)
+    keep = direction != 0
+    pw, pm, direction = (uk >> 32)[keep], (uk & 0xFFFFFFFF)[keep], direction[keep]
+
+    # Apenas mercados com duas ou mais carteiras contribuem para pares
+    counts = np.bincount(pm, minlength=len(markets))
+    useful = counts[pm] >= 2
+    pw, pm, direction = pw[useful], pm[useful], direction[useful]
+    if not len(pw):
+        return []
+    market_ids, col = np.unique(pm, return_inverse=True)
+
+    k = len(wallets)
+    yes = np.zeros((k, len(market_ids)), dtype=np.float32)
+    no = np.zeros_like(yes)
+    yes[pw[direction > 0], col[direction > 0]] = 1
+    no[pw[direction < 0], col[direction < 0]] = 1
+    both = yes + no
+
+    shared = both @ both.T
+    same = yes @ yes.T + no @ no.T
+    iu, ju = np.triu_indices(k, 1)
+    s, c = shared[iu, ju], same[iu, ju]
+    mask = s >= min_shared
+    iu, ju, s, c = iu[mask], ju[mask], s[mask], c[mask]
+    score = (2 * c - s) / s  # +1 sempre juntas, -1 sempre opostas
+    order = np.lexsort((-score, -c))[:max_pairs]
+    return [(wallets[iu[i]], wallets[ju[i]], int(s[i]), int(c[i]), round(float(score[i]), 4)) for i in order]
+
+
+def analyze(db_path, table, chunk_rows=CHUNK_ROWS, top_wallets=TOP_WALLETS):
+    """Executa todas as métricas de `table` e grava as tabelas analytics_* do mesmo banco."""
+    started = time.time()
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    conn.execute("PRAGMA journal_mode=WAL;")
+
+    # `bets` só guarda a janela quente: o histórico inclui as partições arquivadas
+    aliases = partitions.attach_history(conn) if table == "bets" else []
+    source = "bets_history" if table == "bets" else table
+
+    analyzer = HistoryAnalyzer()
+    for w, ts, m, p, s in read_chunks(conn, HISTORY_SQL.format(table=source), chunk_rows=chunk_rows):
+        analyzer.add_chunk(w, ts, m, p, s)
+    analyzer.finish()
+
+    wallets = analyzer.wallet_rows()
+    markets = analyzer.market_rows()
+    pairs = comovement(conn, source, analyzer.top_wallets(top_wallets), chunk_rows=chunk_rows)
+
+    with conn:
+        conn.execute("DELETE FROM analytics_wallets")
+        conn.executemany(f"""INSERT INTO analytics_wallets (address, bets, gross, net_exposure, hedge_ratio, markets,
+                             top_market, top_share, first_ts, last_ts, {', '.join(GAP_LABELS)}, burst_ratio)
+                             VALUES ({', '.join('?' * (11 + len(GAP_LABELS)))})""", wallets)
+        conn.execute("DELETE FROM analytics_markets")
+        conn.executemany("""INSERT INTO analytics_markets (market_question, bets, wallets, volume, yes_volume, no_volume, skew)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)""", markets)
+        conn.execute("DELETE FROM analytics_comovement")
+        conn.executemany("""INSERT INTO analytics_comovement (wallet_a, wallet_b, shared_markets, same_direction, score)
+                            VALUES (?, ?, ?, ?, ?)""", pairs)
+        conn.execute("INSERT INTO analytics_runs (source, started_ts, rows, elapsed) VALUES (?, ?, ?, ?)",
+                     (table, int(started), analyzer.rows, round(time.time() - started, 3)))
+    partitions.detach_history(conn, aliases)
+    conn.close()
+    return {"source": table, "rows": analyzer.rows, "wallets": len(wallets), "markets": len(markets),
+            "pairs": len(pairs), "elapsed": round(time.time() - started, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Análises vetorizadas do histórico de apostas.")
+    parser.add_argument("--source", choices=["all"] + list(SOURCES), default="all")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Linhas por chunk (limita a memória)")
+    parser.add_argument("--top-wallets", type=int, default=TOP_WALLETS, help="Carteiras avaliadas no co-movimento")
+    args = parser.parse_args()
+
+    import schema
+    schema.migrate_all(DB_MAIN, DB_INSIDER)
+
+    tables = list(SOURCES) if args.source == "all" else [args.source]
+    for table in tables:
+        result = analyze(SOURCES[table], table, chunk_rows=args.chunk_rows, top_wallets=args.top_wallets)
+        print(f">> [Analytics] {table}: {result['rows']:,} apostas | {result['wallets']:,} carteiras | "
+              f"{result['markets']:,} mercados | {result['pairs']:,} pares | {result['elapsed']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Backfill histórico: recupera os trades de um intervalo de tempo que o loop ao
+vivo não viu (scanner fora do ar, lacunas de paginação, instalação nova) e os
+classifica pelo mesmo motor do scanner.
+
+Uso:
+    python backfill.py --hours 6                         # últimas 6 horas
+    python backfill.py --since 2026-10-01 --until 2026-10-03T12:00
+    python backfill.py --since 2026-10-01 --markets 0xabc... 0xdef...
+    DATA_API=http://127.0.0.1:8765 python backfill.py --hours 24 --db /tmp/bf   # contra benchmarks/stub_api.py
+
+Cada mercado monitorado é paginado no /trades da Data API (do mais novo para o
+mais antigo, `market=<conditionId>`) por um pool de threads, sob o mesmo
+ApiLimiter (semáforo + token bucket) do scanner. Os trades de cada mercado
+passam em ordem cronológica pelo replay() (DualPipeline + buckets + clusters +
+gatilhos adaptativos, com relógio virtual) e vão ao banco pelo BetWriter em lotes
+grandes, sem eventos no feed ao vivo.
+
+Nada é ingerido duas vezes: só os trechos fora de `ingest_coverage` (gravada
+pelo cursor ao vivo e pelos backfills anteriores) são buscados, e trades cujo
+transactionHash já está em `bets` são descartados. A cobertura de um mercado é
+gravada assim que seus trades são gravados, então uma execução interrompida é
+retomada do primeiro mercado pendente (um mercado interrompido no meio é
+repaginado desde o início).
+
+Em uma instalação nova (`bets` vazia), os índices secundários de `bets` e
+`intel_bets` são removidos durante a carga e recriados no final; se o processo
+morrer antes, a próxima execução os recria.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import requests
+
+import schema
+from enrichment import ApiLimiter
+from http_client import ApiClient
+from ingest import add_coverage, trade_key, uncovered
+from market_registry import MarketRegistry
+from replay import DBSink, VirtualClock, load_markets, make_clusters, make_scorer, replay
+
+DEFERRED_TABLES = {"main": "bets", "insider": "intel_bets"}  # Índices secundários adiados em cargas iniciais
+FETCH_RETRIES = 4  # Tentativas por página antes de desistir do mercado (backoff exponencial)
+
+
+def parse_time(text):
+    """Timestamp Unix ou data ISO (2026-10-01, 2026-10-01T12:00) no fuso local."""
+    try:
+        return int(float(text))
+    except ValueError:
+        return int(datetime.fromisoformat(text).timestamp())
+
+
+# --- ÍNDICES ADIADOS ---
+
+def defer_indexes(conns):
+    """Remove os índices secundários das tabelas de apostas, guardando o SQL para recriá-los."""
+    main = conns["main"]
+    for db, conn in conns.items():
+        rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                            (DEFERRED_TABLES[db],)).fetchall()
+        main.executemany("INSERT OR REPLACE INTO backfill_deferred_indexes (db, name, sql) VALUES (?, ?, ?)",
+                         [(db, name, sql) for name, sql in rows])
+        main.commit()
+        for name, _ in rows:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.commit()
+        if rows:
+            print(f">> [Backfill] Índices adiados ({db}): {', '.join(name for name, _ in rows)}")
+
+
+def restore_indexes(conns):
+    """Recria os índices adiados (desta execução ou de uma execução interrompida)."""
+    main = conns["main"]
+    for db, name, sql in main.execute("SELECT db, name, sql FROM backfill_deferred_indexes").fetchall():
+        conn = conns[db]
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone()
+        if not exists:
+            started = time.perf_counter()
+            conn.execute(sql)
+            conn.commit()
+            print(f">> [Backfill] Índice {name} recriado em {time.perf_counter() - started:.1f}s")
+        main.execute("DELETE FROM backfill_deferred_indexes WHERE db = ? AND name = ?", (db, name))
+        main.commit()
+
+
+# --- BACKFILL ---
+
+class Backfill:
+    """
+    Uma execução de backfill sobre [start, end] para `cids`.
+
+    `fetch_page(cid, limit, offset)` retorna uma página do /trades do mercado em
+    ordem decrescente de timestamp. `max_offset` é o teto de paginação da API:
+    um mercado com mais trades no intervalo fica coberto só até onde foi lido.
+    """
+
+    def __init__(self, db_main, db_insider, start, end, cids, markets, thresholds, fetch_page,
+                 workers=4, page_size=500, max_offset=10000, scorer=None, clusters=None, defer=None):
+        self.db_main = db_main
+        self.db_insider = db_insider
+        self.start = start
+        self.end = end
+        self.cids = list(cids)
+        self.markets = markets
+        self.thresholds = thresholds
+        self.fetch_page = fetch_page
+        self.workers = workers
+        self.page_size = page_size
+        self.max_offset = max_offset
+        self.scorer = scorer
+        self.clusters = clusters  # Um índice para todos os mercados: ligações entre carteiras valem entre eles
+        self.defer = defer  # None = automático (só com `bets` vazia)
+        self.known_tx = set()
+        self._lock = threading.Lock()  # Contadores atualizados pelas threads de paginação
+        self.stats = {"markets": 0, "skipped": 0, "failed": 0, "truncated": 0, "pages": 0, "fetched": 0,
+                      "covered": 0, "duplicate": 0, "ingested": 0, "insider": 0, "critical": 0,
+                      "cluster": 0}
+
+    def fetch_market(self, cid, holes):
+        """
+        Pagina o mercado até passar do início do trecho mais antigo. Retorna
+        (trades [(ts, trade)] em ordem cronológica, timestamp mais antigo lido, truncado).
+        """
+        lo = holes[0][0]
+        trades, seen = [], set()
+        oldest = None
+        offset = 0
+        while True:
+            page = self._fetch(cid, offset)
+            covered = duplicate = 0
+            for t in page:
+                try:
+                    ts = int(t['timestamp'])
+                    key = trade_key(t)
+                except (KeyError, TypeError, ValueError):
+                    continue
+                oldest = ts if oldest is None else min(oldest, ts)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if ts < self.start or ts > self.end:
+                    continue
+                if not any(s <= ts <= e for s, e in holes):
+                    covered += 1
+                elif t.get('transactionHash') in self.known_tx:
+                    duplicate += 1
+                else:
+                    trades.append((ts, t))
+            with self._lock:
+                self.stats["pages"] += 1
+                self.stats["fetched"] += len(page)
+                self.stats["covered"] += covered
+                self.stats["duplicate"] += duplicate
+            offset += len(page)
+            if len(page) < self.page_size or (oldest is not None and oldest < lo):
+                truncated = False
+                break
+            if offset >= self.max_offset:
+                truncated = True
+                break
+        trades.sort(key=lambda item: item[0])
+        return trades, oldest, truncated
+
+    def _fetch(self, cid, offset):
+        for attempt in range(FETCH_RETRIES):
+            try:
+                return self.fetch_page(cid, self.page_size, offset)
+            except (requests.RequestException, ValueError) as e:
+                if attempt == FETCH_RETRIES - 1:
+                    raise
+                wait = 2 ** attempt
+                print(f"\n!! [Aviso] {cid[:12]}… offset {offset}: {e} (nova tentativa em {wait}s)")
+                time.sleep(wait)
+
+    def run(self):
+        schema.migrate_all(self.db_main, self.db_insider)
+        conns = {"main": sqlite3.connect(self.db_main, timeout=30.0),
+                 "insider": sqlite3.connect(self.db_insider, timeout=30.0)}
+        conn = conns["main"]
+        restore_indexes(conns)  # Sobra de uma execução interrompida
+
+        pending = {}
+        for cid in self.cids:
+            holes = uncovered(conn, cid, self.start, self.end)
+            if holes:
+                pending[cid] = holes
+            else:
+                self.stats["skipped"] += 1
+        print(f">> [Backfill] {datetime.fromtimestamp(self.start)} → {datetime.fromtimestamp(self.end)}: "
+              f"{len(pending)} mercados pendentes, {self.stats['skipped']} já cobertos")
+        if not pending:
+            return self.stats
+
+        self.known_tx = {tx for (tx,) in conn.execute(
+            "SELECT tx_hash FROM bets WHERE timestamp BETWEEN ? AND ? AND tx_hash IS NOT NULL", (self.start, self.end))}
+        defer = self.defer
+        if defer is None:
+            defer = conn.execute("SELECT 1 FROM bets LIMIT 1").fetchone() is None
+        if defer:
+            defer_indexes(conns)
+
+        clock = VirtualClock()
+        # Lotes grandes: uma transação a cada 5000 apostas, sem eventos no feed ao vivo
+        sink = DBSink(self.db_main, self.db_insider, clock, source="Backfill", max_rows=5000, live_events=False)
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backfill") as pool:
+                futures = {pool.submit(self.fetch_market, cid, holes): cid for cid, holes in pending.items()}
+                for done, future in enumerate(as_completed(futures), 1):
+                    cid = futures[future]
+                    try:
+                        trades, oldest, truncated = future.result()
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        print(f"\n!! [Erro] Backfill de {cid} falhou: {e}")
+                        continue
+                    # Só a thread principal classifica e grava: o motor não é thread-safe
+                    result = replay(trades, self.thresholds, self.markets, self.markets.keys(), sink=sink,
+                                    clock=clock, scorer=self.scorer, clusters=self.clusters, close_sink=False)
+                    sink.writer.flush()
+                    self.record(conn, cid, pending[cid], oldest, truncated)
+                    st = result["stats"]
+                    self.stats["markets"] += 1
+                    self.stats["ingested"] += len(trades)
+                    self.stats["insider"] += st["settled_insider"]
+                    self.stats["critical"] += st["critical"]
+                    self.stats["cluster"] += st["cluster"]
+                    rate = self.stats["fetched"] / max(time.perf_counter() - started, 1e-9)
+                    print(f"\r>> [Backfill] {done}/{len(pending)} mercados | {self.stats['ingested']} trades novos "
+                          f"| {self.stats['covered'] + self.stats['duplicate']} já ingeridos | {rate:,.0f} trades/s   ",
+                          end="", flush=True)
+        finally:
+            print()
+            sink.close()
+            restore_indexes(conns)
+            for c in conns.values():
+                c.close()
+        print(f">> [Backfill] Concluído em {time.perf_counter() - started:.1f}s: {self.stats}")
+        return self.stats
+
+    def record(self, conn, cid, holes, oldest, truncated):
+        """Marca como coberto o que foi lido do mercado (o checkpoint da retomada)."""
+        if truncated:
+            self.stats["truncated"] += 1
+            print(f"\n!! [Aviso] {cid}: teto de paginação ({self.max_offset}) antes de "
+                  f"{datetime.fromtimestamp(holes[0][0])}; coberto a partir de {datetime.fromtimestamp(oldest + 1)}")
+        for s, e in holes:
+            if truncated:
+                s = max(s, oldest + 1)  # O segundo do mais antigo pode ter sido cortado pela página
+            add_coverage(conn, s, e, cid=cid, source="backfill")
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    window = parser.add_mutually_exclusive_group(required=True)
+    window.add_argument("--since", type=parse_time, help="Início (timestamp Unix ou data ISO)")
+    window.add_argument("--hours", type=float, help="Últimas N horas")
+    parser.add_argument("--until", type=parse_time, help="Fim (padrão: agora)")
+    parser.add_argument("--markets", nargs="+", help="conditionIds (padrão: mercados monitorados do registro)")
+    parser.add_argument("--workers", type=int, default=4, help="Mercados paginados em paralelo")
+    parser.add_argument("--rate", type=float, help="Requisições/s à Data API (padrão: o limite do scanner)")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--max-offset", type=int, default=10000, help="Teto de paginação por mercado da Data API")
+    parser.add_argument("--db", help="Diretório dos bancos (padrão: os do scanner)")
+    defer = parser.add_mutually_exclusive_group()
+    defer.add_argument("--defer-indexes", dest="defer", action="store_true", default=None,
+                       help="Adia os índices mesmo com apostas já gravadas")
+    defer.add_argument("--no-defer-indexes", dest="defer", action="store_false")
+    args = parser.parse_args()
+
+    from PolyInsideScanner import (
+        ANOMALY_SCORING, ANOMALY_SETTINGS, API_BREAKERS, API_ENDPOINTS, API_HOSTS, API_LIMITS, CLUSTER_SETTINGS,
+        DB_INSIDER, DB_MAIN, MARKET_PAGE_SIZE, MARKET_TAGS, THRESHOLDS,
+    )
+    db_main, db_insider = DB_MAIN, DB_INSIDER
+    if args.db:
+        os.makedirs(args.db, exist_ok=True)
+        db_main, db_insider = os.path.join(args.db, DB_MAIN), os.path.join(args.db, DB_INSIDER)
+    end = args.until or int(time.time())
+    start = args.since if args.since is not None else int(end - args.hours * 3600)
+    if start >= end:
+        raise SystemExit("!! [Erro] Intervalo vazio: --since deve ser anterior a --until")
+
+    # Limitador e pools keep-alive compartilhados por todas as threads de paginação
+    limiter = ApiLimiter(dict(API_LIMITS, data=(args.workers, args.rate or API_LIMITS["data"][1])))
+    api = ApiClient(API_HOSTS, API_ENDPOINTS, breakers=API_BREAKERS, limiter=limiter, pool_size=args.workers)
+
+    def fetch_trades_page(cid, limit, offset):
+        return api.get_json("data", "trades", "/trades", params={"market": cid, "limit": limit, "offset": offset})
+
+    def fetch_events_page(params):
+        return api.get_json("gamma", "events", "/events", params=params)
+
+    schema.migrate_all(db_main, db_insider)
+    markets, ids = load_markets(db_main)
+    if not ids:
+        # Instalação nova: sincroniza o registro de mercados antes de paginar
+        registry = MarketRegistry(db_main, fetch_events_page, MARKET_TAGS, page_size=MARKET_PAGE_SIZE)
+        registry.sync(full=True)
+        registry.close()
+        markets, ids = load_markets(db_main)
+    cids = args.markets or sorted(ids)
+    unknown = [cid for cid in cids if cid not in markets]
+    if unknown:
+        print(f"!! [Aviso] {len(unknown)} conditionIds fora do registro; serão classificados sem metadados.")
+        markets.update({cid: {} for cid in unknown})
+    if not cids:
+        raise SystemExit("!! [Erro] Nenhum mercado para o backfill")
+
+    scorer = None
+    if ANOMALY_SCORING:
+        # Linhas de base em memória, aquecidas pelo próprio histórico (as do scanner ao vivo não são tocadas)
+        scorer = make_scorer(dict(THRESHOLDS, **ANOMALY_SETTINGS))
+    try:
+        Backfill(db_main, db_insider, start, end, cids, markets, THRESHOLDS, fetch_trades_page, workers=args.workers,
+                 page_size=args.page_size, max_offset=args.max_offset, scorer=scorer,
+                 clusters=make_clusters(dict(THRESHOLDS, **CLUSTER_SETTINGS)), defer=args.defer).run()
+    finally:
+        api.close()
+
+
+if __name__ == "__main__":
+    main()
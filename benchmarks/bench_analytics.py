@@ -0,0 +1,151 @@
+"""
+Benchmark do analytics.py (NumPy em chunks) contra as consultas SQL equivalentes.
+
+Gera um histórico sintético de `bets` (mesmo gerador do bench_indexes.py),
+executa as métricas vetorizadas e as versões em SQL puro, confere que os
+resultados batem e mostra tempo e pico de memória (tracemalloc) de cada lado.
+
+    python benchmarks/bench_analytics.py --rows 5000000 --chunk-rows 250000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+import schema  # noqa: E402
+from bench_indexes import seed  # noqa: E402
+
+SIGN_SQL = """CASE
+    WHEN position IN ('BUY Yes', 'SELL No') THEN 1
+    WHEN position IN ('BUY No', 'SELL Yes') THEN -1
+    ELSE 0 END"""
+
+SQL = {
+    "carteiras (volume, exposição líquida, período)": f"""
+        SELECT whale_address, SUM(n), SUM(gross), SUM(ABS(net)), MIN(first_ts), MAX(last_ts), COUNT(*)
+        FROM (SELECT whale_address, market_question, COUNT(*) AS n, SUM(size_usd) AS gross,
+                     SUM(size_usd * {SIGN_SQL}) AS net, MIN(timestamp) AS first_ts, MAX(timestamp) AS last_ts
+              FROM bets GROUP BY whale_address, market_question)
+        GROUP BY whale_address""",
+    "mercados (viés Sim/Não)": f"""
+        SELECT market_question, COUNT(*), COUNT(DISTINCT whale_address), SUM(size_usd),
+               SUM(CASE WHEN {SIGN_SQL} > 0 THEN size_usd ELSE 0 END),
+               SUM(CASE WHEN {SIGN_SQL} < 0 THEN size_usd ELSE 0 END)
+        FROM bets GROUP BY market_question""",
+    "intervalos entre apostas (LAG)": """
+        SELECT whale_address,
+               SUM(gap < 60), SUM(gap >= 60 AND gap < 600), SUM(gap >= 600 AND gap < 3600),
+               SUM(gap >= 3600 AND gap < 86400), SUM(gap >= 86400)
+        FROM (SELECT whale_address,
+                     timestamp - LAG(timestamp) OVER (PARTITION BY whale_address ORDER BY timestamp) AS gap
+              FROM bets)
+        WHERE gap IS NOT NULL GROUP BY whale_address""",
+}
+
+COMOVEMENT_SQL = f"""
+    WITH top AS (SELECT whale_address FROM bets GROUP BY whale_address ORDER BY SUM(size_usd) DESC LIMIT ?),
+    dir AS (SELECT whale_address, market_question, SUM(size_usd * {SIGN_SQL}) AS net FROM bets
+            WHERE whale_address IN (SELECT whale_address FROM top)
+            GROUP BY whale_address, market_question HAVING net != 0)
+    SELECT a.whale_address, b.whale_address, COUNT(*) AS shared,
+           SUM((a.net > 0) = (b.net > 0)) AS same
+    FROM dir a JOIN dir b ON a.market_question = b.market_question AND a.whale_address < b.whale_address
+    GROUP BY a.whale_address, b.whale_address HAVING shared >= ?"""
+
+
+def measure(fn, memory=False):
+    """Tempo de `fn()`; com `memory`, executa de novo sob tracemalloc (que distorce o tempo) para o pico."""
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if memory:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--wallets", type=int, default=50_000)
+    parser.add_argument("--markets", type=int, default=400)
+    parser.add_argument("--chunk-rows", type=int, default=analytics.CHUNK_ROWS)
+    parser.add_argument("--top-wallets", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        main_db, insider_db = os.path.join(tmp, "bench_main.db"), os.path.join(tmp, "bench_insider.db")
+        conns = {"main": sqlite3.connect(main_db), "insider": sqlite3.connect(insider_db)}
+        schema.migrate(conns["main"], schema.MAIN_MIGRATIONS)
+        schema.migrate(conns["insider"], schema.INSIDER_MIGRATIONS)
+
+        print(f">> Gerando {args.rows:,} apostas sintéticas...")
+        seed(conns["main"], conns["insider"], args.rows, args.wallets, args.markets)
+        conn = conns["main"]
+
+        # --- NUMPY ---
+        def run_numpy():
+            analyzer = analytics.HistoryAnalyzer()
+            sql = analytics.HISTORY_SQL.format(table="bets")
+            for chunk in analytics.read_chunks(conn, sql, chunk_rows=args.chunk_rows):
+                analyzer.add_chunk(*chunk)
+            analyzer.finish()
+            return analyzer
+
+        analyzer, t_np, mem_np = measure(run_numpy, memory=True)
+        pairs, t_pairs, mem_pairs = measure(lambda: analytics.comovement(
+            conn, "bets", analyzer.top_wallets(args.top_wallets), max_pairs=10 ** 9, chunk_rows=args.chunk_rows), memory=True)
+        print(f"\nNumPy (chunk {args.chunk_rows:,}): {t_np:8.2f}s  pico {mem_np:7.1f} MiB  (todas as métricas de carteira/mercado)")
+        print(f"NumPy co-movimento (top {args.top_wallets}): {t_pairs:8.2f}s  pico {mem_pairs:7.1f} MiB  ({len(pairs):,} pares)")
+
+        # --- SQL ---
+        total_sql = 0.0
+        sql_results = {}
+        for label, sql in SQL.items():
+            rows, elapsed, _ = measure(lambda: conn.execute(sql).fetchall())
+            sql_results[label] = rows
+            total_sql += elapsed
+            print(f"SQL {label:<48} {elapsed:8.2f}s")
+        rows, t_sql_pairs, _ = measure(lambda: conn.execute(
+            COMOVEMENT_SQL, (args.top_wallets, analytics.MIN_SHARED_MARKETS)).fetchall())
+        print(f"SQL co-movimento (self-join){'':<23}{t_sql_pairs:8.2f}s  ({len(rows):,} pares)")
+        print(f"\nTotal: NumPy {t_np + t_pairs:.2f}s vs SQL {total_sql + t_sql_pairs:.2f}s "
+              f"({(total_sql + t_sql_pairs) / (t_np + t_pairs):.1f}x)")
+
+        # --- CONFERÊNCIA ---
+        wallets = {r[0]: r for r in analyzer.wallet_rows()}
+        sql_wallets = sql_results["carteiras (volume, exposição líquida, período)"]
+        assert len(wallets) == len(sql_wallets)
+        for address, n, gross, net_abs, first_ts, last_ts, markets in sql_wallets:
+            w = wallets[address]
+            assert w[1] == n and w[5] == markets and w[8] == first_ts and w[9] == last_ts
+            assert np.isclose(w[2], gross, atol=0.01) and np.isclose(w[3], net_abs, atol=0.01)
+        gaps = {r[0]: r[10:15] for r in analyzer.wallet_rows()}
+        for address, *counts in sql_results["intervalos entre apostas (LAG)"]:
+            assert tuple(gaps[address]) == tuple(counts), address
+        markets = {r[0]: r for r in analyzer.market_rows()}
+        for question, n, distinct, volume, yes, no in sql_results["mercados (viés Sim/Não)"]:
+            m = markets[question]
+            assert m[1] == n and m[2] == distinct and np.allclose(m[3:6], (volume, yes, no), atol=0.01)
+        sql_pairs = {(a, b): (s, c) for a, b, s, c in rows}
+        np_pairs = {tuple(sorted((a, b))): (s, c) for a, b, s, c, _ in pairs}
+        assert sql_pairs == np_pairs
+        print(">> Resultados idênticos entre NumPy e SQL.")
+
+        for c in conns.values():
+            c.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Benchmark ponta a ponta: scanner e servidor rodando contra o stub das APIs.
+
+Para cada tamanho de banco em --rows, gera os bancos sintéticos num diretório
+temporário (mesmo gerador do loadtest.py) e sobe três coisas:
+
+- o stub (stub_api.py), com uma fita ao vivo a --rate trades/s, carteiras em
+  distribuição de Zipf e --ladders ordens fracionadas por minuto;
+- o scanner (PolyInsideScanner.py, ou supervisor.py com --supervisor);
+- o servidor (gunicorn, ou o de desenvolvimento com --dev).
+
+Durante --duration segundos, --clients clientes pedem /api/stats,
+/api/insider_data e /api/whale/<carteira>. Uma thread acompanha a tabela `bets`
+para saber quando cada trade chegou ao banco. O relatório traz:
+
+- ingestão: trades publicados por segundo e apostas gravadas por segundo;
+- latência da detecção até o banco (p50/p99): do instante em que o trade
+  aparece no /trades até a linha em `bets`, casada pelo tx_hash;
+- trades perdidos: trades do Stream que nunca chegaram ao banco, além das
+  lacunas do paginador;
+- ladders: quantas ordens fracionadas foram detectadas como insider e com que
+  latência;
+- API: req/s e p50/p99 por endpoint, com o tamanho dos bancos.
+
+Os resultados vão para benchmarks/results/<data>_<commit>.json. --compare
+mostra a variação entre dois arquivos de resultado.
+
+    python benchmarks/bench_e2e.py --rate 200 --rows 0 200000 1000000 --duration 60
+    python benchmarks/bench_e2e.py --compare benchmarks/results/antes.json benchmarks/results/depois.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loadtest import prepare, run_load, start_server  # noqa: E402
+from PolyInsideScanner import ACCUMULATION_FLOOR, CRITICAL_TRIGGER, METRICS_INTERVAL, STREAM_MIN_SIZE  # noqa: E402
+from stub_api import LiveFeed, events_for, serve, synthetic_cids  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+WHALE_PATH = "/api/whale/<address>"  # Chave do endpoint no resultado (a carteira varia com o banco)
+
+
+class BetWatcher:
+    """Registra o instante em que cada tx_hash aparece em `bets` (consulta a cada `interval` s)."""
+
+    def __init__(self, db_path, interval=0.1):
+        self.db_path = db_path
+        self.interval = interval
+        self.seen = {}
+        self.rows = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bet-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=30.0)
+        last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM bets").fetchone()[0]
+        while not self._stop.wait(self.interval):
+            try:
+                rows = conn.execute("SELECT id, tx_hash FROM bets WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+            except sqlite3.OperationalError:
+                continue
+            now = time.time()
+            for row_id, tx in rows:
+                self.seen.setdefault(tx, now)
+            if rows:
+                last_id = rows[-1][0]
+                self.rows += len(rows)
+        conn.close()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+
+def db_bytes(directory):
+    return sum(os.path.getsize(p) for p in glob.glob(os.path.join(directory, "*.db*")))
+
+
+def scanner_snapshots(metrics_dir):
+    snapshots = []
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        if os.path.basename(path).startswith("server-"):
+            continue
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def scanner_counters(metrics_dir, since):
+    """
+    Soma os contadores `stats` publicados pelos processos do scanner, esperando
+    (até um intervalo de publicação) por snapshots posteriores a `since`.
+    """
+    deadline = time.time() + METRICS_INTERVAL + 2
+    snapshots = scanner_snapshots(metrics_dir)
+    while time.time() < deadline and any(s.get("ts", 0) < since for s in snapshots):
+        time.sleep(0.5)
+        snapshots = scanner_snapshots(metrics_dir)
+    totals = {}
+    for snap in snapshots:
+        families = snap.get("families", {})
+        for name in ("sentinel_trades_total", "sentinel_pipeline_total", "sentinel_errors_total"):
+            for labels, value in families.get(name, {}).get("samples", []):
+                key = f"{name}:{next(iter(labels.values()), '')}"
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p99": None, "max": None}
+    p50, p99 = np.percentile(values, (50, 99))
+    return {"p50": round(float(p50), 3), "p99": round(float(p99), 3), "max": round(float(max(values)), 3)}
+
+
+def top_insider_wallet(db_insider):
+    conn = sqlite3.connect(db_insider, timeout=30.0)
+    try:
+        row = conn.execute("SELECT address FROM intel_whales ORDER BY total_scanned_volume DESC LIMIT 1").fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else "0x0"
+
+
+def run_once(args, rows):
+    """Um cenário completo para um tamanho de banco. Retorna o dicionário do resultado."""
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\n>> [Bench] Bancos com {rows:,} apostas sintéticas...")
+        db_main = prepare(tmp, rows, args.wallets, args.markets)
+        db_insider = os.path.join(tmp, "insider_intel.db")
+        size_before = db_bytes(tmp)
+        whale = top_insider_wallet(db_insider)
+        paths = ["/api/stats", "/api/insider_data", f"/api/whale/{whale}"]
+
+        live = LiveFeed(synthetic_cids(args.markets), args.rate, wallets=args.feed_wallets, zipf=args.zipf,
+                        ladders=args.ladders, seed=args.seed)
+        stub = serve([], events_for(live.cids), port=args.stub_port, fail_rate=args.fail_rate,
+                     latency=args.api_latency, live=live)
+        stub_url = f"http://127.0.0.1:{args.stub_port}"
+        metrics_dir = os.path.join(tmp, "metrics")
+        env = dict(os.environ, PYTHONPATH=ROOT, PYTHONUNBUFFERED="1", DATA_API=stub_url, GAMMA_API=stub_url,
+                   POLYGONSCAN_API=stub_url, METRICS_DIR=metrics_dir, ANOMALY_SCORING="1" if args.anomaly else "0")
+        script = "supervisor.py" if args.supervisor else "PolyInsideScanner.py"
+        log = open(os.path.join(tmp, "scanner.log"), "w")
+        scanner = subprocess.Popen([sys.executable, os.path.join(ROOT, script)], cwd=tmp, env=env, stdout=log,
+                                   stderr=subprocess.STDOUT)
+        server = None
+        watcher = BetWatcher(db_main)
+        try:
+            deadline = time.time() + 60
+            while not stub.RequestHandlerClass.data.paths.get("/trades"):
+                if scanner.poll() is not None or time.time() > deadline:
+                    log.flush()
+                    with open(log.name) as f:
+                        print("".join(f.readlines()[-20:]))
+                    raise SystemExit("!! [Erro] Scanner não começou a varrer o /trades")
+                time.sleep(0.2)
+            server = start_server(tmp, args.port, args.dev, {"METRICS_DIR": metrics_dir})
+
+            print(f">> [Bench] {args.rate:g} trades/s, {args.clients} clientes, {args.duration:.0f}s...")
+            watcher.start()
+            live.start()
+            started = time.time()
+            api = run_load(f"http://127.0.0.1:{args.port}", paths, args.clients, args.duration, 0)
+            live.stop()
+            fed = time.time() - started
+
+            # Espera o scanner gravar o que já foi publicado
+            published = live.snapshot()
+            ladder_txs = {tx for ladder in live.ladders for tx in ladder["txs"]}
+            # Trades do Stream: gravados na hora, um por trade (os maiores esperam a janela de agregação)
+            stream = [tx for tx, (_, usd) in published.items()
+                      if STREAM_MIN_SIZE <= usd < ACCUMULATION_FLOOR and tx not in ladder_txs]
+            drain_deadline = time.time() + args.drain
+            while time.time() < drain_deadline and any(tx not in watcher.seen for tx in stream):
+                time.sleep(0.5)
+            counters = scanner_counters(metrics_dir, time.time())
+        finally:
+            watcher.stop()
+            live.stop()
+            if scanner.poll() is None:
+                scanner.send_signal(signal.SIGINT)  # Encerramento normal: grava as filas pendentes
+                try:
+                    scanner.wait(timeout=60)
+                except subprocess.TimeoutExpired:
+                    scanner.kill()
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+            stub.shutdown()
+            stub.server_close()
+            log.close()
+
+        latency = [watcher.seen[tx] - published[tx][0] for tx in stream if tx in watcher.seen]
+        # Ladders cujas partes publicadas já somam o gatilho crítico devem virar uma aposta insider,
+        # gravada com o tx_hash da parte que cruzou o gatilho
+        expected = [ladder for ladder in live.ladders
+                    if sum(tx in published for tx in ladder["txs"]) * ladder["part"] >= CRITICAL_TRIGGER]
+        detected = [ladder for ladder in expected if any(tx in watcher.seen for tx in ladder["txs"])]
+        ladder_latency = [min(watcher.seen[tx] - published[tx][0] for tx in ladder["txs"] if tx in watcher.seen)
+                          for ladder in detected]
+        return {
+            "rows": rows,
+            "db_bytes": {"before": size_before, "after": db_bytes(tmp)},
+            "ingest": {
+                "published": live.stats["trades"],
+                "published_per_s": round(live.stats["trades"] / fed, 1),
+                "bets_written": watcher.rows,
+                "bets_per_s": round(watcher.rows / fed, 1),
+                "stream_trades": len(stream),
+                "dropped": len(stream) - len(latency),
+                "scanner": counters,
+            },
+            "latency_s": percentiles(latency),
+            "ladders": {"started": len(live.ladders), "expected": len(expected), "detected": len(detected),
+                        "latency_s": percentiles(ladder_latency)},
+            "whale_address": whale,
+            "api": {(WHALE_PATH if path.startswith("/api/whale/") else path):
+                    {"rps": round(rps, 1), "p50_ms": round(p50, 2), "p99_ms": round(p99, 2), "errors": failed}
+                    for path, (rps, p50, p99, failed) in api.items()},
+        }
+
+
+def version():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecida"
+    return commit + ("-dirty" if dirty else "")
+
+
+def seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def print_run(run):
+    ing, lat, lad = run["ingest"], run["latency_s"], run["ladders"]
+    print(f"\n>> {run['rows']:,} apostas iniciais ({run['db_bytes']['before'] / 2 ** 20:.1f} MB -> "
+          f"{run['db_bytes']['after'] / 2 ** 20:.1f} MB)")
+    print(f"   Ingestão: {ing['published_per_s']:.1f} trades/s publicados, {ing['bets_per_s']:.1f} apostas/s gravadas, "
+          f"{ing['dropped']} de {ing['stream_trades']} trades do Stream perdidos")
+    print(f"   Latência até o banco: p50 {seconds(lat['p50'])} | p99 {seconds(lat['p99'])} | máx {seconds(lat['max'])}")
+    print(f"   Ladders: {lad['detected']}/{lad['expected']} detectadas ({lad['started']} iniciadas) | "
+          f"p50 {seconds(lad['latency_s']['p50'])}")
+    print(f"   {'endpoint':<40} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'erros':>7}")
+    for path, r in run["api"].items():
+        print(f"   {path:<40} {r['rps']:>10.1f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} {r['errors']:>7}")
+
+
+def compare(old_path, new_path):
+    """Variação de cada métrica entre dois resultados (cenários casados pelo tamanho do banco)."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f">> {old['version']} ({old['started']}) -> {new['version']} ({new['started']})")
+    old_runs = {r["rows"]: r for r in old["runs"]}
+
+    def line(label, a, b):
+        delta = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else "-"
+        print(f"   {label:<44} {a if a is not None else '-':>12} {b if b is not None else '-':>12} {delta:>9}")
+
+    for run in new["runs"]:
+        base = old_runs.get(run["rows"])
+        if base is None:
+            print(f"\n>> {run['rows']:,} apostas: sem cenário equivalente em {old_path}")
+            continue
+        print(f"\n>> {run['rows']:,} apostas iniciais")
+        line("apostas/s gravadas", base["ingest"]["bets_per_s"], run["ingest"]["bets_per_s"])
+        line("trades do Stream perdidos", base["ingest"]["dropped"], run["ingest"]["dropped"])
+        for q in ("p50", "p99"):
+            line(f"latência até o banco {q} (s)", base["latency_s"][q], run["latency_s"][q])
+        line("ladders detectadas", base["ladders"]["detected"], run["ladders"]["detected"])
+        for path, r in run["api"].items():
+            if path in base["api"]:
+                for key in ("rps", "p50_ms", "p99_ms"):
+                    line(f"{path} {key}", base["api"][path][key], r[key])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"), help="compara dois resultados")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000], help="apostas pré-carregadas (um cenário por valor)")
+    parser.add_argument("--wallets", type=int, default=20_000, help="carteiras dos bancos sintéticos")
+    parser.add_argument("--markets", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=100, help="trades/s publicados pelo stub")
+    parser.add_argument("--feed-wallets", type=int, default=5000, help="carteiras da fita ao vivo")
+    parser.add_argument("--zipf", type=float, default=1.1, help="expoente de Zipf da atividade por carteira")
+    parser.add_argument("--ladders", type=float, default=6, help="ordens fracionadas por minuto")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--drain", type=float, default=60, help="espera máxima (s) pelos trades já publicados")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="atraso (s) de cada resposta do stub")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fração de respostas 429/503 do stub")
+    parser.add_argument("--anomaly", action="store_true", help="gatilhos adaptativos (ANOMALY_SCORING=1)")
+    parser.add_argument("--supervisor", action="store_true", help="scanner em modo multiprocesso (supervisor.py)")
+    parser.add_argument("--dev", action="store_true", help="servidor de desenvolvimento do Flask em vez do gunicorn")
+    parser.add_argument("--port", type=int, default=5078)
+    parser.add_argument("--stub-port", type=int, default=8790)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default=RESULTS_DIR, help="diretório dos resultados")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    result = {
+        "version": version(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("compare", "out", "port", "stub_port")},
+        "runs": [],
+    }
+    for rows in args.rows:
+        run = run_once(args, rows)
+        print_run(run)
+        result["runs"].append(run)
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{time.strftime('%Y%m%d_%H%M%S')}_{result['version']}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n>> [Bench] Resultado gravado em {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark dos índices da migração 4 (schema.py) sobre uma tabela `bets` sintética.
+
+Cria bancos temporários com N apostas, executa as consultas do servidor com o
+esquema na versão 3 (sem índices secundários) e depois na versão atual,
+mostrando o plano de execução (EXPLAIN QUERY PLAN) e o tempo médio de cada uma.
+
+    python benchmarks/bench_indexes.py --rows 3000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schema  # noqa: E402
+
+NOW = int(time.time())
+
+QUERIES = {
+    "feed (ORDER BY timestamp LIMIT 20)": ("main", """
+        SELECT b.*, w.funding_source FROM bets b
+        JOIN whales w ON b.whale_address = w.address
+        ORDER BY b.timestamp DESC LIMIT 20
+    """, ()),
+    "velocidade 24h (WHERE timestamp > ?)": ("main", """
+        SELECT (timestamp / 1800) * 1800 AS bucket, SUM(size_usd) FROM bets
+        WHERE timestamp > ? GROUP BY bucket
+    """, (NOW - 86400,)),
+    "sentimento (últimas 100)": ("main", """
+        SELECT SUM(CASE WHEN position LIKE '%Yes%' THEN 1 ELSE 0 END), AVG(size_usd)
+        FROM (SELECT position, size_usd FROM bets ORDER BY timestamp DESC LIMIT 100)
+    """, ()),
+    "histórico por carteira (bets)": ("main", """
+        SELECT * FROM bets WHERE whale_address = ? ORDER BY timestamp DESC LIMIT 50
+    """, ("0xwallet00042",)),
+    "convicção por mercado (GROUP BY market_question)": ("main", """
+        SELECT market_question, COUNT(*), AVG(size_usd) FROM bets GROUP BY market_question
+    """, ()),
+    "/api/whale/<address> (intel_bets)": ("insider", """
+        SELECT * FROM intel_bets WHERE whale_address = ? ORDER BY timestamp DESC LIMIT 50
+    """, ("0xwallet00042",)),
+    "roster insider (ORDER BY last_active_ts)": ("insider", """
+        SELECT * FROM intel_whales ORDER BY last_active_ts DESC LIMIT 50
+    """, ()),
+}
+
+
+def seed(conn_main, conn_insider, rows, wallets, markets):
+    rng = random.Random(42)
+    span = 90 * 86400  # ~3 meses de histórico
+
+    conn_main.executemany("INSERT INTO whales (address, first_seen, last_seen, total_volume, funding_source) VALUES (?, 0, ?, 0, 'Varejo')",
+                          [(f"0xwallet{i:05d}", NOW) for i in range(wallets)])
+
+    def bet_rows(n):
+        for _ in range(n):
+            yield (f"0xwallet{rng.randrange(wallets):05d}", NOW - rng.randrange(span), f"Mercado {rng.randrange(markets)}",
+                   "politics", rng.choice(("BUY Yes", "BUY No", "SELL Yes", "SELL No")), rng.uniform(10, 5000), "#")
+
+    conn_main.executemany("INSERT INTO bets (whale_address, timestamp, market_question, category, position, size_usd, bet_link) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          bet_rows(rows))
+    conn_main.commit()
+
+    conn_insider.executemany("INSERT INTO intel_whales (address, funding_source, account_created_ts, portfolio_value, total_scanned_volume, last_active_ts) VALUES (?, 'Binance', 0, 0, 0, ?)",
+                             [(f"0xwallet{i:05d}", NOW - rng.randrange(span)) for i in range(wallets)])
+    conn_insider.executemany("INSERT INTO intel_bets (whale_address, timestamp, market_question, position, size_usd) VALUES (?, ?, ?, ?, ?)",
+                             ((w, ts, q, p, s) for w, ts, q, _, p, s, _ in bet_rows(rows // 10)))
+    conn_insider.commit()
+
+
+def run_queries(conns, repeat):
+    results = {}
+    for label, (db, sql, params) in QUERIES.items():
+        conn = conns[db]
+        plan = " | ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        results[label] = ((time.perf_counter() - start) / repeat * 1000, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--wallets", type=int, default=50_000)
+    parser.add_argument("--markets", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conns = {
+            "main": sqlite3.connect(os.path.join(tmp, "bench_main.db")),
+            "insider": sqlite3.connect(os.path.join(tmp, "bench_insider.db")),
+        }
+        schema.migrate(conns["main"], schema.MAIN_MIGRATIONS, target=3)
+        schema.migrate(conns["insider"], schema.INSIDER_MIGRATIONS, target=3)
+
+        print(f">> Gerando {args.rows:,} apostas sintéticas...")
+        start = time.perf_counter()
+        seed(conns["main"], conns["insider"], args.rows, args.wallets, args.markets)
+        print(f">> Seed em {time.perf_counter() - start:.1f}s")
+
+        before = run_queries(conns, args.repeat)
+
+        start = time.perf_counter()
+        schema.migrate(conns["main"], schema.MAIN_MIGRATIONS)
+        schema.migrate(conns["insider"], schema.INSIDER_MIGRATIONS)
+        print(f">> Migração de índices em {time.perf_counter() - start:.1f}s\n")
+
+        after = run_queries(conns, args.repeat)
+
+        for label in QUERIES:
+            (t0, p0), (t1, p1) = before[label], after[label]
+            print(f"{label}")
+            print(f"   antes : {t0:10.2f} ms  {p0}")
+            print(f"   depois: {t1:10.2f} ms  {p1}")
+            print(f"   ganho : {t0 / t1 if t1 else float('inf'):10.1f}x\n")
+
+        for conn in conns.values():
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Teste de carga do servidor: requisições/s e latências (p50/p99) por endpoint.
+
+Sem --url, gera bancos sintéticos num diretório temporário (mesmo gerador do
+bench_indexes.py, com os rollups reconstruídos), sobe o servidor ali com o
+gunicorn.conf.py (ou o servidor de desenvolvimento, com --dev) e o derruba ao
+final. Com --url, mede um servidor já em execução.
+
+Cada cliente é uma thread com conexão keep-alive própria, pedindo gzip como um
+navegador. Com --churn, uma thread grava apostas no banco a cada N segundos,
+invalidando o cache de respostas como o scanner faria.
+
+    python benchmarks/loadtest.py --rows 500000 --clients 32 --duration 20
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --paths /api/stats
+"""
+import argparse
+import http.client
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rollups  # noqa: E402
+import schema  # noqa: E402
+from bench_indexes import seed  # noqa: E402
+
+DEFAULT_PATHS = ("/api/stats", "/api/insider_data")
+
+
+def prepare(directory, rows, wallets, markets):
+    db_main = os.path.join(directory, "whale_hunter.db")
+    db_insider = os.path.join(directory, "insider_intel.db")
+    schema.migrate_all(db_main, db_insider)
+    conn_main, conn_insider = sqlite3.connect(db_main), sqlite3.connect(db_insider)
+    try:
+        seed(conn_main, conn_insider, rows, wallets, markets)
+    finally:
+        conn_main.close()
+        conn_insider.close()
+    rollups.rebuild_rollups(db_main, db_insider)
+    return db_main
+
+
+def start_server(directory, port, dev, env):
+    env = dict(os.environ, PYTHONPATH=ROOT, **env)
+    if dev:
+        cmd = [sys.executable, "-c", "import server; server.create_app().run(port=%d, threaded=True)" % port]
+    else:
+        env["GUNICORN_BIND"] = f"127.0.0.1:{port}"
+        cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py")]
+    proc = subprocess.Popen(cmd, cwd=directory, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/insider_data")
+            conn.getresponse().read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("!! [Erro] Servidor não respondeu em 30s")
+
+
+def churn(db_main, interval, stop):
+    """Simula o scanner: uma aposta nova (e o rollup correspondente) a cada `interval` segundos."""
+    conn = sqlite3.connect(db_main, timeout=30.0)
+    while not stop.wait(interval):
+        wallet, ts, question, size, link = "0xwallet00000", int(time.time()), "Mercado 0", 1000.0, "#"
+        conn.execute("INSERT INTO bets (whale_address, timestamp, market_question, category, position, size_usd, bet_link) "
+                     "VALUES (?, ?, ?, 'politics', 'BUY Yes', ?, ?)", (wallet, ts, question, size, link))
+        rollups.apply_bets(conn, [(wallet, ts, question, size, link)])
+        conn.commit()
+    conn.close()
+
+
+def client(host, port, paths, deadline, results, errors):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {"Accept-Encoding": "gzip, deflate, br"}
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors[path] = errors.get(path, 0) + 1
+                continue
+        except (OSError, http.client.HTTPException):
+            errors[path] = errors.get(path, 0) + 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        results[path].append(time.perf_counter() - start)
+    conn.close()
+
+
+def run_load(url, paths, clients, duration, warmup):
+    parsed = urllib.parse.urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    if warmup:
+        run_load(url, paths, clients, warmup, 0)
+
+    per_client = [{p: [] for p in paths} for _ in range(clients)]
+    errors = [{} for _ in range(clients)]
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(host, port, paths, deadline, per_client[i], errors[i]))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    report = {}
+    for path in paths:
+        lat = np.array([x for r in per_client for x in r[path]]) * 1000
+        failed = sum(e.get(path, 0) for e in errors)
+        report[path] = (len(lat) / elapsed, *(np.percentile(lat, (50, 99)) if len(lat) else (0.0, 0.0)), failed)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="servidor já em execução (sem seed)")
+    parser.add_argument("--paths", nargs="+", default=list(DEFAULT_PATHS))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--wallets", type=int, default=20_000)
+    parser.add_argument("--markets", type=int, default=400)
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--dev", action="store_true", help="servidor de desenvolvimento do Flask em vez do gunicorn")
+    parser.add_argument("--replica", action="store_true", help="servidor com SERVER_READ_REPLICA=1")
+    parser.add_argument("--churn", type=float, default=0, help="grava uma aposta a cada N segundos")
+    args = parser.parse_args()
+
+    if args.url:
+        report = run_load(args.url, args.paths, args.clients, args.duration, args.warmup)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f">> Gerando {args.rows:,} apostas sintéticas...")
+            db_main = prepare(tmp, args.rows, args.wallets, args.markets)
+            proc = start_server(tmp, args.port, args.dev, {"SERVER_READ_REPLICA": "1" if args.replica else "0"})
+            stop = threading.Event()
+            writer = None
+            if args.churn:
+                writer = threading.Thread(target=churn, args=(db_main, args.churn, stop), daemon=True)
+                writer.start()
+            try:
+                report = run_load(f"http://127.0.0.1:{args.port}", args.paths, args.clients, args.duration, args.warmup)
+            finally:
+                stop.set()
+                if writer is not None:
+                    writer.join()
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    mode = "url" if args.url else ("dev" if args.dev else "gunicorn") + (" + réplica" if args.replica else "")
+    print(f"\n>> {mode}, {args.clients} clientes, {args.duration:.0f}s" + (f", escrita a cada {args.churn}s" if args.churn else ""))
+    print(f"{'endpoint':<24} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'erros':>7}")
+    for path, (rps, p50, p99, failed) in report.items():
+        print(f"{path:<24} {rps:>10.1f} {p50:>10.2f} {p99:>10.2f} {failed:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Servidor local que imita a Data API (/trades) e a Gamma API (/events) a partir
+de respostas gravadas, para testar o backfill.py e o scanner sem rede:
+
+    python benchmarks/stub_api.py --tape fita.jsonl --port 8765
+    python benchmarks/stub_api.py --synthetic 200000 --markets 50 --hours 48
+    python benchmarks/stub_api.py --live 200 --markets 50 --ladders 6
+    DATA_API=http://127.0.0.1:8765 GAMMA_API=http://127.0.0.1:8765 python backfill.py --hours 24
+
+A fita é qualquer formato aceito pelo replay.py (JSONL de respostas do /trades,
+CSV, Parquet, .ptape). Os eventos vêm de --events (JSON com a lista do /events)
+ou são derivados dos conditionIds da fita, todos com a tag "politics".
+
+O /trades pagina por `limit`/`offset` em ordem decrescente de timestamp e aceita
+`market` (um ou mais conditionIds separados por vírgula), como a API real.
+--max-offset reproduz o teto de paginação (HTTP 400 acima dele), --fail-rate
+injeta respostas 429/503 e --latency atrasa cada resposta.
+
+Com --live, o /trades é alimentado por um gerador (LiveFeed) a N trades/s com
+carteiras em distribuição de Zipf e ordens grandes fracionadas (ladders). Os
+endpoints do enriquecimento forense também respondem (/users, /value,
+/positions e o /api do PolygonScan), de modo que o scanner inteiro roda contra
+este servidor (benchmarks/bench_e2e.py).
+"""
+import argparse
+import bisect
+import heapq
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from replay import load_tape  # noqa: E402
+
+
+def synthetic_trades(count, markets, hours, seed=7):
+    """Trades sintéticos com tamanhos log-normais e algumas carteiras fracionando ordens grandes."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    cids = [f"0x{rng.getrandbits(256):064x}" for _ in range(markets)]
+    wallets = [f"0x{rng.getrandbits(160):040x}" for _ in range(max(10, count // 20))]
+    trades = []
+    for i in range(count):
+        price = round(rng.uniform(0.05, 0.95), 3)
+        usd = min(rng.lognormvariate(3.5, 1.6), 50000)
+        trades.append({
+            "proxyWallet": rng.choice(wallets), "side": rng.choice(("BUY", "SELL")), "asset": str(rng.getrandbits(64)),
+            "conditionId": rng.choice(cids), "size": round(usd / price, 2), "price": price,
+            "timestamp": now - rng.randrange(int(hours * 3600)), "outcome": rng.choice(("Yes", "No")),
+            "transactionHash": f"0x{rng.getrandbits(256):064x}",
+        })
+    return trades
+
+
+def events_for(cids):
+    return [{
+        "id": str(i), "slug": f"mercado-{i}", "active": True, "closed": False, "tags": [{"slug": "politics"}],
+        "updatedAt": "2026-01-01T00:00:00Z",
+        "markets": [{"conditionId": cid, "question": f"Mercado {i}?", "active": True, "closed": False}],
+    } for i, cid in enumerate(sorted(cids))]
+
+
+def synthetic_cids(markets, seed=7):
+    rng = random.Random(seed)
+    return [f"0x{rng.getrandbits(256):064x}" for _ in range(markets)]
+
+
+class LiveFeed:
+    """
+    Fita ao vivo: `rate` trades/s com timestamp atual, carteiras sorteadas por
+    Zipf (expoente `zipf` sobre `wallets` carteiras) e tamanhos log-normais.
+    `ladders` por minuto, uma carteira dedicada fraciona uma ordem de
+    `ladder_size` (USD) em 3 a 8 partes dentro de `ladder_span` segundos.
+    `published` guarda o instante de publicação de cada transactionHash.
+    """
+
+    def __init__(self, cids, rate, wallets=5000, zipf=1.1, ladders=0.0, ladder_size=(6000, 12000),
+                 ladder_span=30, seed=7):
+        self.cids = cids
+        self.rate = rate
+        self.ladders_per_s = ladders / 60
+        self.ladder_size = ladder_size
+        self.ladder_span = ladder_span
+        self.rng = random.Random(seed)
+        self.wallets = [f"0x{self.rng.getrandbits(160):040x}" for _ in range(wallets)]
+        weights, total = [], 0.0
+        for i in range(1, wallets + 1):
+            total += 1 / i ** zipf
+            weights.append(total)
+        self.cum_weights = weights
+
+        self.trades = []  # Ordem de publicação (mais antigo primeiro)
+        self.published = {}  # transactionHash -> (instante de publicação, USD)
+        self.ladders = []  # {"wallet", "cid", "total", "part", "txs"}
+        self.stats = {"trades": 0, "ladder_trades": 0, "ladders": 0}
+        self._pending = []  # Heap (instante, seq, trade) das partes de ladders ainda não publicadas
+        self._seq = 0
+        self._carry = 0.0  # Fração de trade acumulada entre ticks
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def trade(self, wallet, cid, usd, now):
+        price = round(self.rng.uniform(0.05, 0.95), 3)
+        return {
+            "proxyWallet": wallet, "side": "BUY", "asset": str(self.rng.getrandbits(64)), "conditionId": cid,
+            "size": round(usd / price, 4), "price": price, "timestamp": int(now),
+            "outcome": self.rng.choice(("Yes", "No")), "transactionHash": f"0x{self.rng.getrandbits(256):064x}",
+        }
+
+    def _random_trade(self, now):
+        wallet = self.wallets[bisect.bisect_left(self.cum_weights, self.rng.random() * self.cum_weights[-1])]
+        t = self.trade(wallet, self.rng.choice(self.cids), min(self.rng.lognormvariate(3.5, 1.6), 50000), now)
+        t["side"] = self.rng.choice(("BUY", "SELL"))
+        return t
+
+    def _schedule_ladder(self, now):
+        wallet = f"0x{self.rng.getrandbits(160):040x}"
+        cid = self.rng.choice(self.cids)
+        total = self.rng.uniform(*self.ladder_size)
+        parts = self.rng.randint(3, 8)
+        outcome = self.rng.choice(("Yes", "No"))
+        ladder = {"wallet": wallet, "cid": cid, "total": total, "part": total / parts, "txs": []}
+        for i in range(parts):
+            t = self.trade(wallet, cid, total / parts, now)
+            t["outcome"] = outcome  # Mesmo lado: cai no mesmo bucket de agregação
+            ladder["txs"].append(t["transactionHash"])
+            self._seq += 1
+            heapq.heappush(self._pending, (now + self.ladder_span * i / parts, self._seq, t))
+        self.ladders.append(ladder)
+        self.stats["ladders"] += 1
+
+    def publish(self, elapsed, now):
+        """Gera os trades de `elapsed` segundos e publica as partes de ladders vencidas."""
+        fresh = []
+        self._carry += self.rate * elapsed
+        for _ in range(int(self._carry)):
+            fresh.append(self._random_trade(now))
+        self._carry -= int(self._carry)
+        if self.ladders_per_s and self.rng.random() < self.ladders_per_s * elapsed:
+            self._schedule_ladder(now)
+        while self._pending and self._pending[0][0] <= now:
+            _, _, t = heapq.heappop(self._pending)
+            t["timestamp"] = int(now)
+            fresh.append(t)
+            self.stats["ladder_trades"] += 1
+        with self._lock:
+            for t in fresh:
+                self.trades.append(t)
+                self.published[t["transactionHash"]] = (now, float(t["size"]) * float(t["price"]))
+            self.stats["trades"] += len(fresh)
+
+    def snapshot(self):
+        """Cópia de `published` (a thread geradora continua escrevendo)."""
+        with self._lock:
+            return dict(self.published)
+
+    def page(self, limit, offset):
+        """Página do /trades: do mais novo para o mais antigo."""
+        with self._lock:
+            end = max(0, len(self.trades) - offset)
+            return self.trades[max(0, end - limit):end][::-1]
+
+    def start(self, tick=0.05):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(tick,), name="stub-feed", daemon=True)
+            self._thread.start()
+
+    def _run(self, tick):
+        last = time.time()
+        while not self._stop.wait(tick):
+            now = time.time()
+            self.publish(now - last, now)
+            last = now
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class StubData:
+    def __init__(self, trades, events, max_offset=None, fail_rate=0.0, latency=0.0, live=None):
+        self.all = sorted(trades, key=lambda t: int(t['timestamp']), reverse=True)
+        self.by_market = {}
+        for t in self.all:
+            self.by_market.setdefault(t.get('conditionId'), []).append(t)
+        self.events = events
+        self.max_offset = max_offset
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.live = live
+        self.requests = 0
+        self.paths = {}  # Requisições por endpoint
+        self._lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    data = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        data = self.data
+        url = urllib.parse.urlparse(self.path)
+        endpoint = "/users" if url.path.startswith("/users/") else url.path
+        with data._lock:
+            data.requests += 1
+            data.paths[endpoint] = data.paths.get(endpoint, 0) + 1
+        if data.latency:
+            time.sleep(data.latency)
+        if data.fail_rate and random.random() < data.fail_rate:
+            return self.send_json(random.choice((429, 503)), {"error": "falha injetada"})
+
+        params = dict(urllib.parse.parse_qsl(url.query))
+        limit = int(params.get("limit", 100))
+        offset = int(params.get("offset", 0))
+        if url.path == "/trades":
+            if data.max_offset is not None and offset > data.max_offset:
+                return self.send_json(400, {"error": f"offset acima de {data.max_offset}"})
+            if data.live is not None:
+                return self.send_json(200, data.live.page(limit, offset))
+            if params.get("market"):
+                rows = []
+                for cid in params["market"].split(","):
+                    rows.extend(data.by_market.get(cid, ()))
+                if "," in params["market"]:
+                    rows.sort(key=lambda t: int(t['timestamp']), reverse=True)
+            else:
+                rows = data.all
+            return self.send_json(200, rows[offset:offset + limit])
+        if url.path == "/events":
+            return self.send_json(200, data.events[offset:offset + limit])
+
+        # Enriquecimento forense: respostas determinísticas por carteira
+        wallet = (url.path[len("/users/"):] if endpoint == "/users" else params.get("user") or params.get("address", ""))
+        seed = zlib.crc32(wallet.encode())
+        if endpoint == "/users":
+            created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - seed % (400 * 86400)))
+            return self.send_json(200, {"proxyWallet": wallet, "createdAt": created})
+        if url.path == "/value":
+            return self.send_json(200, [{"user": wallet, "value": seed % 250000}])
+        if url.path == "/positions":
+            return self.send_json(200, [])
+        if url.path == "/api":  # PolygonScan txlist
+            funder = f"0x{seed % 50:040x}"  # Poucos financiadores: gera clusters por financiador comum
+            return self.send_json(200, {"status": "1", "message": "OK", "result": [
+                {"from": funder, "to": wallet, "timeStamp": str(int(time.time()) - seed % (400 * 86400))}]})
+        self.send_json(404, {"error": "não encontrado"})
+
+
+def serve(trades, events=None, port=8765, **kwargs):
+    """Sobe o stub em uma thread. Retorna o servidor (chame `.shutdown()` ao final)."""
+    handler = type("StubHandler", (Handler,), {"data": StubData(
+        trades, events if events is not None else events_for({t.get('conditionId') for t in trades}), **kwargs)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-api", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--tape", help="Fita de trades (formatos do replay.py)")
+    source.add_argument("--synthetic", type=int, help="Gera N trades sintéticos")
+    source.add_argument("--live", type=float, help="Gera trades ao vivo a N trades/s")
+    parser.add_argument("--markets", type=int, default=20, help="Mercados dos trades sintéticos")
+    parser.add_argument("--wallets", type=int, default=5000, help="Carteiras do gerador ao vivo")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Expoente de Zipf da atividade por carteira")
+    parser.add_argument("--ladders", type=float, default=0.0, help="Ordens fracionadas por minuto (ao vivo)")
+    parser.add_argument("--hours", type=float, default=24, help="Período dos trades sintéticos")
+    parser.add_argument("--events", help="JSON com a lista de eventos do /events")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-offset", type=int, help="Teto de paginação do /trades")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fração de respostas 429/503")
+    parser.add_argument("--latency", type=float, default=0.0, help="Atraso (s) por resposta")
+    args = parser.parse_args()
+
+    live = None
+    if args.tape:
+        trades = [t for _, t in load_tape(args.tape)[0]]
+    elif args.live:
+        trades = []
+        live = LiveFeed(synthetic_cids(args.markets), args.live, wallets=args.wallets, zipf=args.zipf,
+                        ladders=args.ladders)
+    else:
+        trades = synthetic_trades(args.synthetic, args.markets, args.hours)
+    events = None
+    if args.events:
+        with open(args.events, encoding="utf-8") as f:
+            events = json.load(f)
+    elif live is not None:
+        events = events_for(live.cids)
+    server = serve(trades, events, port=args.port, max_offset=args.max_offset, fail_rate=args.fail_rate,
+                   latency=args.latency, live=live)
+    if live is not None:
+        live.start()
+        print(f">> [Stub] {args.live:g} trades/s ao vivo em http://127.0.0.1:{args.port} (Ctrl+C encerra)")
+    else:
+        print(f">> [Stub] {len(trades):,} trades em http://127.0.0.1:{args.port} (Ctrl+C encerra)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        if live is not None:
+            live.stop()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+import json
+import sqlite3
+import threading
+import time
+
+import checkpoint
+import metrics
+import rollups
+
+WRITE_SECONDS = metrics.REGISTRY.histogram("sentinel_db_write_seconds", "Duração da transação de um lote (s)", ("db",))
+COMMIT_SECONDS = metrics.REGISTRY.histogram("sentinel_db_commit_seconds", "Duração do COMMIT de um lote (s)", ("db",))
+ROWS_WRITTEN = metrics.REGISTRY.counter("sentinel_db_rows_total", "Registros gravados pelo BetWriter", ("db", "kind"))
+
+# Filas de cada banco (atributos do writer) e o rótulo de cada uma nas métricas
+QUEUES = {"insider": ("_insider_rows", "_insider_updates"), "main": ("_main_rows", "_main_updates", "_events")}
+QUEUE_KINDS = {"insider": ("bets", "updates"), "main": ("bets", "updates", "events")}
+DB_LABELS = {"insider": "DB Insider", "main": "DB Principal"}
+BUSY_CODES = (5, 6)  # SQLITE_BUSY, SQLITE_LOCKED
+
+
+def is_busy(e):
+    """Erro transitório de concorrência (banco ocupado/travado); disco cheio, tabela ausente etc. são permanentes."""
+    if not isinstance(e, sqlite3.OperationalError):
+        return False
+    code = getattr(e, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in BUSY_CODES  # Códigos estendidos (SQLITE_BUSY_SNAPSHOT...) incluídos
+    message = str(e).lower()
+    return "locked" in message or "busy" in message
+
+
+class BetWriter:
+    """
+    Pipeline de escrita em lote para as duas camadas de persistência.
+
+    Mantém conexões de longa duração com o banco principal e o banco insider,
+    enfileira os registros de apostas e os grava com executemany/UPSERT em uma
+    única transação por ciclo de varredura (ou a cada N linhas). Uma thread
+    auxiliar garante que nenhum registro fique pendente além da latência máxima.
+    Cada lote também publica eventos na tabela `live_events`, lida pelo feed SSE
+    do servidor; apenas os `events_keep` eventos mais recentes são mantidos.
+    Cargas históricas (backfill) usam `live_events=False` para não inundar o feed.
+    Lotes com o banco ocupado/travado voltam para a fila até `max_retries`
+    tentativas seguidas; erros permanentes (disco cheio, tabela ausente...) ou
+    o limite de tentativas descartam o lote, que é anexado ao arquivo JSONL
+    `dead_letter` (um lote por linha, com o banco, o erro e os registros) para
+    reprocessamento manual. Os trades de origem nunca voltam ao motor.
+    """
+
+    def __init__(self, db_main, db_insider, max_rows=200, max_latency=5.0, events_keep=5000, live_events=True,
+                 max_retries=10, dead_letter=None):
+        self.db_main = db_main
+        self.db_insider = db_insider
+        self.max_rows = max_rows
+        self.max_latency = max_latency
+        self.events_keep = events_keep
+        self.live_events = live_events
+        self.max_retries = max_retries
+        self.dead_letter = dead_letter
+
+        self._lock = threading.RLock()
+        self._main_rows = []
+        self._insider_rows = []
+        self._main_updates = []
+        self._insider_updates = []
+        self._events = []
+        self._oldest_ts = None
+        self._closed = False
+        self.stats = {"requeued": 0, "dropped": 0}
+        self._retries = {"main": 0, "insider": 0}  # Tentativas seguidas com o banco ocupado
+
+        self.conn_main = self._connect(db_main)
+        self.conn_insider = self._connect(db_insider)
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="bet-writer", daemon=True)
+        self._flusher.start()
+
+    def _connect(self, db_path):
+        """Conexão persistente em WAL, compartilhada entre threads sob o lock do writer."""
+        conn = checkpoint.connect(db_path, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    # --- ENFILEIRAMENTO ---
+
+    def add_bet(self, b, intel):
+        """Enfileira uma aposta para o stream visual (whales + bets)."""
+        with self._lock:
+            self._main_rows.append((
+                b['wallet'], intel['created'], b['last_ts'], intel['source'], b['value'],
+                b['question'], b['category'], b['position'], b['link'], b.get('tx')
+            ))
+            self._after_add()
+
+    def add_insider(self, b, intel):
+        """Enfileira uma aposta institucional para o banco forense (intel_whales + intel_bets)."""
+        with self._lock:
+            self._insider_rows.append((
+                b['wallet'], intel['source'], intel['created'], intel['portfolio'], b['value'],
+                b['last_ts'], b['question'], b['position']
+            ))
+            self.emit("insider", {
+                "whale_address": b['wallet'], "timestamp": b['last_ts'], "market_question": b['question'],
+                "position": b['position'], "size_usd": b['value']
+            })
+            self._after_add()
+
+    def update_intel(self, wallet, intel):
+        """Enfileira o resultado do enriquecimento forense de uma carteira já gravada."""
+        with self._lock:
+            self._insider_updates.append((intel['source'], intel['created'], intel['portfolio'], wallet))
+            self._main_updates.append((intel['source'], intel['created'], wallet))
+            self._after_add()
+
+    def emit(self, kind, payload):
+        """Enfileira um evento para o feed ao vivo (gravado junto com o próximo lote do banco principal)."""
+        if not self.live_events:
+            return
+        with self._lock:
+            self._events.append((int(time.time()), kind, json.dumps(payload)))
+            if self._oldest_ts is None:
+                self._oldest_ts = time.time()
+
+    def _after_add(self):
+        if self._oldest_ts is None:
+            self._oldest_ts = time.time()
+        if self.pending() >= self.max_rows:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return (len(self._main_rows) + len(self._insider_rows)
+                    + len(self._main_updates) + len(self._insider_updates))
+
+    # --- GRAVAÇÃO ---
+
+    def maybe_flush(self):
+        """Grava o lote se o registro mais antigo ultrapassou a latência máxima."""
+        with self._lock:
+            if self._oldest_ts is not None and time.time() - self._oldest_ts >= self.max_latency:
+                self.flush()
+
+    def flush(self):
+        """Grava os registros pendentes, uma transação por banco. Retorna False se algum lote voltou para a fila."""
+        with self._lock:
+            batches = {}
+            for db, attrs in QUEUES.items():
+                batches[db] = tuple(getattr(self, attr) for attr in attrs)
+                for attr in attrs:
+                    setattr(self, attr, [])
+            self._oldest_ts = None
+
+            written = True
+            for db, write in (("insider", self._write_insider), ("main", self._write_main)):
+                if any(batches[db]):
+                    written = self._commit(db, write, batches[db]) and written
+            return written
+
+    def _commit(self, db, write, batch):
+        """
+        Grava o lote em um banco. Banco ocupado/travado devolve o lote para a fila
+        (até `max_retries` tentativas seguidas) e retorna False; qualquer outro
+        erro descarta o lote para o arquivo de mensagens mortas.
+        """
+        try:
+            with WRITE_SECONDS.time(db=db):
+                write(*batch)
+        except Exception as e:
+            print(f"!! [Erro] Falha na gravação do {DB_LABELS[db]}: {e}")
+            if is_busy(e) and self._retries[db] < self.max_retries:
+                metrics.error(f"db_{db}_locked")
+                self._retries[db] += 1
+                for attr, rows in zip(QUEUES[db], batch):
+                    setattr(self, attr, list(rows) + getattr(self, attr))
+                self._oldest_ts = time.time()
+                self.stats["requeued"] += 1
+                return False
+            metrics.error(f"db_{db}")
+            self._retries[db] = 0
+            self.stats["dropped"] += 1
+            self._write_dead_letter(db, batch, e)
+            return True
+        self._retries[db] = 0
+        for kind, rows in zip(QUEUE_KINDS[db], batch):
+            ROWS_WRITTEN.inc(len(rows), db=db, kind=kind)
+        return True
+
+    def _write_dead_letter(self, db, batch, error):
+        """Anexa um lote descartado ao arquivo de mensagens mortas."""
+        if not self.dead_letter:
+            return
+        entry = {"ts": int(time.time()), "db": db, "error": str(error)}
+        entry.update({attr.lstrip("_"): rows for attr, rows in zip(QUEUES[db], batch)})
+        try:
+            with open(self.dead_letter, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except (OSError, TypeError, ValueError) as e:
+            metrics.error("db_dead_letter")
+            print(f"!! [Erro] Falha ao gravar lote descartado em {self.dead_letter}: {e}")
+
+    def _write_main(self, rows, updates, events):
+        conn = self.conn_main
+        events = list(events)  # Eventos derivados do lote não voltam para a fila em caso de retry
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(
+                '''INSERT INTO whales (address, first_seen, last_seen, total_volume, funding_source) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(address) DO UPDATE SET
+                       last_seen = excluded.last_seen,
+                       total_volume = total_volume + excluded.total_volume,
+                       funding_source = excluded.funding_source''',
+                [(r[0], r[1], r[2], r[4], r[3]) for r in rows])
+            conn.executemany(
+                '''INSERT INTO bets (whale_address, timestamp, market_question, category, position, size_usd, bet_link, tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                [(r[0], r[2], r[5], r[6], r[7], r[4], r[8], r[9]) for r in rows])
+            velocity = rollups.apply_bets(conn, [(r[0], r[2], r[5], r[4], r[8]) for r in rows])
+            # Enriquecimento tardio: first_seen só é corrigido se ainda estiver como placeholder (0)
+            conn.executemany(
+                '''UPDATE whales SET
+                       funding_source = ?,
+                       first_seen = CASE WHEN first_seen = 0 THEN ? ELSE first_seen END
+                   WHERE address = ?''',
+                updates)
+
+            # Feed ao vivo: apostas novas e incrementos dos buckets de velocidade
+            for r in (rows if self.live_events else ()):
+                events.append((r[2], "bet", json.dumps({
+                    "whale_address": r[0], "timestamp": r[2], "market_question": r[5], "category": r[6],
+                    "position": r[7], "size_usd": r[4], "bet_link": r[8], "funding_source": r[3]
+                })))
+            for bucket, volume in (velocity.items() if self.live_events else ()):
+                events.append((bucket, "velocity", json.dumps({"bucket": bucket, "volume": volume})))
+            if events:
+                conn.executemany("INSERT INTO live_events (ts, kind, payload) VALUES (?, ?, ?)", events)
+                conn.execute("DELETE FROM live_events WHERE id <= (SELECT MAX(id) FROM live_events) - ?",
+                             (self.events_keep,))
+            with COMMIT_SECONDS.time(db="main"):
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _write_insider(self, rows, updates):
+        conn = self.conn_insider
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(
+                '''INSERT INTO intel_whales (address, funding_source, account_created_ts, portfolio_value, total_scanned_volume, last_active_ts) VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(address) DO UPDATE SET
+                       total_scanned_volume = total_scanned_volume + excluded.total_scanned_volume,
+                       last_active_ts = excluded.last_active_ts,
+                       portfolio_value = CASE WHEN excluded.portfolio_value > 0 THEN excluded.portfolio_value ELSE portfolio_value END''',
+                [(r[0], r[1], r[2], r[3], r[4], r[5]) for r in rows])
+            conn.executemany(
+                '''INSERT INTO intel_bets (whale_address, timestamp, market_question, position, size_usd) VALUES (?, ?, ?, ?, ?)''',
+                [(r[0], r[5], r[6], r[7], r[4]) for r in rows])
+            rollups.apply_intel_bets(conn, [r[4] for r in rows])
+            # Colunas desnormalizadas lidas pelo /api/insider_data (evita N+1 no servidor)
+            conn.executemany(
+                '''INSERT INTO intel_wallet_market (whale_address, market_question, total_size) VALUES (?, ?, ?)
+                   ON CONFLICT(whale_address, market_question) DO UPDATE SET total_size = total_size + excluded.total_size''',
+                [(r[0], r[6], r[4]) for r in rows])
+            conn.executemany(
+                '''UPDATE intel_whales SET
+                       max_bet = MAX(IFNULL(max_bet, 0), ?),
+                       top_market = (SELECT market_question FROM intel_wallet_market
+                                     WHERE whale_address = intel_whales.address
+                                     ORDER BY total_size DESC LIMIT 1)
+                   WHERE address = ?''',
+                [(r[4], r[0]) for r in rows])
+            conn.executemany(
+                '''UPDATE intel_whales SET funding_source = ?, account_created_ts = ?, portfolio_value = ? WHERE address = ?''',
+                updates)
+            with COMMIT_SECONDS.time(db="insider"):
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _flush_loop(self):
+        interval = max(0.05, self.max_latency / 2)
+        while not self._stop.wait(interval):
+            try:
+                self.maybe_flush()
+            except Exception as e:
+                metrics.error("db_flush")
+                print(f"!! [Erro] Falha no flush periódico: {e}")
+
+    # --- ENCERRAMENTO ---
+
+    def close(self):
+        """Grava o que restou na fila e fecha as conexões (flush limpo no desligamento)."""
+        if self._closed:
+            return
+        self._stop.set()
+        self._flusher.join(timeout=self.max_latency + 1)
+        with self._lock:
+            self.flush()
+            self.conn_main.close()
+            self.conn_insider.close()
+            self._closed = True
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import threading
+import time
+
+_autocheckpoint = None  # Auto-checkpoint das conexões abertas por connect() neste processo (None = padrão)
+
+
+def set_autocheckpoint(pages):
+    """
+    Define o `wal_autocheckpoint` de todas as conexões que o processo abrir por
+    `connect` (0 quando um WalCheckpointer cuida dos bancos; None volta ao padrão).
+    """
+    global _autocheckpoint
+    _autocheckpoint = pages
+
+
+def connect(db_path, timeout=30.0, **kwargs):
+    """sqlite3.connect em modo WAL, com o auto-checkpoint definido por `set_autocheckpoint`."""
+    conn = sqlite3.connect(db_path, timeout=timeout, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    if _autocheckpoint is not None:
+        conn.execute(f"PRAGMA wal_autocheckpoint={int(_autocheckpoint)};")
+    return conn
+
+
+class WalCheckpointer:
+    """
+    Checkpoints do WAL em segundo plano, fora do caminho de escrita.
+
+    Com o auto-checkpoint padrão do SQLite, o commit que passa de 1000 páginas
+    executa o checkpoint na thread do próprio escritor, travando o ciclo de
+    gravação. O pragma vale por conexão: os processos do scanner chamam
+    `set_autocheckpoint(0)` antes de abrir qualquer banco, todas as conexões de
+    escrita passam por `connect` e esta thread roda checkpoints PASSIVE, que não
+    esperam leitores nem bloqueiam escritores, a cada `interval` segundos.
+    Quando o arquivo -wal passa de `truncate_bytes`, tenta um TRUNCATE com
+    espera curta para devolver o espaço; com leitores ativos, desiste e tenta
+    no próximo ciclo.
+    """
+
+    def __init__(self, db_paths, interval=30, truncate_bytes=64 * 2 ** 20, busy_timeout=0.2):
+        self.db_paths = list(db_paths)
+        self.interval = interval
+        self.truncate_bytes = truncate_bytes
+        self.busy_timeout = busy_timeout
+        self.stats = {"checkpoints": 0, "truncates": 0, "busy": 0, "frames": 0, "max_ms": 0.0}
+
+        self._conns = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _conn(self, path):
+        conn = self._conns.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            self._conns[path] = conn
+        return conn
+
+    def checkpoint(self, path):
+        """Um checkpoint PASSIVE (e TRUNCATE se o -wal estiver grande). Retorna (busy, frames_no_log, copiados)."""
+        conn = self._conn(path)
+        start = time.perf_counter()
+        busy, log, copied = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        self.stats["checkpoints"] += 1
+        self.stats["frames"] += max(copied, 0)
+
+        wal = path + "-wal"
+        if log >= 0 and copied == log and os.path.exists(wal) and os.path.getsize(wal) > self.truncate_bytes:
+            busy, log, copied = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            if busy:
+                self.stats["busy"] += 1
+            else:
+                self.stats["truncates"] += 1
+        self.stats["max_ms"] = max(self.stats["max_ms"], round((time.perf_counter() - start) * 1000, 2))
+        return busy, log, copied
+
+    def run_once(self):
+        for path in self.db_paths:
+            try:
+                self.checkpoint(path)
+            except sqlite3.Error as e:
+                self.stats["busy"] += 1
+                print(f"\n!! [Erro] Falha no checkpoint do WAL ({path}): {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="wal-checkpoint", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def close(self):
+        """Para a thread e executa um último checkpoint (com os escritores já fechados)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        self.run_once()
+        for conn in self._conns.values():
+            conn.close()
+        self._conns.clear()
@@ -0,0 +1,339 @@
+import heapq
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import checkpoint
+
+
+class ClusterBucket:
+    """Acumulação de um cluster em um lado de um mercado, com a contribuição de cada carteira."""
+
+    __slots__ = ("value", "last_ts", "contrib")
+
+    def __init__(self):
+        self.value = 0.0
+        self.last_ts = 0
+        self.contrib = {}
+
+
+class ClusterIndex:
+    """
+    Índice incremental de carteiras coordenadas (union-find).
+
+    Duas carteiras são ligadas quando:
+      - operam o mesmo conditionId e lado com até `window` segundos de
+        diferença, ao menos `min_hits` vezes (co-movimento); ou
+      - compartilham o primeiro financiador (enriquecimento forense).
+
+    Cada trade é comparado apenas com o último trade do mesmo (cid, lado):
+    ligar trades consecutivos dentro da janela gera os mesmos componentes
+    conexos que ligar todos os pares da janela, e cada trade custa O(1)
+    amortizado (find com compressão de caminho, união por tamanho). Clusters nunca passam
+    de `max_size` carteiras, para que market makers não fundam a fita inteira.
+
+    Clusters com 2+ carteiras acumulam por (cid, lado) como um bucket de ladder;
+    ao atingir `trigger` com 2+ contribuintes, `observe` devolve as carteiras
+    envolvidas para que o motor dispare a detecção insider. Como no LadderBook,
+    a expiração usa um min-heap de (última atividade, chave) com entradas
+    obsoletas descartadas de forma preguiçosa: O(expirados · log n) por tick.
+    Acima de `max_wallets` carteiras indexadas, os clusters com atividade
+    menos recente são descartados inteiros (LRU); o mapa de financiadores tem
+    o mesmo teto.
+
+    Com `readonly`, o snapshot é apenas carregado (shards do supervisor: o
+    índice global é gravado pelo processo supervisor via `merge`).
+    """
+
+    def __init__(self, db_path=None, window=60, min_hits=2, max_size=25, trigger=5000, bucket_window=600,
+                 ignore_funders=(), max_pairs=100000, max_wallets=200000, readonly=False):
+        self.window = window
+        self.min_hits = min_hits
+        self.max_size = max_size
+        self.trigger = trigger
+        self.bucket_window = bucket_window
+        self.ignore_funders = {f.lower() for f in ignore_funders}
+        self.max_pairs = max_pairs
+        self.max_wallets = max_wallets
+        self.stats = {"links": 0, "funder_links": 0, "rejected": 0, "triggers": 0, "evicted": 0}
+
+        self._lock = threading.RLock()
+        self._parent = {}
+        self._size = {}
+        self._members = {}  # raiz -> set de carteiras
+        self._reason = {}  # carteira -> motivo da primeira ligação
+        self._funder = {}  # carteira -> financiador
+        self._volume = {}  # raiz -> volume observado
+        self._last_ts = {}  # raiz -> última atividade
+        self._last_hit = {}  # (cid, lado) -> (ts, carteira)
+        self._pairs = OrderedDict()  # (a, b) -> co-ocorrências (LRU limitado)
+        self._funded = OrderedDict()  # financiador -> primeira carteira vista (LRU limitado)
+        self._buckets = {}  # (raiz, cid, lado) -> ClusterBucket
+        self._root_buckets = {}  # raiz -> set de (cid, lado)
+        self._heap = []  # (last_ts, (raiz, cid, lado)) para a expiração dos buckets
+        self._recent = OrderedDict()  # raízes da menos para a mais recentemente ativa
+
+        self.conn = None
+        if db_path is not None:
+            self.conn = checkpoint.connect(db_path, check_same_thread=False)
+            self._load()
+            if readonly:
+                self.conn.close()
+                self.conn = None
+
+    # --- UNION-FIND ---
+
+    def find(self, wallet):
+        parent = self._parent
+        if wallet not in parent:
+            return None
+        while parent[wallet] != wallet:
+            parent[wallet] = parent[parent[wallet]]  # Compressão por halving
+            wallet = parent[wallet]
+        return wallet
+
+    def _add(self, wallet):
+        if wallet not in self._parent:
+            self._parent[wallet] = wallet
+            self._size[wallet] = 1
+            self._members[wallet] = {wallet}
+            self._recent[wallet] = None
+
+    def _touch(self, root):
+        self._recent[root] = None
+        self._recent.move_to_end(root)
+
+    def union(self, a, b, reason):
+        """Liga duas carteiras. Retorna False se já estavam juntas ou se o cluster excederia `max_size`."""
+        with self._lock:
+            self._add(a)
+            self._add(b)
+            ra, rb = self.find(a), self.find(b)
+            if ra == rb:
+                return False
+            if self._size[ra] + self._size[rb] > self.max_size:
+                self.stats["rejected"] += 1
+                return False
+            if self._size[ra] < self._size[rb]:
+                ra, rb = rb, ra
+            self._parent[rb] = ra
+            self._size[ra] += self._size.pop(rb)
+            self._members[ra] |= self._members.pop(rb)
+            self._volume[ra] = self._volume.get(ra, 0.0) + self._volume.pop(rb, 0.0)
+            self._last_ts[ra] = max(self._last_ts.get(ra, 0), self._last_ts.pop(rb, 0))
+            self._recent.pop(rb, None)
+            self._touch(ra)
+            for w in (a, b):
+                self._reason.setdefault(w, reason)
+            self._merge_buckets(ra, rb)
+            self.stats["links"] += 1
+            return True
+
+    def _merge_buckets(self, ra, rb):
+        for cid_side in self._root_buckets.pop(rb, ()):
+            src = self._buckets.pop((rb,) + cid_side)
+            dst = self._buckets.get((ra,) + cid_side)
+            if dst is None:
+                dst = self._buckets[(ra,) + cid_side] = src
+                self._root_buckets.setdefault(ra, set()).add(cid_side)
+            else:
+                dst.value += src.value
+                dst.last_ts = max(dst.last_ts, src.last_ts)
+                for w, usd in src.contrib.items():
+                    dst.contrib[w] = dst.contrib.get(w, 0.0) + usd
+            # Nova chave (raiz mudou): as entradas antigas do heap ficam obsoletas
+            heapq.heappush(self._heap, (dst.last_ts, (ra,) + cid_side))
+
+    # --- LIGAÇÕES ---
+
+    def link_funder(self, wallet, funder):
+        """Liga `wallet` às demais carteiras financiadas pelo mesmo endereço (chamado pelos workers forenses)."""
+        funder = (funder or "").lower()
+        if not funder or funder in self.ignore_funders:
+            return False
+        with self._lock:
+            self._funder[wallet] = funder
+            first = self._funded.setdefault(funder, wallet)
+            self._funded.move_to_end(funder)
+            if len(self._funded) > self.max_wallets:
+                self._funded.popitem(last=False)
+            if first == wallet:
+                return False
+            linked = self.union(first, wallet, "funder")
+            if linked:
+                self.stats["funder_links"] += 1
+            self._evict()
+            return linked
+
+    def observe(self, wallet, cid, side, usd, ts):
+        """
+        Registra um trade relevante. Retorna None ou, se o cluster atingiu o
+        gatilho neste (cid, lado), o dicionário {carteira: valor} dos contribuintes.
+        """
+        if wallet is None:
+            return None
+        with self._lock:
+            key = (cid, side)
+            prev = self._last_hit.get(key)
+            self._last_hit[key] = (ts, wallet)
+            if prev is not None and prev[1] != wallet and ts - prev[0] <= self.window:
+                pair = (prev[1], wallet) if prev[1] < wallet else (wallet, prev[1])
+                hits = self._pairs.pop(pair, 0) + 1
+                if hits >= self.min_hits:
+                    self.union(pair[0], pair[1], "co-trade")
+                else:
+                    self._pairs[pair] = hits
+                    if len(self._pairs) > self.max_pairs:
+                        self._pairs.popitem(last=False)
+
+            self._evict()
+            root = self.find(wallet)
+            if root is None or self._size[root] < 2:
+                return None
+            self._touch(root)
+            self._volume[root] = self._volume.get(root, 0.0) + usd
+            self._last_ts[root] = max(self._last_ts.get(root, 0), ts)
+
+            bucket = self._buckets.get((root, cid, side))
+            if bucket is None or ts - bucket.last_ts > self.bucket_window:
+                bucket = self._buckets[(root, cid, side)] = ClusterBucket()
+                self._root_buckets.setdefault(root, set()).add(key)
+            bucket.value += usd
+            bucket.last_ts = ts
+            bucket.contrib[wallet] = bucket.contrib.get(wallet, 0.0) + usd
+            heapq.heappush(self._heap, (ts, (root, cid, side)))
+            self._maybe_compact()
+
+            if bucket.value >= self.trigger and len(bucket.contrib) >= 2:
+                del self._buckets[(root, cid, side)]
+                self._root_buckets[root].discard(key)
+                self.stats["triggers"] += 1
+                return bucket.contrib
+            return None
+
+    def expire(self, now):
+        """Descarta buckets de cluster sem atividade dentro da janela."""
+        with self._lock:
+            cutoff = now - self.bucket_window
+            while self._heap and self._heap[0][0] < cutoff:
+                ts, key = heapq.heappop(self._heap)
+                b = self._buckets.get(key)
+                # Entrada obsoleta: bucket atualizado depois, disparado, fundido ou recriado
+                if b is None or b.last_ts != ts:
+                    continue
+                del self._buckets[key]
+                self._root_buckets.get(key[0], set()).discard(key[1:])
+
+    def _maybe_compact(self):
+        # Evita que entradas obsoletas façam o heap crescer sem limite
+        if len(self._heap) > 4 * len(self._buckets) + 1024:
+            self._heap = [(b.last_ts, key) for key, b in self._buckets.items()]
+            heapq.heapify(self._heap)
+
+    def _evict(self):
+        """Acima de `max_wallets`, descarta os clusters inteiros com atividade menos recente."""
+        while len(self._parent) > self.max_wallets and self._recent:
+            root, _ = self._recent.popitem(last=False)
+            if self._parent.get(root) != root:
+                continue
+            for w in self._members.pop(root):
+                del self._parent[w]
+                self._reason.pop(w, None)
+                funder = self._funder.pop(w, None)
+                if funder is not None and self._funded.get(funder) == w:
+                    del self._funded[funder]
+            del self._size[root]
+            self._volume.pop(root, None)
+            self._last_ts.pop(root, None)
+            for cid_side in self._root_buckets.pop(root, ()):
+                self._buckets.pop((root,) + cid_side, None)
+            self.stats["evicted"] += 1
+
+    # --- CONSULTA / PERSISTÊNCIA ---
+
+    def cluster_of(self, wallet):
+        with self._lock:
+            root = self.find(wallet)
+            return set(self._members[root]) if root is not None else {wallet}
+
+    def clusters(self, min_size=2):
+        """Lista de clusters (dicts) com ao menos `min_size` carteiras."""
+        with self._lock:
+            result = []
+            for root, members in self._members.items():
+                if len(members) < min_size:
+                    continue
+                result.append({
+                    "id": root, "size": len(members), "volume": round(self._volume.get(root, 0.0), 2),
+                    "last_ts": self._last_ts.get(root, 0),
+                    "members": [{"wallet": w, "reason": self._reason.get(w), "funder": self._funder.get(w)}
+                                for w in sorted(members)],
+                })
+            return result
+
+    def merge(self, clusters):
+        """
+        Incorpora clusters (formato de `clusters()`) vindos de outro índice.
+        O volume de um cluster fundido é o maior volume reportado, já que os
+        snapshots são cumulativos e chegam repetidos.
+        """
+        with self._lock:
+            for c in clusters:
+                members = c["members"]
+                for m in members:
+                    self._add(m["wallet"])
+                    if m["reason"]:
+                        self._reason.setdefault(m["wallet"], m["reason"])
+                    if m["funder"]:
+                        self._funder[m["wallet"]] = m["funder"]
+                        self._funded.setdefault(m["funder"], m["wallet"])
+                head = members[0]["wallet"]
+                for m in members[1:]:
+                    self.union(head, m["wallet"], m["reason"])
+                root = self.find(head)
+                self._volume[root] = max(self._volume.get(root, 0.0), c["volume"])
+                self._last_ts[root] = max(self._last_ts.get(root, 0), c["last_ts"])
+                self._touch(root)
+            self._evict()
+
+    def _load(self):
+        rows = self.conn.execute(
+            "SELECT wallet, cluster_id, reason, funder, volume, last_ts FROM wallet_clusters").fetchall()
+        for wallet, cluster_id, reason, funder, _, _ in rows:
+            if wallet != cluster_id:
+                self.union(cluster_id, wallet, reason)
+            if reason:
+                self._reason[wallet] = reason
+            if funder:
+                self._funder[wallet] = funder
+                self._funded.setdefault(funder, wallet)
+        for wallet, cluster_id, _, _, volume, last_ts in rows:
+            root = self.find(wallet)
+            if root is not None:
+                self._volume[root] = volume or 0.0
+                self._last_ts[root] = last_ts or 0
+        self.stats["links"] = 0
+
+    def save(self):
+        """Grava os clusters com 2+ carteiras na tabela `wallet_clusters` (substitui o snapshot anterior)."""
+        if self.conn is None:
+            return
+        with self._lock:
+            rows = []
+            for c in self.clusters():
+                for m in c["members"]:
+                    rows.append((m["wallet"], c["id"], c["size"], m["reason"], m["funder"], c["volume"], c["last_ts"]))
+            try:
+                self.conn.execute("DELETE FROM wallet_clusters")
+                self.conn.executemany(
+                    '''INSERT INTO wallet_clusters (wallet, cluster_id, size, reason, funder, volume, last_ts)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                print(f"!! [Erro] Falha ao salvar clusters de carteiras: {e}")
+
+    def close(self):
+        self.save()
+        if self.conn is not None:
+            self.conn.close()
@@ -0,0 +1,100 @@
+"""
+Compressão de respostas HTTP (gzip sempre; brotli se o pacote estiver instalado).
+
+Payloads da API passam por `Compressor.encode` com o ETag da entrada do cache:
+cada (ETag, codificação) é comprimido uma única vez por versão dos dados e
+reaproveitado por todas as requisições seguintes. As demais respostas (páginas,
+erros, rotas sem cache) são comprimidas em `Compressor.apply`, no after_request.
+Streams (SSE) e arquivos estáticos servidos em passthrough não são tocados.
+"""
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # Opcional: sem o pacote, apenas gzip
+    brotli = None
+
+COMPRESSIBLE = {
+    "application/json", "text/html", "text/plain", "text/css", "text/javascript",
+    "application/javascript", "image/svg+xml",
+}
+
+
+def supported():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    """Escolhe a codificação pelo header Accept-Encoding (brotli tem preferência). None = identidade."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in supported():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class Compressor:
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, max_entries=1024):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+        self._bodies = OrderedDict()  # (etag, codificação) -> corpo comprimido
+        self._lock = threading.Lock()
+
+    def compress(self, body, encoding):
+        if encoding == "br":
+            out = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            out = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        self.stats["compressed"] += 1
+        self.stats["bytes_in"] += len(body)
+        self.stats["bytes_out"] += len(out)
+        return out
+
+    def encode(self, body, encoding, etag):
+        """Corpo comprimido de uma entrada do cache, memorizado por (ETag, codificação)."""
+        key = (etag, encoding)
+        with self._lock:
+            out = self._bodies.get(key)
+            if out is not None:
+                self._bodies.move_to_end(key)
+                self.stats["hits"] += 1
+                return out
+        out = self.compress(body, encoding)
+        with self._lock:
+            self._bodies[key] = out
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+        return out
+
+    def apply(self, request, response):
+        """after_request: comprime respostas grandes que ainda não foram codificadas."""
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate(request.headers.get("Accept-Encoding"))
+        body = response.get_data()
+        if encoding is None or len(body) < self.min_size:
+            return response
+        response.set_data(self.compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """
+    Limitador de taxa (token bucket) thread-safe.
+    Permite rajadas de até `capacity` chamadas e reabastece `rate` tokens por segundo.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        """Bloqueia até haver tokens disponíveis."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ApiLimiter:
+    """
+    Limites por API externa: concorrência máxima (semáforo) + taxa (token bucket).
+    `limits` mapeia o nome da API para (chamadas_simultâneas, chamadas_por_segundo).
+    """
+
+    def __init__(self, limits):
+        self.semaphores = {name: threading.BoundedSemaphore(c) for name, (c, _) in limits.items()}
+        self.buckets = {name: TokenBucket(r) for name, (_, r) in limits.items()}
+
+    @contextmanager
+    def slot(self, name):
+        sem = self.semaphores.get(name)
+        if sem is None:
+            yield
+            return
+        with sem:
+            self.buckets[name].acquire()
+            yield
+
+
+class EnrichmentPool:
+    """
+    Pool de workers para enriquecimento forense em segundo plano.
+
+    A detecção grava a aposta imediatamente; a carteira entra numa fila limitada
+    e um worker executa `intel_fn(wallet)`, entregando o resultado a `on_result`.
+    Carteiras já enfileiradas não são duplicadas. Com a fila cheia o job é
+    descartado para nunca bloquear a ingestão de trades.
+    """
+
+    def __init__(self, intel_fn, on_result, workers=4, max_queue=500):
+        self.intel_fn = intel_fn
+        self.on_result = on_result
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = {"queued": 0, "done": 0, "dropped": 0, "failed": 0}
+        self._threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._run, name=f"enrich-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, wallet):
+        with self._lock:
+            if wallet in self._pending:
+                return True
+            try:
+                self._queue.put_nowait(wallet)
+            except queue.Full:
+                self.stats["dropped"] += 1
+                return False
+            self._pending.add(wallet)
+            self.stats["queued"] += 1
+            return True
+
+    def backlog(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            wallet = self._queue.get()
+            if wallet is None:
+                self._queue.task_done()
+                return
+            try:
+                intel = self.intel_fn(wallet)
+                self.on_result(wallet, intel)
+                self.stats["done"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"!! [Erro] Falha no enriquecimento forense de {wallet}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(wallet)
+                self._queue.task_done()
+
+    def close(self, timeout=30.0):
+        """Aguarda a fila esvaziar (até `timeout`) e encerra os workers."""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.1)
+        if self._queue.unfinished_tasks:
+            print(f"!! [Aviso] {self._queue.qsize()} enriquecimentos pendentes descartados no encerramento.")
+            with self._lock:
+                while True:
+                    try:
+                        self._queue.get_nowait()
+                        self._queue.task_done()
+                    except queue.Empty:
+                        break
+                self._pending.clear()
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout=1.0)
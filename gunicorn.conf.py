@@ -0,0 +1,63 @@
+"""
+Configuração de produção do servidor:
+
+    gunicorn -c gunicorn.conf.py
+
+Carga do dashboard: leituras SQLite curtas (a maioria servida pelo cache de
+respostas) e conexões SSE de longa duração. Processos contornam o GIL nas
+consultas e na serialização; threads (gthread) seguram as conexões SSE e o
+keep-alive sem bloquear o worker. Cada worker cria a própria aplicação após o
+fork (sem preload), então conexões SQLite e threads nunca atravessam um fork.
+
+Cada cliente SSE prende uma thread até desconectar. Para que abas abertas não
+tomem todas as threads de /api/stats e /api/insider_data, cada worker aceita no
+máximo `threads - SSE_RESERVED_THREADS` clientes SSE (SERVER_SSE_MAX_CLIENTS);
+acima disso o /api/stream responde 503 e o dashboard segue só com o polling.
+
+O master aplica as migrações uma única vez. Com SERVER_READ_REPLICA=1, os
+workers compartilham as réplicas: um deles (eleito por flock) as atualiza e os
+demais apenas as seguem.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2, 8)))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+SSE_RESERVED_THREADS = int(os.getenv("GUNICORN_SSE_RESERVED_THREADS", "4"))  # Threads que o SSE nunca ocupa
+# Lido pelo server.py de cada worker (herda o ambiente do master)
+os.environ.setdefault("SERVER_SSE_MAX_CLIENTS", str(max(1, threads - SSE_RESERVED_THREADS)))
+keepalive = 5
+timeout = 30
+graceful_timeout = 20
+preload_app = False
+max_requests = 20000  # Recicla workers aos poucos (fragmentação de memória de caches e mmap)
+max_requests_jitter = 2000
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")  # Desligado por padrão
+errorlog = "-"
+loglevel = "warning"
+
+wsgi_app = "server:create_app(migrate=False, shared_replica=True)"
+
+
+def on_starting(server):
+    import schema
+    from server import DB_INSIDER, DB_MAIN
+
+    schema.migrate_all(DB_MAIN, DB_INSIDER)
+
+
+def when_ready(server):
+    print(f">> [Sistema] Servidor Online em {bind} ({workers} workers x {threads} threads, "
+          f"até {os.environ['SERVER_SSE_MAX_CLIENTS']} clientes SSE por worker)")
+
+
+def worker_exit(server, worker):
+    from server import METRICS_DIR
+
+    # Workers reciclados (max_requests) não deixam snapshots órfãos para o /metrics
+    try:
+        os.remove(os.path.join(METRICS_DIR, f"server-{worker.pid}.json"))
+    except OSError:
+        pass
@@ -0,0 +1,223 @@
+"""
+Camada HTTP compartilhada para as APIs externas (Gamma, Data API, PolygonScan).
+
+- Uma requests.Session por host, com pool de conexões keep-alive: o handshake
+  TCP+TLS acontece uma vez por conexão do pool, não a cada chamada.
+- Timeout e número de novas tentativas por endpoint. Só falhas transitórias
+  (conexão, timeout, 429, 5xx, resposta de limite de taxa) são repetidas, com
+  backoff exponencial com jitter ("full jitter") e respeitando Retry-After.
+- Orçamento de retries por host: cada chamada deposita `retry_ratio` de um
+  token e cada nova tentativa gasta um, então uma API degradada recebe no
+  máximo ~20% de tráfego extra em vez de uma tempestade de retries.
+- Disjuntor (circuit breaker) por host: após N falhas seguidas as chamadas
+  falham na hora (CircuitOpen) durante o resfriamento; passado o prazo, uma
+  única chamada de teste decide se ele fecha ou reabre com o dobro do prazo.
+- Latência por endpoint em `sentinel_api_call_seconds` (chamada inteira, com
+  retries) e o resultado de cada tentativa em `sentinel_api_requests_total`.
+"""
+import random
+import threading
+import time
+from contextlib import nullcontext
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+API_SECONDS = metrics.REGISTRY.histogram("sentinel_api_call_seconds", "Latência das chamadas às APIs externas (s)",
+                                         ("api", "endpoint"))
+API_REQUESTS = metrics.REGISTRY.counter("sentinel_api_requests_total",
+                                        "Tentativas de chamadas às APIs externas, por resultado",
+                                        ("api", "endpoint", "outcome"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpen(requests.RequestException):
+    """Disjuntor do host aberto: a chamada nem chegou a ser feita."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, cooldown=30.0, max_cooldown=600.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.open_until = 0.0  # 0 = fechado
+        self.probing = False
+        self.stats = {"opened": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if not self.open_until:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def allow(self):
+        with self._lock:
+            if not self.open_until:
+                return True
+            if self.probing or time.monotonic() < self.open_until:
+                self.stats["rejected"] += 1
+                return False
+            self.probing = True  # Meio-aberto: só esta chamada passa
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.probing = False
+            self.cooldown = self.base_cooldown
+
+    def failure(self, retry_after=None):
+        with self._lock:
+            self.failures += 1
+            if self.probing:
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            elif self.failures < self.threshold:
+                return
+            self.probing = False
+            self.open_until = time.monotonic() + max(self.cooldown, retry_after or 0)
+            self.stats["opened"] += 1
+
+
+class RetryBudget:
+    """Retries permitidos em proporção às chamadas (token bucket abastecido pelo tráfego normal)."""
+
+    def __init__(self, ratio=0.2, initial=3.0, cap=20.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = initial
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class ApiHost:
+    def __init__(self, name, base_url, pool_size=10, breaker=None, retry_ratio=0.2):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.breaker = breaker or CircuitBreaker()
+        self.budget = RetryBudget(retry_ratio)
+        self.session = requests.Session()
+        # Retries ficam a cargo do cliente; o adapter só mantém o pool keep-alive
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+
+def _safe(check, response):
+    try:
+        return check(response)
+    except ValueError:  # Corpo não-JSON: o chamador trata
+        return False
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ApiClient:
+    """
+    Cliente das APIs externas. `hosts` mapeia o nome da API para a URL base,
+    `endpoints` mapeia (api, endpoint) para (timeout_s, novas_tentativas) e
+    `breakers` mapeia a API para (falhas_seguidas, resfriamento_s). Com um
+    `limiter` (ApiLimiter), cada tentativa ocupa um slot da API.
+    """
+
+    def __init__(self, hosts, endpoints=None, breakers=None, limiter=None, pool_size=10,
+                 default_timeout=10.0, default_retries=1, backoff=0.5, max_backoff=8.0, retry_ratio=0.2):
+        breakers = breakers or {}
+        self.hosts = {
+            name: ApiHost(name, url, pool_size=pool_size, retry_ratio=retry_ratio,
+                          breaker=CircuitBreaker(*breakers[name]) if name in breakers else None)
+            for name, url in hosts.items()
+        }
+        self.endpoints = dict(endpoints or {})
+        self.limiter = limiter
+        self.default_timeout = default_timeout
+        self.default_retries = default_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def get(self, api, endpoint, path, params=None, throttled=None):
+        """
+        GET com retries e disjuntor. Retorna a resposta final (2xx ou 4xx não
+        transitório); levanta requests.RequestException (CircuitOpen incluso)
+        quando as tentativas acabam. `throttled(response)` identifica limites de
+        taxa sinalizados no corpo de uma resposta 200 (PolygonScan).
+        """
+        host = self.hosts[api]
+        timeout, retries = self.endpoints.get((api, endpoint), (self.default_timeout, self.default_retries))
+        url = host.base_url + path
+        host.budget.deposit()
+        started = time.perf_counter()
+        try:
+            for attempt in range(retries + 1):
+                if not host.breaker.allow():
+                    API_REQUESTS.inc(api=api, endpoint=endpoint, outcome="circuit_open")
+                    raise CircuitOpen(f"{api}: disjuntor aberto ({host.breaker.failures} falhas seguidas)")
+                retry_after = None
+                try:
+                    with self.limiter.slot(api) if self.limiter is not None else nullcontext():
+                        response = host.session.get(url, params=params, timeout=timeout)
+                except requests.RequestException as e:
+                    error, outcome = e, "network"
+                else:
+                    if response.status_code in RETRY_STATUS:
+                        retry_after = _retry_after(response)
+                        outcome = "throttled" if response.status_code == 429 else "http_5xx"
+                        error = requests.HTTPError(f"{response.status_code} em {api}/{endpoint}", response=response)
+                    elif throttled is not None and response.ok and _safe(throttled, response):
+                        outcome = "throttled"
+                        error = requests.HTTPError(f"limite de taxa em {api}/{endpoint}", response=response)
+                    else:
+                        # Respondeu (mesmo 4xx): o host está saudável
+                        host.breaker.success()
+                        API_REQUESTS.inc(api=api, endpoint=endpoint,
+                                         outcome="ok" if response.ok else f"http_{response.status_code // 100}xx")
+                        return response
+
+                host.breaker.failure(retry_after)
+                API_REQUESTS.inc(api=api, endpoint=endpoint, outcome=outcome)
+                if attempt == retries or not host.budget.withdraw():
+                    raise error
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                time.sleep(min(self.max_backoff, max(delay, retry_after or 0)))
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, api=api, endpoint=endpoint)
+
+    def get_json(self, api, endpoint, path, params=None, throttled=None):
+        """Como `get`, levantando HTTPError para respostas não-2xx e devolvendo o JSON."""
+        response = self.get(api, endpoint, path, params=params, throttled=throttled)
+        response.raise_for_status()
+        return response.json()
+
+    def collect(self):
+        """Famílias de métricas dos disjuntores (para o coletor do processo)."""
+        return [
+            ("sentinel_api_circuit_open", "gauge", "Disjuntor da API aberto (1) ou fechado/em teste (0)",
+             [({"api": name}, int(h.breaker.state == "open")) for name, h in self.hosts.items()]),
+            ("sentinel_api_circuit_total", "counter", "Aberturas do disjuntor e chamadas recusadas por ele",
+             [({"api": name, "kind": k}, v) for name, h in self.hosts.items() for k, v in h.breaker.stats.items()]),
+        ]
+
+    def close(self):
+        for host in self.hosts.values():
+            host.session.close()
@@ -0,0 +1,209 @@
+import json
+import time
+from collections import deque
+
+import checkpoint
+
+
+def trade_key(t):
+    """Identidade estável de um trade: id da API ou transactionHash + campos que distinguem fills do mesmo tx."""
+    if t.get('id'):
+        return str(t['id'])
+    return f"{t.get('transactionHash')}:{t.get('asset')}:{t.get('proxyWallet')}:{t.get('side')}:{t.get('size')}:{t.get('price')}"
+
+
+def add_coverage(conn, start, end, cid="*", source="live"):
+    """
+    Registra [start, end] como ingerido (`cid` "*" = todos os mercados monitorados),
+    fundindo com intervalos sobrepostos ou adjacentes. Não faz commit.
+    """
+    if start is None or end is None or end < start:
+        return
+    rows = conn.execute(
+        "SELECT start_ts, end_ts FROM ingest_coverage WHERE cid = ? AND start_ts <= ? AND end_ts >= ?",
+        (cid, end + 1, start - 1)).fetchall()
+    lo, hi = start, end
+    for s, e in rows:
+        lo, hi = min(lo, s), max(hi, e)
+    conn.execute("DELETE FROM ingest_coverage WHERE cid = ? AND start_ts <= ? AND end_ts >= ?",
+                 (cid, end + 1, start - 1))
+    conn.execute("INSERT INTO ingest_coverage (cid, start_ts, end_ts, source) VALUES (?, ?, ?, ?)",
+                 (cid, lo, hi, source))
+
+
+def uncovered(conn, cid, start, end):
+    """Trechos de [start, end] ainda não ingeridos para o mercado (nem pelo loop ao vivo)."""
+    rows = conn.execute(
+        '''SELECT start_ts, end_ts FROM ingest_coverage
+           WHERE cid IN (?, '*') AND start_ts <= ? AND end_ts >= ? ORDER BY start_ts''',
+        (cid, end, start)).fetchall()
+    holes = []
+    cur = start
+    for s, e in rows:
+        if s > cur:
+            holes.append((cur, s - 1))
+        cur = max(cur, e + 1)
+    if cur <= end:
+        holes.append((cur, end))
+    return holes
+
+
+class TradeCursor:
+    """
+    Cursor persistente da ingestão (tabela `ingest_cursor` no banco principal).
+
+    Guarda o maior timestamp processado e as chaves dos trades recentes
+    (janela `overlap` segundos abaixo do cursor), permitindo deduplicar por
+    identidade em vez de timestamp: trades que compartilham o segundo do
+    cursor não são mais descartados. Cada `save` também estende o intervalo
+    contínuo coberto (`covered_from` até `last_ts`) em `ingest_coverage`, que o
+    backfill usa para não reingerir trades; uma lacuna reinicia o intervalo.
+    """
+
+    def __init__(self, db_path, name="trades", overlap=120):
+        self.name = name
+        self.overlap = overlap
+        self.conn = checkpoint.connect(db_path)
+
+        self.last_ts = None
+        self.floor_ts = None  # Tudo até aqui já foi considerado (início sem histórico)
+        self.recent = deque()  # (ts, key) em ordem de chegada
+        self.recent_keys = set()
+
+        row = self.conn.execute("SELECT last_ts, floor_ts, recent_keys FROM ingest_cursor WHERE name = ?", (name,)).fetchone()
+        if row:
+            self.last_ts, self.floor_ts = row[0], row[1]
+            for ts, key in json.loads(row[2] or "[]"):
+                self.recent.append((ts, key))
+                self.recent_keys.add(key)
+        self.covered_from = self.last_ts  # Retomada sem lacuna emenda no intervalo anterior
+
+    def start_at(self, ts):
+        """Inicia um cursor sem histórico: só trades posteriores a `ts` serão ingeridos."""
+        self.last_ts = ts
+        self.floor_ts = ts
+        self.covered_from = ts
+
+    def gap(self, oldest_ts):
+        """A paginação não alcançou o cursor: a cobertura contínua recomeça após o trade mais antigo lido."""
+        self.covered_from = oldest_ts + 1  # O segundo do mais antigo pode ter sido cortado pela página
+
+    def is_seen(self, key, ts):
+        if self.last_ts is None:
+            return False
+        if self.floor_ts is not None and ts <= self.floor_ts:
+            return True
+        if ts < self.last_ts - self.overlap:
+            return True
+        return key in self.recent_keys
+
+    def mark(self, key, ts):
+        self.recent.append((ts, key))
+        self.recent_keys.add(key)
+        if self.last_ts is None or ts > self.last_ts:
+            self.last_ts = ts
+
+    def _prune(self):
+        floor = (self.last_ts or 0) - self.overlap
+        # Remove chaves abaixo da janela de sobreposição (os trades chegam em ordem crescente)
+        while self.recent and self.recent[0][0] < floor:
+            _, key = self.recent.popleft()
+            self.recent_keys.discard(key)
+
+    def save(self):
+        self._prune()
+        if self.covered_from is not None:
+            add_coverage(self.conn, self.covered_from, self.last_ts, source="live")
+        self.conn.execute(
+            '''INSERT INTO ingest_cursor (name, last_ts, floor_ts, recent_keys, updated_ts) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET
+                   last_ts = excluded.last_ts, floor_ts = excluded.floor_ts,
+                   recent_keys = excluded.recent_keys, updated_ts = excluded.updated_ts''',
+            (self.name, self.last_ts, self.floor_ts, json.dumps(list(self.recent)), int(time.time())))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class TradePager:
+    """
+    Busca paginada de trades, do mais novo para o mais antigo, até sobrepor o cursor.
+
+    `fetch_page(limit, offset)` retorna uma lista de trades em ordem decrescente
+    de timestamp. Se `max_pages` acabar antes da sobreposição, o intervalo
+    restante é registrado como lacuna (gap), a ser preenchida pelo backfill.py.
+    """
+
+    def __init__(self, fetch_page, page_size=500, max_pages=10):
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.stats = {"fetched": 0, "new": 0, "deduped": 0, "dropped": 0, "pages": 0, "gaps": 0}
+
+    def fetch_new(self, cursor):
+        """Retorna (trades_novos_do_mais_antigo_para_o_mais_novo, páginas_lidas)."""
+        collected = []
+        pages = 0
+        overlapped = cursor.last_ts is None
+
+        for pages in range(1, self.max_pages + 1):
+            batch = self.fetch_page(self.page_size, (pages - 1) * self.page_size)
+            self.stats["pages"] += 1
+            self.stats["fetched"] += len(batch)
+            collected.extend(batch)
+
+            if len(batch) < self.page_size:
+                overlapped = True  # Fim do histórico disponível
+                break
+            oldest = min(int(t['timestamp']) for t in batch)
+            if cursor.last_ts is None or oldest < cursor.last_ts:
+                overlapped = True
+                break
+
+        if not overlapped:
+            self.stats["gaps"] += 1
+            cursor.gap(min(int(t['timestamp']) for t in collected))
+            print(f"\n!! [Aviso] Lacuna na ingestão: {pages} páginas sem alcançar o cursor.")
+
+        fresh = []
+        batch_keys = set()
+        for t in reversed(collected):  # Processar do mais antigo para o mais novo
+            try:
+                ts = int(t['timestamp'])
+                key = trade_key(t)
+            except (KeyError, TypeError, ValueError):
+                self.stats["dropped"] += 1
+                continue
+            if key in batch_keys or cursor.is_seen(key, ts):
+                self.stats["deduped"] += 1
+                continue
+            batch_keys.add(key)
+            fresh.append((key, ts, t))
+
+        self.stats["new"] += len(fresh)
+        return fresh, pages
+
+
+class PollScheduler:
+    """
+    Intervalo de varredura adaptativo: acelera quando a fita está carregada
+    (várias páginas ou lacunas) e desacelera quando não há trades novos.
+    """
+
+    def __init__(self, base=15.0, min_interval=2.0, max_interval=60.0):
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = base
+
+    def update(self, new_trades, pages, page_size):
+        if pages > 1 or new_trades >= page_size // 2:
+            self.interval = max(self.min_interval, self.interval / 2)
+        elif new_trades == 0:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        elif self.interval < self.base:
+            self.interval = min(self.base, self.interval * 1.25)
+        else:
+            self.interval = max(self.base, self.interval / 1.25)
+        return self.interval
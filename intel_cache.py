@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+
+import checkpoint
+
+
+class WalletIntelCache:
+    """
+    Cache persistente (tabela `wallet_intel_cache` no banco insider) da inteligência de carteiras.
+
+    Cada campo forense é armazenado separadamente com seu próprio TTL:
+    data de criação e primeiro financiador nunca mudam (TTL None = eterno),
+    enquanto o valor do portfólio expira periodicamente. Consultas que falham
+    entram em cache negativo com backoff exponencial, evitando martelar as APIs
+    com carteiras que não retornam dados; enquanto isso, o valor expirado (se
+    houver) continua sendo servido.
+    """
+
+    def __init__(self, db_path, ttls, neg_base=300, neg_max=86400):
+        self.ttls = ttls
+        self.neg_base = neg_base
+        self.neg_max = neg_max
+        self.stats = {"hits": 0, "misses": 0, "negative_hits": 0, "failures": 0, "stale": 0}
+
+        self._lock = threading.Lock()
+        self.conn = checkpoint.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+
+    def lookup(self, wallet, field):
+        """
+        Retorna (status, valor) onde status é:
+        'hit' (valor válido), 'negative' (falha recente, não consultar) ou 'miss'
+        (consultar; o valor é o expirado, se houver, ou None).
+        """
+        now = int(time.time())
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, fetched_ts, retry_after FROM wallet_intel_cache WHERE address = ? AND field = ?",
+                (wallet, field)).fetchone()
+
+            if row is not None:
+                value, fetched_ts, retry_after = row
+                if value is not None:
+                    ttl = self.ttls.get(field)
+                    if ttl is None or now - fetched_ts < ttl:
+                        self.stats["hits"] += 1
+                        return "hit", json.loads(value)
+                if retry_after and now < retry_after:
+                    self.stats["negative_hits"] += 1
+                    return "negative", json.loads(value) if value is not None else None
+
+            self.stats["misses"] += 1
+            return "miss", json.loads(row[0]) if row is not None and row[0] is not None else None
+
+    def store(self, wallet, field, value):
+        with self._lock:
+            self.conn.execute(
+                '''INSERT INTO wallet_intel_cache (address, field, value, fetched_ts, fail_count, retry_after) VALUES (?, ?, ?, ?, 0, 0)
+                   ON CONFLICT(address, field) DO UPDATE SET
+                       value = excluded.value, fetched_ts = excluded.fetched_ts, fail_count = 0, retry_after = 0''',
+                (wallet, field, json.dumps(value), int(time.time())))
+            self.conn.commit()
+
+    def fail(self, wallet, field):
+        """Registra uma consulta falha. O valor antigo (se houver) é mantido como fallback."""
+        now = int(time.time())
+        with self._lock:
+            self.stats["failures"] += 1
+            row = self.conn.execute(
+                "SELECT fail_count FROM wallet_intel_cache WHERE address = ? AND field = ?",
+                (wallet, field)).fetchone()
+            fails = (row[0] if row else 0) + 1
+            retry_after = now + min(self.neg_max, self.neg_base * 2 ** (fails - 1))
+            self.conn.execute(
+                '''INSERT INTO wallet_intel_cache (address, field, value, fetched_ts, fail_count, retry_after) VALUES (?, ?, NULL, ?, ?, ?)
+                   ON CONFLICT(address, field) DO UPDATE SET fail_count = excluded.fail_count, retry_after = excluded.retry_after''',
+                (wallet, field, now, fails, retry_after))
+            self.conn.commit()
+
+    def get_or_fetch(self, wallet, field, fetch):
+        """
+        Consulta o cache e, em caso de miss, executa `fetch(wallet)` (None indica falha).
+        Se a consulta falhar, o campo entra em cache negativo e o valor expirado (se houver) é devolvido.
+        """
+        status, cached = self.lookup(wallet, field)
+        if status != "miss":
+            return cached
+
+        value = fetch(wallet)
+        if value is not None:
+            self.store(wallet, field, value)
+            return value
+        self.fail(wallet, field)
+        if cached is not None:
+            with self._lock:
+                self.stats["stale"] += 1
+        return cached
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["negative_hits"]) / total if total else 0.0
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,177 @@
+import heapq
+import sqlite3
+import sys
+
+import checkpoint
+
+
+class LadderBucket:
+    """Acumulação de uma carteira em um lado de um mercado (ordens fracionadas)."""
+
+    __slots__ = ("wallet", "cid", "side", "market", "value", "last_ts", "tx")
+
+    def __init__(self, wallet, cid, side, market, value=0.0, last_ts=0, tx=None):
+        self.wallet = wallet
+        self.cid = cid
+        self.side = side
+        self.market = market  # Referência à entrada do market_cache (sem copiar strings)
+        self.value = value
+        self.last_ts = last_ts
+        self.tx = tx
+
+    def as_bet(self):
+        """Formato consumido por WhaleSentinel.save_whale."""
+        md = self.market or {}
+        return {
+            "wallet": self.wallet,
+            "question": md.get("q"),
+            "category": md.get("c"),
+            "link": md.get("url"),
+            "position": self.side,
+            "value": self.value,
+            "last_ts": self.last_ts,
+            "tx": self.tx,
+        }
+
+
+class LadderBook:
+    """
+    Armazém de buckets de acumulação com expiração por min-heap.
+
+    Chaves são tuplas internadas (carteira, conditionId, lado). Cada atualização
+    empurra (last_ts, chave) no heap; entradas antigas são descartadas de forma
+    preguiçosa, então cada tick custa O(expirados · log n) em vez de varrer todos
+    os buckets. Ao atingir `max_buckets`, o bucket menos recente é liquidado
+    antecipadamente (tratado como expirado). Os buckets são persistidos na tabela
+    `ladder_buckets` para que um restart não perca acumulações em andamento
+    (`db_path=None` mantém tudo em memória, como no replay). Com `owns`
+    (conditionId -> bool), o livro só carrega e regrava os buckets dos próprios
+    mercados, permitindo que vários shards dividam a mesma tabela.
+    """
+
+    def __init__(self, db_path, window, max_buckets=50000, market_lookup=None, owns=None):
+        self.window = window
+        self.owns = owns
+        self.max_buckets = max_buckets
+        self.market_lookup = market_lookup or (lambda cid: None)
+        self.stats = {"evicted": 0, "expired": 0}
+
+        self._buckets = {}
+        self._heap = []
+
+        self.conn = None
+        if db_path is not None:
+            self.conn = checkpoint.connect(db_path)
+            if owns is not None:
+                self.conn.create_function("ladder_owns", 1, lambda cid: bool(owns(cid)), deterministic=True)
+            self._load()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def __contains__(self, key):
+        return key in self._buckets
+
+    @staticmethod
+    def make_key(wallet, cid, side):
+        return tuple(sys.intern(v) if isinstance(v, str) else v for v in (wallet, cid, side))
+
+    def add(self, wallet, cid, side, usd, ts, tx=None):
+        """
+        Soma `usd` ao bucket da chave, criando-o se necessário.
+        Retorna (bucket, despejados) onde despejados são buckets liquidados pelo limite de memória.
+        """
+        key = self.make_key(wallet, cid, side)
+        b = self._buckets.get(key)
+        evicted = []
+        if b is None:
+            if len(self._buckets) >= self.max_buckets:
+                evicted = self._evict(len(self._buckets) - self.max_buckets + 1)
+            b = LadderBucket(key[0], key[1], key[2], self.market_lookup(cid))
+            self._buckets[key] = b
+
+        b.value += usd
+        b.last_ts = ts
+        b.tx = tx
+        heapq.heappush(self._heap, (ts, key))
+        self._maybe_compact()
+        return b, evicted
+
+    def get(self, wallet, cid, side):
+        return self._buckets.get((wallet, cid, side))
+
+    def remove(self, b):
+        self._buckets.pop((b.wallet, b.cid, b.side), None)
+
+    def pop_expired(self, now):
+        """Remove e retorna os buckets cuja última atividade é anterior a `now - window`."""
+        expired = []
+        cutoff = now - self.window
+        while self._heap and self._heap[0][0] < cutoff:
+            ts, key = heapq.heappop(self._heap)
+            b = self._buckets.get(key)
+            # Entrada obsoleta: o bucket foi atualizado depois (ou já removido)
+            if b is None or b.last_ts != ts:
+                continue
+            del self._buckets[key]
+            expired.append(b)
+        self.stats["expired"] += len(expired)
+        return expired
+
+    def _evict(self, count):
+        evicted = []
+        while self._heap and len(evicted) < count:
+            ts, key = heapq.heappop(self._heap)
+            b = self._buckets.get(key)
+            if b is None or b.last_ts != ts:
+                continue
+            del self._buckets[key]
+            evicted.append(b)
+        self.stats["evicted"] += len(evicted)
+        return evicted
+
+    def _maybe_compact(self):
+        # Evita que entradas obsoletas façam o heap crescer sem limite
+        if len(self._heap) > 4 * len(self._buckets) + 1024:
+            self._heap = [(b.last_ts, key) for key, b in self._buckets.items()]
+            heapq.heapify(self._heap)
+
+    # --- PERSISTÊNCIA ---
+
+    def _load(self):
+        rows = self.conn.execute("SELECT wallet, cid, side, value, last_ts, tx FROM ladder_buckets").fetchall()
+        for wallet, cid, side, value, last_ts, tx in rows:
+            if self.owns is not None and not self.owns(cid):
+                continue
+            key = self.make_key(wallet, cid, side)
+            self._buckets[key] = LadderBucket(key[0], key[1], key[2], None, value, last_ts, tx)
+            self._heap.append((last_ts, key))
+        heapq.heapify(self._heap)
+
+    def resolve_markets(self):
+        """Religa os buckets restaurados às entradas do market_cache (após o mapeamento de mercados)."""
+        for b in self._buckets.values():
+            if b.market is None:
+                b.market = self.market_lookup(b.cid)
+
+    def save(self):
+        """Grava o estado atual (substitui o snapshot anterior em uma transação)."""
+        if self.conn is None:
+            return
+        rows = [(b.wallet, b.cid, b.side, b.value, b.last_ts, b.tx) for b in self._buckets.values()]
+        try:
+            if self.owns is None:
+                self.conn.execute("DELETE FROM ladder_buckets")
+            else:
+                self.conn.execute("DELETE FROM ladder_buckets WHERE ladder_owns(cid)")
+            self.conn.executemany(
+                "INSERT INTO ladder_buckets (wallet, cid, side, value, last_ts, tx) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"!! [Erro] Falha ao salvar buckets de acumulação: {e}")
+
+    def close(self):
+        self.save()
+        if self.conn is not None:
+            self.conn.close()
@@ -0,0 +1,102 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class EventHub:
+    """
+    Leitor único da tabela `live_events` com fan-out para clientes SSE.
+
+    O scanner grava os eventos na mesma transação das apostas. Uma única thread
+    observa `PRAGMA data_version` e, quando há escrita nova, lê apenas as linhas
+    com id maior que o último entregue, formata cada frame SSE uma única vez e o
+    distribui para a fila de cada cliente conectado. Nenhuma consulta por cliente.
+    Um buffer circular dos últimos eventos permite retomar via Last-Event-ID.
+    Com `max_clients`, inscrições além do teto são recusadas (o servidor
+    responde 503 e o dashboard segue com o polling).
+    """
+
+    def __init__(self, db_path, poll_interval=0.25, backlog=1000, client_queue=500, max_clients=0):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.client_queue = client_queue
+        self.max_clients = max_clients  # 0 = sem limite
+        self.stats = {"clients": 0, "events": 0, "dropped_clients": 0, "rejected": 0}
+
+        self._ring = deque(maxlen=backlog)  # (id, frame)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-hub", daemon=True)
+                self._thread.start()
+
+    def subscribe(self, last_event_id=None):
+        """
+        Registra um cliente; se `last_event_id` vier, reenvia os eventos perdidos que ainda estão no buffer.
+        Retorna None se o teto de clientes foi atingido.
+        """
+        self._ensure_started()
+        q = queue.Queue(maxsize=self.client_queue)
+        with self._lock:
+            if self.max_clients and len(self._subscribers) >= self.max_clients:
+                self.stats["rejected"] += 1
+                return None
+            if last_event_id is not None:
+                for event_id, frame in self._ring:
+                    if event_id > last_event_id:
+                        q.put_nowait(frame)
+            self._subscribers.add(q)
+            self.stats["clients"] = len(self._subscribers)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+            self.stats["clients"] = len(self._subscribers)
+
+    def _publish(self, rows):
+        with self._lock:
+            for event_id, kind, payload in rows:
+                frame = f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+                self._ring.append((event_id, frame))
+                for q in list(self._subscribers):
+                    try:
+                        q.put_nowait(frame)
+                    except queue.Full:
+                        # Cliente lento: desconecta para não atrasar os demais (o EventSource reconecta)
+                        self._subscribers.discard(q)
+                        self.stats["dropped_clients"] += 1
+                        try:
+                            q.get_nowait()
+                            q.put_nowait(None)
+                        except (queue.Empty, queue.Full):
+                            pass
+            self.stats["events"] += len(rows)
+            self.stats["clients"] = len(self._subscribers)
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        last_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM live_events").fetchone()[0]
+        version = None
+        while True:
+            try:
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != version:
+                    version = current
+                    while True:
+                        rows = conn.execute(
+                            "SELECT id, kind, payload FROM live_events WHERE id > ? ORDER BY id LIMIT 1000",
+                            (last_id,)).fetchall()
+                        if not rows:
+                            break
+                        last_id = rows[-1][0]
+                        self._publish(rows)
+            except sqlite3.Error as e:
+                print(f"!! [Erro] Falha na leitura do feed ao vivo: {e}")
+            time.sleep(self.poll_interval)
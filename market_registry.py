@@ -0,0 +1,231 @@
+import threading
+import time
+from datetime import datetime
+
+import checkpoint
+
+
+def parse_updated(value):
+    """Converte o `updatedAt` ISO-8601 da Gamma API em epoch (0 se ausente/inválido)."""
+    if not value:
+        return 0
+    try:
+        return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return 0
+
+
+class MarketRegistry:
+    """
+    Registro de mercados monitorados, mantido por sincronização incremental.
+
+    `markets` (conditionId -> {"q", "c", "url"}) e `ids` são estruturas vivas:
+    o scanner guarda referências a elas e as consulta em O(1), enquanto a thread
+    de atualização as altera no lugar. O estado é persistido nas tabelas
+    `market_registry`/`market_registry_state`, então um cold start já parte do
+    último snapshot e a rede só é consultada depois.
+
+    Sincronização completa: pagina todos os eventos ativos das tags configuradas
+    e remove os mercados que não apareceram mais. Incremental: pagina por
+    `updatedAt` decrescente (incluindo fechados) e para ao alcançar a última
+    atualização vista; mercados fechados são removidos.
+    """
+
+    def __init__(self, db_path, fetch_page, tags, page_size=500, max_pages=200,
+                 refresh_interval=300, full_sync_interval=6 * 3600):
+        self.fetch_page = fetch_page
+        self.tags = [t.strip().lower() for t in tags if t.strip()]
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.refresh_interval = refresh_interval
+        self.full_sync_interval = full_sync_interval
+        self.stats = {"syncs": 0, "failures": 0, "consecutive_failures": 0, "added": 0, "removed": 0}
+
+        self.markets = {}
+        self.ids = set()
+        self.last_updated_ts = 0  # Maior updatedAt já aplicado (relógio do servidor)
+        self.last_full_sync_ts = 0
+        self.last_success_ts = 0
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.conn = checkpoint.connect(db_path, check_same_thread=False)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, cid):
+        return cid in self.ids
+
+    def get(self, cid, default=None):
+        return self.markets.get(cid, default)
+
+    # --- PERSISTÊNCIA ---
+
+    def load(self):
+        """
+        Carrega o último snapshot do disco, substituindo o conteúdo em memória
+        (no lugar: as visões vivas continuam válidas). Retorna o número de mercados.
+        """
+        with self._lock:
+            rows = {cid: {"q": q, "c": c, "url": url} for cid, q, c, url in
+                    self.conn.execute("SELECT cid, question, category, url FROM market_registry")}
+            for cid in self.ids - rows.keys():
+                self.ids.discard(cid)
+                self.markets.pop(cid, None)
+            self.markets.update(rows)
+            self.ids.update(rows)
+            row = self.conn.execute(
+                "SELECT last_updated_ts, last_full_sync_ts FROM market_registry_state WHERE id = 1").fetchone()
+            if row:
+                self.last_updated_ts, self.last_full_sync_ts = row[0] or 0, row[1] or 0
+        return len(self.ids)
+
+    def _persist(self, upserts, removed):
+        self.conn.executemany(
+            '''INSERT INTO market_registry (cid, question, category, url, updated_ts) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(cid) DO UPDATE SET
+                   question = excluded.question, category = excluded.category,
+                   url = excluded.url, updated_ts = excluded.updated_ts''',
+            [(cid, m["q"], m["c"], m["url"], ts) for cid, m, ts in upserts])
+        self.conn.executemany("DELETE FROM market_registry WHERE cid = ?", [(cid,) for cid in removed])
+        self.conn.execute(
+            '''INSERT INTO market_registry_state (id, last_updated_ts, last_full_sync_ts) VALUES (1, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET
+                   last_updated_ts = excluded.last_updated_ts, last_full_sync_ts = excluded.last_full_sync_ts''',
+            (self.last_updated_ts, self.last_full_sync_ts))
+        self.conn.commit()
+
+    # --- SINCRONIZAÇÃO ---
+
+    def _matches(self, event):
+        if not self.tags:
+            return True
+        slugs = {(t.get('slug') or '').lower() for t in event.get('tags') or []}
+        return not slugs.isdisjoint(self.tags)
+
+    def _scan(self, full):
+        """
+        Percorre as páginas de eventos. Retorna (ativos, fechados, maior_updated):
+        ativos é uma lista (cid, entrada, updated_ts) e fechados um conjunto de cids.
+        """
+        active, closed = [], set()
+        newest = self.last_updated_ts
+        for tag in self.tags or [None]:
+            for page in range(self.max_pages):
+                params = {"limit": self.page_size, "offset": page * self.page_size}
+                if tag:
+                    params["tag_slug"] = tag
+                if full:
+                    params.update({"active": "true", "closed": "false"})
+                else:
+                    params.update({"order": "updatedAt", "ascending": "false"})
+                events = self.fetch_page(params)
+
+                reached = False
+                for event in events:
+                    updated = parse_updated(event.get('updatedAt'))
+                    newest = max(newest, updated)
+                    if not full and updated and updated < self.last_updated_ts:
+                        reached = True  # Daqui para trás já foi aplicado
+                        continue
+                    if not self._matches(event):
+                        continue
+                    slug = event.get('slug')
+                    event_closed = event.get('closed') or event.get('active') is False
+                    for market in event.get('markets') or []:
+                        c_id = market.get('conditionId')
+                        if not c_id:
+                            continue
+                        if event_closed or market.get('closed') or market.get('active') is False:
+                            closed.add(c_id)
+                            continue
+                        entry = {
+                            "q": market.get('question'),
+                            "c": slug,
+                            "url": f"https://polymarket.com/event/{slug}"
+                        }
+                        active.append((c_id, entry, updated))
+
+                if reached or len(events) < self.page_size:
+                    break
+        return active, closed, newest
+
+    def sync(self, full=False):
+        """
+        Executa uma sincronização. Falhas de rede não alteram o registro
+        (nada é removido por causa de uma resposta vazia ou parcial).
+        Retorna (adicionados, removidos) ou None em caso de falha.
+        """
+        try:
+            active, closed, newest = self._scan(full)
+            if full and not active and self.ids:
+                # Resposta completa vazia é tratada como falha da API, não como "nenhum mercado"
+                raise ValueError("sincronização completa sem eventos")
+        except Exception as e:
+            self.stats["failures"] += 1
+            self.stats["consecutive_failures"] += 1
+            age = f"{(time.time() - self.last_success_ts) / 60:.0f} min" if self.last_success_ts else "nunca"
+            print(f"\n!! [Erro] Falha ao atualizar mapa de mercados ({self.stats['consecutive_failures']}x seguidas, "
+                  f"último sucesso: {age}): {e}")
+            return None
+
+        with self._lock:
+            seen = set()
+            added = 0
+            for c_id, entry, _ in active:
+                seen.add(c_id)
+                if c_id not in self.ids:
+                    added += 1
+                self.markets[c_id] = entry
+                self.ids.add(c_id)
+
+            removed = closed - seen
+            if full:
+                removed |= self.ids - seen
+            removed &= self.ids
+            for c_id in removed:
+                self.ids.discard(c_id)
+                self.markets.pop(c_id, None)
+
+            self.last_updated_ts = newest
+            now = int(time.time())
+            if full:
+                self.last_full_sync_ts = now
+            self._persist(active, removed)
+
+        self.last_success_ts = time.time()
+        self.stats["syncs"] += 1
+        self.stats["consecutive_failures"] = 0
+        self.stats["added"] += added
+        self.stats["removed"] += len(removed)
+        return added, len(removed)
+
+    def refresh(self):
+        """Sincronização completa se a última estiver vencida; caso contrário, incremental."""
+        full = time.time() - self.last_full_sync_ts >= self.full_sync_interval
+        return self.sync(full=full)
+
+    # --- ATUALIZAÇÃO EM SEGUNDO PLANO ---
+
+    def start(self, initial_delay=0):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(initial_delay,), name="market-registry", daemon=True)
+            self._thread.start()
+
+    def _run(self, delay):
+        while not self._stop.wait(delay):
+            result = self.refresh()
+            if result and any(result):
+                print(f"\n>> [Sistema] Mapa de mercados atualizado: +{result[0]} / -{result[1]} "
+                      f"({len(self.ids)} monitorados)")
+            # Em falha, tenta de novo mais cedo
+            delay = self.refresh_interval if result is not None else min(60, self.refresh_interval)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,272 @@
+"""
+Instrumentação do scanner e do servidor: contadores, gauges e histogramas
+expostos no formato de texto do Prometheus (GET /metrics no server.py).
+
+Cada processo (scanner, shards, escritor, workers do gunicorn) registra suas
+métricas no `REGISTRY` do próprio processo. Um `MetricsPublisher` grava o
+snapshot em `<METRICS_DIR>/<processo>.json` a cada poucos segundos (troca
+atômica); o /metrics junta os arquivos recentes e rotula cada série com
+`process`. Contadores de `stats` já existentes nos componentes entram por
+coletores (`Registry.register_collector`), sem instrumentar o caminho quente
+duas vezes.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return [(dict(zip(self.labels, key)), self._export(value)) for key, value in self._values.items()]
+
+    def _export(self, value):
+        return value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa a duração (s) do bloco, mesmo quando ele levanta exceção."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _export(self, value):
+        counts, total, count = value
+        return {"buckets": list(self.buckets), "counts": list(counts), "sum": total, "count": count}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def register_collector(self, fn):
+        """`fn()` devolve famílias (nome, tipo, ajuda, [(labels, valor)]) lidas na hora do snapshot."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def snapshot(self):
+        families = {}
+        with self._lock:
+            metrics, collectors = list(self._metrics.values()), list(self._collectors)
+        for m in metrics:
+            families[m.name] = {"type": m.kind, "help": m.help, "samples": m.samples()}
+        for fn in collectors:
+            try:
+                for name, kind, help, samples in fn():
+                    families[name] = {"type": kind, "help": help, "samples": samples}
+            except Exception as e:
+                error("metrics_collector")
+                print(f"!! [Erro] Falha no coletor de métricas: {e}")
+        return families
+
+
+REGISTRY = Registry()
+
+ERRORS = REGISTRY.counter("sentinel_errors_total", "Falhas tratadas, por categoria", ("category",))
+
+
+def error(category):
+    """Conta uma falha tratada (API, banco, ciclo...) em vez de descartá-la em silêncio."""
+    ERRORS.inc(category=category)
+
+
+def stats_family(name, help, stats, label="kind", kind="counter"):
+    """Família de um dicionário `stats` de componente: uma série por chave."""
+    return name, kind, help, [({label: k}, v) for k, v in stats.items()]
+
+
+# --- PUBLICAÇÃO ENTRE PROCESSOS ---
+
+class MetricsPublisher:
+    """Grava periodicamente o snapshot do registro em `<directory>/<process>.json`."""
+
+    def __init__(self, directory, process, interval=10.0, registry=REGISTRY):
+        self.directory = directory
+        self.process = process
+        self.interval = interval
+        self.registry = registry
+        self.path = os.path.join(directory, f"{process}.json")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self):
+        os.makedirs(self.directory, exist_ok=True)
+        payload = {"process": self.process, "pid": os.getpid(), "ts": time.time(), "families": self.registry.snapshot()}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp, self.path)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-publisher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except OSError as e:
+                error("metrics_publish")
+                print(f"\n!! [Erro] Falha ao publicar métricas ({self.path}): {e}")
+
+    def close(self):
+        """Para a thread e remove o arquivo (o processo deixa de ser exportado)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def collect_dir(directory, max_age=60.0, exclude=()):
+    """Snapshots publicados por outros processos, ignorando os com mais de `max_age` segundos."""
+    snapshots = []
+    now = time.time()
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return snapshots
+    for name in names:
+        if not name.endswith(".json") or name[:-5] in exclude:
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - snap.get("ts", 0) <= max_age:
+            snapshots.append(snap)
+    return snapshots
+
+
+# --- FORMATO DE TEXTO DO PROMETHEUS ---
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(int(value))
+
+
+def render(snapshots):
+    """
+    Texto de exposição do Prometheus para uma lista de snapshots de processos
+    ({"process", "families"}). Famílias iguais de processos diferentes são
+    agrupadas sob um único HELP/TYPE, com o rótulo `process`.
+    """
+    merged = {}
+    for snap in snapshots:
+        for name, family in snap["families"].items():
+            entry = merged.setdefault(name, {"type": family["type"], "help": family["help"], "samples": []})
+            for labels, value in family["samples"]:
+                entry["samples"].append((dict(labels, process=snap["process"]), value))
+
+    lines = []
+    for name in sorted(merged):
+        family = merged[name]
+        lines.append(f"# HELP {name} {_escape(family['help'])}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, value in family["samples"]:
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for le, n in zip(list(value["buckets"]) + ["+Inf"], value["counts"]):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(dict(labels, le=le if le == '+Inf' else repr(float(le))))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(float(value['sum']))}")
+            lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,318 @@
+"""
+Particionamento por tempo e retenção da tabela `bets`.
+
+`bets` (no whale_hunter.db) guarda só a janela quente: as apostas dos últimos
+`hot_days` dias, que é o que o dashboard lê. Linhas mais antigas são movidas
+para arquivos mensais em `directory` (archive/bets_AAAA_MM.db, cada um com uma
+tabela `bets` de mesmo formato), catalogados na tabela `bets_partitions`.
+Partições mais antigas que `retention_days` são compactadas em resumos diários
+por carteira/mercado/posição (`bets_summary`) e o arquivo é apagado.
+
+Os rollups do dashboard são incrementais e não mudam com a movimentação;
+`rollups.rebuild_main` soma bets + partições + resumos, então os totais de toda
+a vida continuam corretos mesmo após uma regeneração.
+
+Consultas históricas usam `attach_history`, que anexa apenas as partições que
+cruzam o intervalo pedido e cria uma visão temporária (UNION ALL) com a tabela
+quente. Partições são mensais para caber no limite de bancos anexados do SQLite.
+
+    python partitions.py --list
+    python partitions.py --archive --compact
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+import checkpoint
+
+BET_COLUMNS = ("id", "whale_address", "timestamp", "market_question", "category", "position", "size_usd",
+               "bet_link", "tx_hash", "processed_by_analyst")
+
+PARTITION_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS bets (
+        id INTEGER PRIMARY KEY,
+        whale_address TEXT,
+        timestamp INTEGER,
+        market_question TEXT,
+        category TEXT,
+        position TEXT,
+        size_usd REAL,
+        bet_link TEXT,
+        tx_hash TEXT,
+        processed_by_analyst BOOLEAN DEFAULT 0
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_bets_timestamp ON bets (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_bets_whale_ts ON bets (whale_address, timestamp)",
+]
+
+# Resumo diário (market_question/position NULL viram '' para o UPSERT encontrar a chave)
+UPSERT_SUMMARY = '''
+    INSERT INTO bets_summary (day, whale_address, market_question, position, category, bet_link,
+                              bets, size_usd, first_ts, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(day, whale_address, market_question, position) DO UPDATE SET
+        bets = bets + excluded.bets,
+        size_usd = size_usd + excluded.size_usd,
+        first_ts = MIN(first_ts, excluded.first_ts),
+        last_ts = MAX(last_ts, excluded.last_ts)
+'''
+SUMMARY_SQL = '''
+    SELECT (timestamp / 86400) * 86400, whale_address, IFNULL(market_question, ''), IFNULL(position, ''),
+           MAX(category), MAX(bet_link), COUNT(*), SUM(size_usd), MIN(timestamp), MAX(timestamp)
+    FROM bets GROUP BY 1, 2, 3, 4
+'''
+
+
+def month_bounds(ts):
+    """(início, fim) em epoch UTC do mês que contém `ts`."""
+    d = datetime.fromtimestamp(ts, timezone.utc)
+    start = datetime(d.year, d.month, 1, tzinfo=timezone.utc)
+    end = datetime(d.year + d.month // 12, d.month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def partition_name(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("bets_%Y_%m")
+
+
+def list_partitions(conn, start_ts=None, end_ts=None, state="archive"):
+    """Partições do catálogo que cruzam [start_ts, end_ts), da mais nova para a mais antiga."""
+    return conn.execute(
+        '''SELECT name, path, start_ts, end_ts, rows, volume, state FROM bets_partitions
+           WHERE state = ? AND end_ts > ? AND start_ts < ? ORDER BY start_ts DESC''',
+        (state, start_ts if start_ts is not None else -1, end_ts if end_ts is not None else 2 ** 62)).fetchall()
+
+
+def attach_history(conn, start_ts=None, end_ts=None, view="bets_history"):
+    """
+    Cria a visão temporária `view` = bets quente + partições que cruzam o intervalo.
+    Retorna os apelidos anexados (para `detach_history`). Fora de transação.
+    """
+    parts = list_partitions(conn, start_ts, end_ts)
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(parts) > limit:
+        raise ValueError(f"{len(parts)} partições no intervalo (limite do SQLite: {limit}); reduza o intervalo")
+    columns = ", ".join(BET_COLUMNS)
+    selects = [f"SELECT {columns} FROM main.bets"]
+    aliases = []
+    for i, (name, path, *_) in enumerate(parts):
+        alias = f"bets_p{i}"
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        aliases.append(alias)
+        selects.append(f"SELECT {columns} FROM {alias}.bets")
+    conn.execute(f"DROP VIEW IF EXISTS temp.{view}")
+    conn.execute(f"CREATE TEMP VIEW {view} AS " + " UNION ALL ".join(selects))
+    return aliases
+
+
+def detach_history(conn, aliases, view="bets_history"):
+    conn.execute(f"DROP VIEW IF EXISTS temp.{view}")
+    for alias in aliases:
+        conn.execute(f"DETACH DATABASE {alias}")
+
+
+class BetsArchive:
+    """
+    Move as apostas antigas de `bets` para as partições mensais e compacta as
+    vencidas. Cada lote de `batch` linhas é copiado (INSERT OR IGNORE pelo id) e
+    só então apagado da tabela quente, em transações curtas com uma pausa entre
+    elas para que o escritor do scanner não espere pelo lock. Uma interrupção no
+    meio deixa no máximo cópias duplicadas, ignoradas na próxima execução.
+    """
+
+    def __init__(self, db_path, directory, hot_days=14, retention_days=180, batch=5000, pause=0.05,
+                 interval=3600):
+        self.db_path = db_path
+        self.directory = directory
+        self.hot_days = hot_days
+        self.retention_days = retention_days
+        self.batch = batch
+        self.pause = pause
+        self.interval = interval
+        self.stats = {"archived": 0, "compacted_partitions": 0, "compacted_rows": 0, "runs": 0}
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        return checkpoint.connect(self.db_path, isolation_level=None)
+
+    def _open_partition(self, ts):
+        """Cria (se preciso) o arquivo da partição de `ts` e sua entrada no catálogo."""
+        start, end = month_bounds(ts)
+        name = partition_name(ts)
+        path = os.path.join(self.directory, f"{name}.db")
+        os.makedirs(self.directory, exist_ok=True)
+        part = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        try:
+            part.execute("PRAGMA journal_mode=WAL;")
+            for ddl in PARTITION_SCHEMA:
+                part.execute(ddl)
+        finally:
+            part.close()
+        return name, path, start, end
+
+    # --- ARQUIVAMENTO ---
+
+    def archive(self, now=None):
+        """Move para as partições as apostas anteriores à janela quente. Retorna o número de linhas."""
+        now = int(time.time() if now is None else now)
+        cutoff = (now - self.hot_days * 86400) // 86400 * 86400
+        columns = ", ".join(BET_COLUMNS)
+        conn = self._connect()
+        moved = 0
+        try:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS _archive_ids (id INTEGER PRIMARY KEY)")
+            while True:
+                oldest = conn.execute("SELECT MIN(timestamp) FROM bets WHERE timestamp < ?", (cutoff,)).fetchone()[0]
+                if oldest is None:
+                    break
+                name, path, start, end = self._open_partition(oldest)
+                upper = min(end, cutoff)
+                conn.execute(
+                    '''INSERT OR IGNORE INTO bets_partitions (name, path, start_ts, end_ts, rows, volume, state, updated_ts)
+                       VALUES (?, ?, ?, ?, 0, 0, 'archive', ?)''', (name, path, start, end, now))
+                conn.execute("ATTACH DATABASE ? AS part", (path,))
+                try:
+                    while not self._stop.is_set():
+                        conn.execute("DELETE FROM _archive_ids")
+                        conn.execute("INSERT INTO _archive_ids SELECT id FROM bets WHERE timestamp >= ? AND timestamp < ? LIMIT ?",
+                                     (start, upper, self.batch))
+                        n, volume = conn.execute(
+                            "SELECT COUNT(*), IFNULL(SUM(size_usd), 0) FROM bets WHERE id IN (SELECT id FROM _archive_ids)").fetchone()
+                        if not n:
+                            break
+                        # 1) cópia (commit na partição)  2) remoção da tabela quente + catálogo
+                        conn.execute("BEGIN IMMEDIATE")
+                        conn.execute(f'''INSERT OR IGNORE INTO part.bets ({columns})
+                                         SELECT {columns} FROM main.bets WHERE id IN (SELECT id FROM _archive_ids)''')
+                        conn.execute("COMMIT")
+                        conn.execute("BEGIN IMMEDIATE")
+                        conn.execute("DELETE FROM main.bets WHERE id IN (SELECT id FROM _archive_ids)")
+                        conn.execute("UPDATE bets_partitions SET rows = rows + ?, volume = volume + ?, updated_ts = ? WHERE name = ?",
+                                     (n, volume, now, name))
+                        conn.execute("COMMIT")
+                        moved += n
+                        self.stats["archived"] += n
+                        time.sleep(self.pause)  # Deixa o escritor do scanner passar
+                finally:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    conn.execute("DETACH DATABASE part")
+                if self._stop.is_set():
+                    break
+        finally:
+            conn.close()
+        return moved
+
+    # --- RETENÇÃO ---
+
+    def compact(self, now=None):
+        """Compacta em `bets_summary` as partições fora da retenção e apaga os arquivos. Retorna as partições."""
+        now = int(time.time() if now is None else now)
+        horizon = now - self.retention_days * 86400
+        conn = self._connect()
+        done = []
+        try:
+            expired = conn.execute(
+                "SELECT name, path FROM bets_partitions WHERE state = 'archive' AND end_ts <= ? ORDER BY start_ts",
+                (horizon,)).fetchall()
+            for name, path in expired:
+                if self._stop.is_set():
+                    break
+                rows = []
+                if os.path.exists(path):
+                    part = sqlite3.connect(path, timeout=30.0)
+                    try:
+                        rows = part.execute(SUMMARY_SQL).fetchall()
+                    finally:
+                        part.close()
+                # Resumo e mudança de estado na mesma transação: nunca somados duas vezes
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(UPSERT_SUMMARY, rows)
+                    conn.execute("UPDATE bets_partitions SET state = 'compacted', updated_ts = ? WHERE name = ?",
+                                 (now, name))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                self.stats["compacted_partitions"] += 1
+                self.stats["compacted_rows"] += sum(r[6] for r in rows)
+                done.append(name)
+            # Arquivos de partições já compactadas (inclusive de uma execução interrompida)
+            for (path,) in conn.execute("SELECT path FROM bets_partitions WHERE state = 'compacted'"):
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+        finally:
+            conn.close()
+        return done
+
+    def run_once(self):
+        try:
+            moved = self.archive()
+            compacted = self.compact()
+            self.stats["runs"] += 1
+            if moved or compacted:
+                print(f"\n>> [Sistema] Retenção de bets: {moved} apostas arquivadas, "
+                      f"{len(compacted)} partição(ões) compactada(s).")
+        except Exception as e:
+            print(f"\n!! [Erro] Falha no arquivamento de bets: {e}")
+
+    # --- EXECUÇÃO EM SEGUNDO PLANO ---
+
+    def start(self, initial_delay=60):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(initial_delay,), name="bets-archive", daemon=True)
+            self._thread.start()
+
+    def _run(self, delay):
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = self.interval
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partições e retenção da tabela bets.")
+    parser.add_argument("--db", default="whale_hunter.db")
+    parser.add_argument("--dir", default="archive", help="Diretório das partições")
+    parser.add_argument("--hot-days", type=int, default=14, help="Dias mantidos na tabela quente")
+    parser.add_argument("--retention-days", type=int, default=180, help="Idade a partir da qual partições são compactadas")
+    parser.add_argument("--archive", action="store_true", help="Move apostas antigas para as partições")
+    parser.add_argument("--compact", action="store_true", help="Compacta partições fora da retenção")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM do banco principal (bloqueia escritas; scanner parado)")
+    parser.add_argument("--list", action="store_true", help="Lista o catálogo de partições")
+    args = parser.parse_args()
+
+    import schema
+    schema.migrate_all(args.db, "insider_intel.db")
+
+    archiver = BetsArchive(args.db, args.dir, hot_days=args.hot_days, retention_days=args.retention_days)
+    if args.archive:
+        print(f">> [Sistema] {archiver.archive():,} apostas arquivadas.")
+    if args.compact:
+        print(f">> [Sistema] Partições compactadas: {', '.join(archiver.compact()) or 'nenhuma'}")
+    if args.vacuum:
+        conn = sqlite3.connect(args.db, timeout=30.0)
+        conn.execute("VACUUM")
+        conn.close()
+        print(">> [Sistema] VACUUM concluído.")
+    if args.list or not (args.archive or args.compact or args.vacuum):
+        conn = sqlite3.connect(args.db, timeout=30.0)
+        hot = conn.execute("SELECT COUNT(*), MIN(timestamp) FROM bets").fetchone()
+        print(f"bets (quente): {hot[0]:,} linhas")
+        for name, path, start, end, rows, volume, state in conn.execute(
+                "SELECT name, path, start_ts, end_ts, rows, volume, state FROM bets_partitions ORDER BY start_ts"):
+            print(f"{name}  {state:<10} {rows:>12,} linhas  ${volume:>16,.2f}  {path}")
+        conn.close()
@@ -0,0 +1,182 @@
+import time
+
+# Limites usados pela classificação (nomes iguais às constantes do scanner)
+THRESHOLD_KEYS = (
+    "STREAM_NOISE_FLOOR",
+    "STREAM_MIN_SIZE",
+    "ACCUMULATION_FLOOR",
+    "LADDER_WINDOW",
+    "INSIDER_TRIGGER",
+    "CRITICAL_TRIGGER",
+)
+# Parâmetros das linhas de base dos gatilhos adaptativos (AnomalyScorer)
+ANOMALY_KEYS = (
+    "ANOMALY_HALFLIFE",
+    "ANOMALY_WARMUP",
+    "ANOMALY_Z_INSIDER",
+    "ANOMALY_Z_CRITICAL",
+    "ANOMALY_MIN_USD",
+    "ANOMALY_QUANTILE",
+)
+# Parâmetros do índice de clusters de carteiras (ClusterIndex)
+CLUSTER_KEYS = (
+    "CLUSTER_WINDOW",
+    "CLUSTER_MIN_HITS",
+    "CLUSTER_MAX_SIZE",
+    "CLUSTER_TRIGGER",
+)
+
+
+class DualPipeline:
+    """
+    Motor de classificação do Duplo Pipeline, compartilhado pelo scanner ao vivo e pelo replay.
+
+    Recebe trades já deduplicados e decide entre Stream (aposta direta), agregação
+    em bucket (ladder) e gatilho crítico. O destino das detecções é o `sink`, que
+    implementa `save_whale(b, is_insider)` e `emit(kind, payload)`. O tempo vem de
+    `clock()`: `time.time` ao vivo, um relógio virtual no replay. Com um
+    `clusters` (ClusterIndex), a acumulação de carteiras ligadas também dispara
+    a detecção insider. Com um `scorer` (AnomalyScorer), os gatilhos insider e
+    crítico passam a ser os adaptativos de cada mercado; INSIDER_TRIGGER e
+    CRITICAL_TRIGGER valem só enquanto o mercado aquece.
+    """
+
+    def __init__(self, thresholds, market_cache, market_ids, ladder, sink, clock=time.time, clusters=None,
+                 scorer=None):
+        missing = [k for k in THRESHOLD_KEYS if k not in thresholds]
+        if missing:
+            raise ValueError(f"Limites ausentes: {', '.join(missing)}")
+        self.thresholds = dict(thresholds)
+        self.noise_floor = thresholds["STREAM_NOISE_FLOOR"]
+        self.stream_min = thresholds["STREAM_MIN_SIZE"]
+        self.accumulation_floor = thresholds["ACCUMULATION_FLOOR"]
+        self.insider_trigger = thresholds["INSIDER_TRIGGER"]
+        self.critical_trigger = thresholds["CRITICAL_TRIGGER"]
+
+        self.market_cache = market_cache
+        self.market_ids = market_ids
+        self.ladder = ladder
+        self.ladder.window = thresholds["LADDER_WINDOW"]
+        self.sink = sink
+        self.clock = clock
+        self.clusters = clusters
+        self.scorer = scorer
+        self.stats = {"trades": 0, "noise": 0, "filtered": 0, "stream": 0, "ladder_updates": 0,
+                      "settled_retail": 0, "settled_insider": 0, "critical": 0, "evicted": 0, "cluster": 0,
+                      "anomaly": 0}
+
+    def triggers(self, cid):
+        """(gatilho insider, gatilho crítico) em USD para o mercado."""
+        if self.scorer is None:
+            return self.insider_trigger, self.critical_trigger
+        return self.scorer.triggers(cid)
+
+    def flag(self, b, is_insider):
+        """Grava a detecção; quando o mercado já tem linha de base, publica também a pontuação da anomalia."""
+        bet = b.as_bet()
+        if is_insider and self.scorer is not None:
+            score = self.scorer.score(b.cid, b.value)
+            if score is not None:
+                self.stats["anomaly"] += 1
+                self.sink.emit("anomaly", dict(score, whale_address=b.wallet, market_question=bet["question"],
+                                               position=b.side, value=round(b.value, 2), last_ts=b.last_ts))
+        self.sink.save_whale(bet, is_insider=is_insider)
+
+    def ingest(self, t, ts):
+        """Classifica um trade novo nos pipelines Stream/Insider."""
+        self.stats["trades"] += 1
+        usd = float(t['size']) * float(t['price'])
+        if usd < self.noise_floor:
+            self.stats["noise"] += 1
+            return
+
+        cid = t.get('conditionId')
+        if cid not in self.market_ids:
+            self.stats["filtered"] += 1
+            return
+
+        if self.scorer is not None:
+            self.scorer.observe(cid, usd, ts)
+
+        wallet = t.get('proxyWallet') or t.get('taker')
+        side = f"{t['side']} {t['outcome']}"
+
+        # --- LÓGICA DE DUPLO PIPELINE ---
+
+        # 1. PIPELINE STREAM (Instantâneo > $20)
+        # Ingestão direta para feedback visual, ignorando a lógica de agregação
+        if usd >= self.stream_min and usd < self.accumulation_floor:
+            md = self.market_cache.get(cid, {})
+            temp_b = {
+                "wallet": wallet,
+                "question": md.get("q", "..."),
+                "category": md.get("c", "Politics"),
+                "link": md.get("url", "#"),
+                "position": side,
+                "value": usd,
+                "last_ts": ts,
+                "tx": t.get('transactionHash')
+            }
+            self.stats["stream"] += 1
+            self.sink.save_whale(temp_b, is_insider=False)
+            return
+
+        # 2. PIPELINE INSIDER (Acumulação > $500)
+        # Agregação em bucket para detectar ordens fracionadas (split orders)
+        if usd >= self.accumulation_floor:
+            b, evicted = self.ladder.add(wallet, cid, side, usd, ts, t.get('transactionHash'))
+            self.stats["ladder_updates"] += 1
+            for old in evicted:
+                self.stats["evicted"] += 1
+                self.settle(old)
+
+            self.sink.emit("ladder", {
+                "whale_address": wallet, "market_question": (b.market or {}).get("q"), "position": side,
+                "value": b.value, "last_ts": ts
+            })
+
+            # GATILHO DE LIMITE CRÍTICO
+            if b.value >= self.triggers(cid)[1]:
+                self.stats["critical"] += 1
+                self.flag(b, is_insider=True)
+                self.ladder.remove(b)
+
+            # GATILHO DE CLUSTER: carteiras ligadas somando o limite crítico juntas
+            if self.clusters is not None:
+                contrib = self.clusters.observe(wallet, cid, side, usd, ts)
+                if contrib:
+                    self.settle_cluster(cid, side, contrib, b)
+
+    def settle_cluster(self, cid, side, contrib, b):
+        """Liquida como insider os buckets de cada carteira do cluster neste (cid, lado)."""
+        self.stats["cluster"] += 1
+        self.sink.emit("cluster", {
+            "market_question": (b.market or {}).get("q"), "position": side,
+            "value": round(sum(contrib.values()), 2), "wallets": sorted(contrib)
+        })
+        for member in contrib:
+            mb = self.ladder.get(member, cid, side)
+            if mb is not None:
+                # Mesmo caminho de `settle`: pontuação da anomalia e contagem como insider liquidado
+                self.stats["settled_insider"] += 1
+                self.flag(mb, is_insider=True)
+                self.ladder.remove(mb)
+
+    def settle(self, b):
+        """Janela encerrada (expiração ou despejo). Verificar contra os limites (thresholds)."""
+        if b.value >= self.triggers(b.cid)[0]:
+            self.stats["settled_insider"] += 1
+            self.flag(b, is_insider=True)
+        elif b.value >= self.stream_min:
+            self.stats["settled_retail"] += 1
+            self.sink.save_whale(b.as_bet(), is_insider=False)
+
+    def tick(self, now=None):
+        """Avalia os buckets de agregação contra a janela de tempo. Retorna quantos foram liquidados."""
+        now = int(self.clock() if now is None else now)
+        expired = self.ladder.pop_expired(now)
+        for b in expired:
+            self.settle(b)
+        if self.clusters is not None:
+            self.clusters.expire(now)
+        return len(expired)
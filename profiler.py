@@ -0,0 +1,101 @@
+"""
+Profiler por amostragem (opcional), ligado e desligado em tempo de execução.
+
+Uma thread lê `sys._current_frames()` a cada `interval` segundos e conta as
+pilhas de todas as outras threads do processo. Ao desligar, grava as pilhas no
+formato "folded" (uma linha `thread;arquivo:função;... contagem`), aceito por
+flamegraph.pl, speedscope e inferno, e imprime as funções mais amostradas.
+
+    kill -USR2 <pid>   # liga; o segundo sinal desliga e grava o perfil
+
+Custo proporcional à frequência de amostragem e nulo enquanto desligado.
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    def __init__(self, out_dir, process, interval=0.005, max_depth=64):
+        self.out_dir = out_dir
+        self.process = process
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.started_ts = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.samples = Counter()
+        self.started_ts = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        print(f"\n>> [Sistema] Profiler ligado ({self.process}, amostra a cada {self.interval * 1000:.0f}ms)")
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        """Desliga e grava o perfil. Retorna o caminho do arquivo (ou None sem amostras)."""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if not self.samples:
+            return None
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_ts))
+        path = os.path.join(self.out_dir, f"{self.process}-{stamp}.folded")
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # Tempo "próprio": a função no topo de cada pilha amostrada
+        leaf = Counter()
+        for stack, count in self.samples.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaf.values())
+        print(f"\n>> [Sistema] Profiler desligado: {total} amostras em {time.time() - self.started_ts:.0f}s -> {path}")
+        for fn, count in leaf.most_common(10):
+            print(f"   {count / total * 100:5.1f}%  {fn}")
+        return path
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+
+def install_toggle(profiler, signum=getattr(signal, "SIGUSR2", None)):
+    """Liga/desliga o profiler a cada sinal. Só funciona na thread principal (sem efeito fora dela)."""
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+    # O handler só sinaliza; start/stop rodam numa thread para não bloquear o loop interrompido
+    signal.signal(signum, lambda *_: threading.Thread(target=profiler.toggle, daemon=True).start())
+    return True
@@ -0,0 +1,390 @@
+"""
+Replay offline de fitas de trades pelo mesmo motor de classificação do scanner.
+
+Uso:
+    python replay.py fita.jsonl                                  # limites atuais do scanner
+    python replay.py fita.csv --set INSIDER_TRIGGER=2500 --db /tmp/replay
+    python replay.py fita.jsonl --sweep INSIDER_TRIGGER=2000,3000,4000 \\
+                                --sweep LADDER_WINDOW=300,600,1200 --workers 8
+    python replay.py fita.jsonl --sweep ANOMALY_Z_INSIDER=2.5,3,3.5   # gatilhos adaptativos
+    python replay.py fita.jsonl --no-scoring --sweep CRITICAL_TRIGGER=4000,5000
+
+Fitas: JSONL (um trade ou uma resposta inteira do /trades por linha), CSV com as
+colunas do /trades, Parquet (requer pyarrow) ou fitas .ptape gravadas pelo
+scanner (um arquivo ou um diretório inteiro). O tempo é um relógio virtual
+avançado pelos timestamps dos trades, então horas de fita rodam em segundos.
+Os mercados monitorados vêm do snapshot do registro (`--markets-db`) ou, com
+`--all-markets`, todos os conditionIds são aceitos. Como ao vivo, a acumulação
+de carteiras ligadas (índice de clusters em memória, CLUSTER_*) também dispara
+a detecção insider. Com ANOMALY_SCORING ligado
+no scanner, os gatilhos são os adaptativos (linhas de base em memória com os
+mesmos ANOMALY_*, que também podem ser varridos); `--no-scoring` volta aos
+gatilhos fixos.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import schema
+import tape
+from bet_writer import BetWriter
+from ingest import trade_key
+from ladder import LadderBook
+from clusters import ClusterIndex
+from pipeline import ANOMALY_KEYS, CLUSTER_KEYS, THRESHOLD_KEYS, DualPipeline
+from scoring import AnomalyScorer
+
+DEFAULT_TICK = 15  # Intervalo virtual entre avaliações dos buckets (como o POLL_BASE_INTERVAL)
+
+
+class VirtualClock:
+    """Relógio controlado pelo replay; substitui `time.time` no motor."""
+
+    def __init__(self, start=0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class AllMarkets:
+    """Conjunto que aceita qualquer conditionId (replay sem filtro de tags)."""
+
+    def __contains__(self, cid):
+        return cid is not None
+
+    def __len__(self):
+        return 0
+
+
+class MemorySink:
+    """Destino em memória: conta as detecções sem tocar em disco."""
+
+    def __init__(self, keep_detections=True):
+        self.keep_detections = keep_detections
+        self.detections = []
+        self.insider_wallets = set()
+        self.insider_volume = 0.0
+        self.stream_volume = 0.0
+        self.events = 0
+
+    def save_whale(self, b, is_insider):
+        if is_insider:
+            self.insider_wallets.add(b['wallet'])
+            self.insider_volume += b['value']
+            if self.keep_detections:
+                self.detections.append({"wallet": b['wallet'], "question": b['question'], "position": b['position'],
+                                        "value": round(b['value'], 2), "last_ts": b['last_ts']})
+        else:
+            self.stream_volume += b['value']
+
+    def emit(self, kind, payload):
+        self.events += 1
+
+    def summary(self):
+        return {"insider_wallets": len(self.insider_wallets), "insider_volume": round(self.insider_volume, 2),
+                "stream_volume": round(self.stream_volume, 2)}
+
+    def close(self):
+        pass
+
+
+class DBSink(MemorySink):
+    """Destino em bancos de rascunho com o mesmo esquema e o mesmo BetWriter do scanner."""
+
+    def __init__(self, db_main, db_insider, clock, source="Replay", max_rows=2000, live_events=True):
+        super().__init__(keep_detections=False)
+        schema.migrate_all(db_main, db_insider)
+        self.clock = clock
+        self.source = source
+        # Latência alta: o replay grava por volume e no fechamento
+        self.writer = BetWriter(db_main, db_insider, max_rows=max_rows, max_latency=3600, live_events=live_events)
+
+    def save_whale(self, b, is_insider):
+        super().save_whale(b, is_insider)
+        if is_insider:
+            intel = {"source": self.source, "created": 0, "portfolio": 0}
+            self.writer.add_insider(b, intel)
+        else:
+            intel = {"source": "Varejo", "created": int(self.clock()), "portfolio": 0}
+        self.writer.add_bet(b, intel)
+
+    def emit(self, kind, payload):
+        super().emit(kind, payload)
+        self.writer.emit(kind, payload)
+
+    def close(self):
+        self.writer.close()
+
+
+# --- FITAS ---
+
+def _iter_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, list):
+                yield from record
+            else:
+                yield record
+
+
+def _iter_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _iter_parquet(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("!! [Erro] Fitas Parquet requerem o pacote pyarrow (pip install pyarrow).")
+    for batch in pq.ParquetFile(path).iter_batches():
+        yield from batch.to_pylist()
+
+
+TAPE_READERS = {".jsonl": _iter_jsonl, ".json": _iter_jsonl, ".csv": _iter_csv, ".parquet": _iter_parquet,
+                ".ptape": tape.iter_trades}
+
+
+def read_tape(path):
+    """Itera os trades brutos de uma fita, escolhendo o leitor pela extensão."""
+    if os.path.isdir(path):
+        return tape.iter_trades(path)
+    ext = os.path.splitext(path)[1].lower()
+    reader = TAPE_READERS.get(ext)
+    if reader is None:
+        raise SystemExit(f"!! [Erro] Formato de fita não suportado: {ext}")
+    return reader(path)
+
+
+def load_tape(path):
+    """
+    Carrega a fita em ordem cronológica, deduplicada pela mesma identidade da
+    ingestão ao vivo (respostas sobrepostas do /trades repetem trades).
+    Retorna (trades [(ts, trade)], descartados).
+    """
+    trades = []
+    seen = set()
+    dropped = 0
+    for t in read_tape(path):
+        try:
+            ts = int(float(t['timestamp']))
+            key = trade_key(t)
+        except (KeyError, TypeError, ValueError):
+            dropped += 1
+            continue
+        if key in seen:
+            continue
+        seen.add(key)
+        trades.append((ts, t))
+    trades.sort(key=lambda item: item[0])
+    return trades, dropped
+
+
+def load_markets(db_path):
+    """Mercados monitorados a partir do snapshot do registro de mercados."""
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        rows = conn.execute("SELECT cid, question, category, url FROM market_registry").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    markets = {cid: {"q": q, "c": c, "url": url} for cid, q, c, url in rows}
+    return markets, set(markets)
+
+
+# --- REPLAY ---
+
+def make_scorer(config):
+    """Linhas de base em memória com os ANOMALY_* de `config` (aquecidas pela própria fita)."""
+    return AnomalyScorer(None, fixed=(config["INSIDER_TRIGGER"], config["CRITICAL_TRIGGER"]),
+                         halflife=config["ANOMALY_HALFLIFE"], warmup=config["ANOMALY_WARMUP"],
+                         z_insider=config["ANOMALY_Z_INSIDER"], z_critical=config["ANOMALY_Z_CRITICAL"],
+                         min_usd=config["ANOMALY_MIN_USD"], quantile=config["ANOMALY_QUANTILE"])
+
+
+def make_clusters(config):
+    """Índice de clusters em memória com os CLUSTER_* de `config` (ligações por co-trade vistas na fita)."""
+    return ClusterIndex(None, window=config["CLUSTER_WINDOW"], min_hits=config["CLUSTER_MIN_HITS"],
+                        max_size=config["CLUSTER_MAX_SIZE"], trigger=config["CLUSTER_TRIGGER"],
+                        bucket_window=config["LADDER_WINDOW"])
+
+
+def replay(trades, thresholds, markets, market_ids, sink=None, clock=None, tick=DEFAULT_TICK,
+           max_buckets=50000, settle_at_end=True, scorer=None, clusters=None, close_sink=True):
+    """
+    Reproduz `trades` (ordenados) pelo DualPipeline. Retorna um dicionário com as
+    estatísticas do motor, o resumo do destino e a velocidade relativa ao tempo real.
+    Com `close_sink=False` o destino continua aberto para chamadas seguintes (backfill).
+    """
+    clock = clock or VirtualClock()
+    keys = THRESHOLD_KEYS + (ANOMALY_KEYS if scorer is not None else ()) + (CLUSTER_KEYS if clusters is not None else ())
+    sink = sink if sink is not None else MemorySink()
+    ladder = LadderBook(None, thresholds["LADDER_WINDOW"], max_buckets=max_buckets, market_lookup=markets.get)
+    engine = DualPipeline(thresholds, markets, market_ids, ladder, sink, clock=clock, clusters=clusters,
+                          scorer=scorer)
+
+    started = time.perf_counter()
+    next_tick = None
+    errors = 0
+    for ts, t in trades:
+        clock.now = ts
+        if next_tick is None:
+            next_tick = ts + tick
+        elif ts >= next_tick:
+            # Mesma cadência do loop ao vivo: buckets avaliados antes de cada varredura
+            engine.tick()
+            next_tick = ts + tick
+        try:
+            engine.ingest(t, ts)
+        except (KeyError, TypeError, ValueError):
+            errors += 1
+
+    if settle_at_end and trades:
+        # Fim da fita: encerra as janelas ainda abertas
+        clock.now = trades[-1][0] + thresholds["LADDER_WINDOW"] + 1
+        engine.tick()
+    if close_sink:
+        sink.close()
+
+    elapsed = time.perf_counter() - started
+    span = trades[-1][0] - trades[0][0] if trades else 0
+    return {
+        "thresholds": {k: thresholds[k] for k in keys if k in thresholds},
+        "scoring": scorer is not None,
+        "stats": dict(engine.stats, malformed=errors, open_buckets=len(ladder)),
+        "sink": sink.summary(),
+        "elapsed_s": round(elapsed, 3),
+        "trades_per_s": round(len(trades) / elapsed) if elapsed else None,
+        "speedup": round(span / elapsed, 1) if elapsed else None,
+    }
+
+
+# --- VARREDURA DE PARÂMETROS (PROCESS POOL) ---
+
+_worker_state = {}
+
+
+def _init_worker(tape_path, markets_db, all_markets):
+    trades, _ = load_tape(tape_path)
+    if all_markets:
+        markets, ids = {}, AllMarkets()
+    else:
+        markets, ids = load_markets(markets_db)
+    _worker_state.update(trades=trades, markets=markets, ids=ids)
+
+
+def _run_config(args):
+    config, tick, scoring = args
+    st = _worker_state
+    # Linhas de base e clusters novos por configuração: cada uma aquece com a fita inteira, como no replay simples
+    return replay(st["trades"], config, st["markets"], st["ids"], sink=MemorySink(keep_detections=False),
+                  tick=tick, scorer=make_scorer(config) if scoring else None, clusters=make_clusters(config))
+
+
+def sweep(tape_path, base, grid, markets_db, all_markets, workers=None, tick=DEFAULT_TICK, scoring=False):
+    """
+    Executa o produto cartesiano de `grid` ({chave: [valores]}) em paralelo. Cada worker carrega a fita uma vez.
+    Com `scoring`, cada configuração usa gatilhos adaptativos com os ANOMALY_* dela.
+    """
+    keys = list(grid)
+    configs = [dict(base, **dict(zip(keys, values))) for values in itertools.product(*(grid[k] for k in keys))]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(tape_path, markets_db, all_markets)) as pool:
+        return list(pool.map(_run_config, [(c, tick, scoring) for c in configs]))
+
+
+def _parse_number(value):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _parse_assignment(text, multi=False, keys=THRESHOLD_KEYS):
+    key, _, value = text.partition("=")
+    key = key.strip().upper()
+    if key not in keys or not value:
+        raise SystemExit(f"!! [Erro] Parâmetro inválido '{text}'. Use CHAVE=valor com CHAVE em: {', '.join(keys)}")
+    if multi:
+        return key, [_parse_number(v) for v in value.split(",") if v.strip()]
+    return key, _parse_number(value)
+
+
+def print_report(results, grid_keys):
+    cols = grid_keys or ["INSIDER_TRIGGER", "CRITICAL_TRIGGER", "LADDER_WINDOW"]
+    header = " | ".join(f"{c:>18}" for c in cols)
+    print(f"{header} | {'stream':>8} | {'varejo':>7} | {'insider':>7} | {'crítico':>7} | {'cluster':>7} | "
+          f"{'carteiras':>9} | {'vol. insider':>14}")
+    for r in results:
+        st, sk = r["stats"], r["sink"]
+        values = " | ".join(f"{r['thresholds'][c]:>18}" for c in cols)
+        print(f"{values} | {st['stream']:>8} | {st['settled_retail']:>7} | {st['settled_insider']:>7} | "
+              f"{st['critical']:>7} | {st['cluster']:>7} | {sk['insider_wallets']:>9} | {sk['insider_volume']:>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay/backtest do Duplo Pipeline sobre fitas de trades.")
+    parser.add_argument("tape", help="Fita de trades (.jsonl, .csv, .parquet, .ptape ou diretório de .ptape)")
+    parser.add_argument("--set", action="append", default=[], metavar="CHAVE=valor", help="Sobrescreve um limite")
+    parser.add_argument("--sweep", action="append", default=[], metavar="CHAVE=v1,v2", help="Varre valores de um limite")
+    parser.add_argument("--markets-db", default="whale_hunter.db", help="Banco com o snapshot do registro de mercados")
+    parser.add_argument("--all-markets", action="store_true", help="Aceita todos os mercados (sem filtro de tags)")
+    parser.add_argument("--tick", type=int, default=DEFAULT_TICK, help="Intervalo virtual (s) entre avaliações dos buckets")
+    parser.add_argument("--db", help="Diretório para bancos de rascunho (replay simples; padrão: em memória)")
+    parser.add_argument("--no-scoring", action="store_true",
+                        help="Gatilhos fixos (INSIDER/CRITICAL_TRIGGER) mesmo com ANOMALY_SCORING ligado")
+    parser.add_argument("--workers", type=int, default=None, help="Processos da varredura (padrão: CPUs)")
+    parser.add_argument("--json", help="Grava os resultados em JSON neste arquivo")
+    args = parser.parse_args()
+
+    # Os valores atuais do scanner são a base de qualquer configuração
+    from PolyInsideScanner import ANOMALY_SCORING, ANOMALY_SETTINGS, CLUSTER_SETTINGS, THRESHOLDS
+    scoring = ANOMALY_SCORING and not args.no_scoring
+    keys = THRESHOLD_KEYS + CLUSTER_KEYS + (ANOMALY_KEYS if scoring else ())
+    base = dict(THRESHOLDS, **CLUSTER_SETTINGS, **ANOMALY_SETTINGS)
+    base.update(_parse_assignment(a, keys=keys) for a in args.set)
+    grid = dict(_parse_assignment(a, multi=True, keys=keys) for a in args.sweep)
+
+    if grid:
+        results = sweep(args.tape, base, grid, args.markets_db, args.all_markets, workers=args.workers, tick=args.tick,
+                        scoring=scoring)
+        print(f">> [Replay] {len(results)} configurações avaliadas.")
+    else:
+        trades, dropped = load_tape(args.tape)
+        if args.all_markets:
+            markets, ids = {}, AllMarkets()
+        else:
+            markets, ids = load_markets(args.markets_db)
+            if not ids:
+                print("!! [Aviso] Snapshot de mercados vazio; use --all-markets para aceitar todos.")
+        clock = VirtualClock()
+        if args.db:
+            os.makedirs(args.db, exist_ok=True)
+            sink = DBSink(os.path.join(args.db, "whale_hunter.db"), os.path.join(args.db, "insider_intel.db"), clock)
+        else:
+            sink = MemorySink()
+        print(f">> [Replay] {len(trades)} trades ({dropped} malformados descartados) | "
+              f"gatilhos {'adaptativos' if scoring else 'fixos'}.")
+        results = [replay(trades, base, markets, ids, sink=sink, clock=clock, tick=args.tick,
+                          scorer=make_scorer(base) if scoring else None, clusters=make_clusters(base))]
+        results[0]["detections"] = sink.detections
+        print(f">> [Replay] {results[0]['elapsed_s']}s | {results[0]['trades_per_s']} trades/s | "
+              f"{results[0]['speedup']}x tempo real")
+
+    print_report(results, list(grid))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Réplica de leitura do servidor: snapshots periódicos dos bancos do scanner.
+
+`SnapshotReplica` copia o banco com a API de backup online do SQLite para um
+arquivo temporário, converte a cópia para journal DELETE e a troca de forma
+atômica (os.replace). Cada troca é uma nova geração; como o arquivo de uma
+geração nunca é alterado, os leitores o abrem com `immutable=1` (sem locks,
+sem -wal/-shm), `mmap_size` e `query_only`. Consultas longas do dashboard não
+seguram mais leitores no WAL do scanner, e os checkpoints não esperam por elas.
+
+A cópia só é refeita quando `PRAGMA data_version` indica escrita nova, a cada
+`max_staleness / 2` segundos. A defasagem (staleness) é o tempo desde o último
+instante em que o snapshot era idêntico à origem; acima de `max_staleness`
+(cópia falhando ou lenta demais) `ReadPool` volta a ler o banco vivo.
+
+Com vários processos (workers do gunicorn, `shared=True`), apenas um atualiza
+os snapshots: o que detém o lock exclusivo de `<réplica>.lock` (flock, liberado
+pelo sistema se o processo morrer; outro worker assume no ciclo seguinte). Os
+demais leem a geração e a defasagem do arquivo `<réplica>.meta`, que o
+atualizador regrava a cada ciclo.
+
+`ReadPool` mantém uma conexão por thread (reaproveitada entre requisições, com
+cache de statements preparados) e a reabre quando a geração da réplica muda.
+"""
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from response_cache import DataVersion
+
+
+class SnapshotReplica:
+    def __init__(self, source, path, max_staleness=5.0, shared=False):
+        self.source = source
+        self.path = path
+        self.meta_path = path + ".meta"
+        self.max_staleness = max_staleness
+        self.shared = shared
+        self.leader = not shared  # Sem `shared`, este processo é sempre o atualizador
+        self.interval = max(0.5, max_staleness / 2)
+        self.generation = 0  # time_ns da cópia: único entre processos e reinícios
+        self.fresh_ts = 0.0  # Instante em que o snapshot era idêntico à origem
+        self.stats = {"refreshes": 0, "skipped": 0, "failures": 0, "last_ms": 0.0, "max_ms": 0.0}
+
+        self._version = None
+        self._watch = None
+        self._lease = None
+        self._meta_mtime = None
+        self._synced = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def staleness(self):
+        self._sync()
+        return time.time() - self.fresh_ts
+
+    def usable(self):
+        self._sync()
+        return self.generation > 0 and time.time() - self.fresh_ts <= self.max_staleness
+
+    def _sync(self):
+        """Seguidor: relê geração e defasagem do .meta (no máximo a cada 100ms, e só se o arquivo mudou)."""
+        now = time.monotonic()
+        if self.leader or now - self._synced < 0.1:
+            return
+        self._synced = now
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+            if mtime != self._meta_mtime:
+                with open(self.meta_path) as f:
+                    meta = json.load(f)
+                self.generation, self.fresh_ts = meta["generation"], meta["fresh_ts"]
+                self._meta_mtime = mtime
+        except (OSError, ValueError, KeyError):
+            pass  # Sem .meta legível: mantém o último estado (e a defasagem cresce até o fallback)
+
+    def _acquire(self):
+        """Tenta assumir a atualização (lock não bloqueante). Retorna True se este processo é o atualizador."""
+        if self.leader:
+            return True
+        lease = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lease.close()
+            return False
+        self._lease = lease
+        self.leader = True
+        return True
+
+    def _publish(self):
+        if not self.shared:
+            return
+        tmp = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"generation": self.generation, "fresh_ts": self.fresh_ts}, f)
+        os.replace(tmp, self.meta_path)
+
+    def refresh(self):
+        """Atualiza o snapshot se a origem mudou. Retorna True se uma nova geração foi criada."""
+        with self._lock:
+            if self._watch is None:
+                self._watch = sqlite3.connect(self.source, timeout=30.0, check_same_thread=False)
+            checked = time.time()
+            version = self._watch.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._version and os.path.exists(self.path):
+                self.fresh_ts = checked
+                self.stats["skipped"] += 1
+                self._publish()
+                return False
+
+            tmp = f"{self.path}.{os.getpid()}.tmp"  # Um temporário por processo (vários workers)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            start = time.perf_counter()
+            src = sqlite3.connect(self.source, timeout=30.0)
+            dst = sqlite3.connect(tmp)
+            try:
+                src.backup(dst)  # Passo único: uma transação de leitura curta e consistente
+                dst.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                dst.close()
+                src.close()
+            os.replace(tmp, self.path)
+
+            self._version = version
+            self.generation = time.time_ns()
+            self.fresh_ts = checked
+            self._publish()
+            elapsed = round((time.perf_counter() - start) * 1000, 2)
+            self.stats["refreshes"] += 1
+            self.stats["last_ms"] = elapsed
+            self.stats["max_ms"] = max(self.stats["max_ms"], elapsed)
+            return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="read-replica", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if self._acquire():
+                    self.refresh()
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"!! [Erro] Falha ao atualizar réplica de {self.source}: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        if self._lease is not None:
+            self._lease.close()  # Libera o lock para outro processo assumir
+
+
+class ReadPool:
+    """
+    Conexões de leitura por thread para um banco: réplica (se configurada e
+    dentro do limite de defasagem) ou o banco vivo.
+    """
+
+    def __init__(self, source, replica=None, mmap_size=256 * 2 ** 20, cached_statements=256):
+        self.source = source
+        self.replica = replica
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._live_version = DataVersion([source])
+
+    def _open(self, kind, generation):
+        if kind == "replica":
+            conn = sqlite3.connect(f"file:{self.replica.path}?mode=ro&immutable=1", uri=True,
+                                   cached_statements=self.cached_statements)
+        else:
+            conn = sqlite3.connect(self.source, timeout=30.0, cached_statements=self.cached_statements)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)};")
+        conn.execute("PRAGMA query_only=1;")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def using_replica(self):
+        return self.replica is not None and self.replica.usable()
+
+    def connection(self):
+        """Conexão da thread atual (réplica ou banco vivo), reaberta quando a geração muda."""
+        if self.using_replica():
+            key = ("replica", self.replica.generation)
+        else:
+            key = ("live", 0)
+        current = getattr(self._local, "key", None)
+        if current != key:
+            old = getattr(self._local, "conn", None)
+            if old is not None:
+                old.close()
+            self._local.conn = self._open(*key)
+            self._local.key = key
+        return self._local.conn
+
+    def version(self):
+        """Sinal de versão para o cache de respostas: geração da réplica ou data_version do banco vivo."""
+        if self.using_replica():
+            return ("replica", self.replica.generation)
+        return ("live",) + self._live_version.current()
+
+    def staleness(self):
+        """Defasagem (s) dos dados servidos: 0 quando lidos do banco vivo."""
+        return self.replica.staleness() if self.using_replica() else 0.0
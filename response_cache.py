@@ -0,0 +1,106 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class DataVersion:
+    """
+    Sinal de versão dos dados baseado em `PRAGMA data_version`.
+
+    Cada banco tem uma conexão dedicada que nunca escreve; o valor do pragma
+    muda sempre que outra conexão (o scanner) confirma uma transação. A tupla
+    de versões identifica o estado atual dos dois bancos sem ler nenhuma tabela.
+    """
+
+    def __init__(self, db_paths):
+        self._lock = threading.Lock()
+        self._conns = [sqlite3.connect(p, timeout=30.0, check_same_thread=False) for p in db_paths]
+
+    def current(self):
+        with self._lock:
+            return tuple(c.execute("PRAGMA data_version").fetchone()[0] for c in self._conns)
+
+
+class _Entry:
+    __slots__ = ("version", "body", "etag")
+
+    def __init__(self, version, body, etag):
+        self.version = version
+        self.body = body
+        self.etag = etag
+
+
+class _Flight:
+    __slots__ = ("event", "entry", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Cache de respostas serializadas, invalidado pela versão dos dados.
+
+    Uma entrada só é servida enquanto a versão dos bancos for a mesma de quando
+    foi calculada, então nunca fica obsoleta após uma escrita do scanner.
+    Misses concorrentes para a mesma chave são coalescidos (single-flight):
+    apenas uma thread executa a consulta e as demais aguardam o resultado.
+    """
+
+    def __init__(self, version_fn, max_entries=512):
+        self.version_fn = version_fn
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """
+        Retorna (corpo, etag) da chave. `compute()` deve retornar o corpo em bytes;
+        exceções são propagadas a todos os que aguardam e nada é armazenado.
+        """
+        version = self.version_fn()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.body, entry.etag
+
+            flight = self._inflight.get((key, version))
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[(key, version)] = flight
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry.body, flight.entry.etag
+
+        try:
+            body = compute()
+            entry = _Entry(version, body, hashlib.blake2b(body, digest_size=12).hexdigest())
+            flight.entry = entry
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return entry.body, entry.etag
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop((key, version), None)
+            flight.event.set()
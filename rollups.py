@@ -0,0 +1,150 @@
+"""
+Rollups incrementais para o dashboard.
+
+As tabelas são criadas pelas migrações de schema.py (única fonte do DDL;
+o --rebuild também migra os bancos antes de regenerar). O scanner as
+atualiza na mesma transação em que grava as apostas, de modo que /api/stats lê poucas linhas pequenas em vez de agregar `bets`
+inteira a cada requisição. As séries de velocidade em várias resoluções ficam
+em timeseries.py. `rebuild_rollups` regenera tudo a partir dos dados brutos
+(backfills, correções manuais):
+
+    python rollups.py --rebuild
+"""
+import argparse
+import sqlite3
+
+import schema
+import timeseries
+
+VELOCITY_BUCKET = 1800  # Resolução de 30 minutos do gráfico de velocidade (e dos eventos do feed ao vivo)
+
+# market_question NULL vira '' para que o UPSERT encontre a chave (NULLs nunca colidem)
+UPSERT_MARKET = '''
+    INSERT INTO rollup_market (market_question, bet_link, bet_count, total_size) VALUES (IFNULL(?, ''), ?, 1, ?)
+    ON CONFLICT(market_question) DO UPDATE SET
+        bet_link = MAX(IFNULL(bet_link, ''), IFNULL(excluded.bet_link, '')),
+        bet_count = bet_count + 1,
+        total_size = total_size + excluded.total_size
+'''
+UPSERT_WALLET_MARKET = '''
+    INSERT INTO rollup_wallet_market (whale_address, market_question, total_size, bet_link) VALUES (?, IFNULL(?, ''), ?, ?)
+    ON CONFLICT(whale_address, market_question) DO UPDATE SET
+        total_size = total_size + excluded.total_size,
+        bet_link = MAX(IFNULL(bet_link, ''), IFNULL(excluded.bet_link, ''))
+'''
+UPSERT_TOTAL = '''
+    INSERT INTO rollup_totals (name, value) VALUES (?, ?)
+    ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+'''
+
+# Somas vindas de outras fontes (partições arquivadas, resumos compactados)
+ADD_MARKET = '''
+    INSERT INTO rollup_market (market_question, bet_link, bet_count, total_size) VALUES (?, ?, ?, ?)
+    ON CONFLICT(market_question) DO UPDATE SET
+        bet_link = MAX(IFNULL(bet_link, ''), IFNULL(excluded.bet_link, '')),
+        bet_count = bet_count + excluded.bet_count,
+        total_size = total_size + excluded.total_size
+'''
+
+
+def apply_bets(conn, bets):
+    """
+    Aplica um lote de apostas recém-inseridas aos rollups (mesma transação do INSERT).
+    `bets` é uma sequência de (whale_address, timestamp, market_question, size_usd, bet_link).
+    Retorna os incrementos por bucket de VELOCITY_BUCKET (eventos do feed ao vivo).
+    """
+    if not bets:
+        return {}
+    conn.executemany(UPSERT_MARKET, [(q, link, size) for _, _, q, size, link in bets])
+    conn.executemany(UPSERT_WALLET_MARKET, [(w, q, size, link) for w, _, q, size, link in bets])
+    timeseries.apply_bets(conn, [(w, ts, q, size) for w, ts, q, size, _ in bets])
+
+    velocity = {}
+    for _, ts, _, size, _ in bets:
+        bucket = (ts // VELOCITY_BUCKET) * VELOCITY_BUCKET
+        velocity[bucket] = velocity.get(bucket, 0) + size
+    conn.execute(UPSERT_TOTAL, ("total_volume", sum(b[3] for b in bets)))
+    return velocity
+
+
+def apply_intel_bets(conn, sizes):
+    if sizes:
+        conn.execute(UPSERT_TOTAL, ("intel_volume", sum(sizes)))
+
+
+def rebuild_main(conn):
+    """Regenera os rollups do banco principal a partir de todo o histórico de apostas (chamador faz o commit)."""
+    conn.execute("DELETE FROM rollup_market")
+    conn.execute("DELETE FROM rollup_wallet_market")
+    conn.execute("DELETE FROM rollup_totals")
+    conn.execute('''
+        INSERT INTO rollup_market (market_question, bet_link, bet_count, total_size)
+        SELECT IFNULL(market_question, ''), IFNULL(MAX(bet_link), ''), COUNT(*), SUM(size_usd)
+        FROM bets GROUP BY IFNULL(market_question, '')
+    ''')
+    conn.execute('''
+        INSERT INTO rollup_wallet_market (whale_address, market_question, total_size, bet_link)
+        SELECT whale_address, IFNULL(market_question, ''), SUM(size_usd), IFNULL(MAX(bet_link), '')
+        FROM bets GROUP BY whale_address, IFNULL(market_question, '')
+    ''')
+    conn.execute("INSERT INTO rollup_totals (name, value) SELECT 'total_volume', IFNULL(SUM(size_usd), 0) FROM bets")
+
+    # Histórico fora da tabela quente (partitions.py): partições arquivadas e resumos diários
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "bets_partitions" in tables:
+        for (path,) in conn.execute("SELECT path FROM bets_partitions WHERE state = 'archive'").fetchall():
+            part = sqlite3.connect(path, timeout=30.0)
+            try:
+                add_history(conn, part, "bets")
+            finally:
+                part.close()
+    if "bets_summary" in tables:
+        add_history(conn, conn, "bets_summary", count="SUM(bets)")
+    timeseries.rebuild(conn)
+
+
+def add_history(conn, source, table, count="COUNT(*)"):
+    """
+    Soma aos rollups de `conn` os agregados de `table`, lida pela conexão `source`
+    (pode ser outro arquivo).
+    """
+    conn.executemany(ADD_MARKET, source.execute(f'''
+        SELECT IFNULL(market_question, ''), IFNULL(MAX(bet_link), ''), {count}, SUM(size_usd)
+        FROM {table} GROUP BY IFNULL(market_question, '')''').fetchall())
+    conn.executemany(UPSERT_WALLET_MARKET, source.execute(f'''
+        SELECT whale_address, IFNULL(market_question, ''), SUM(size_usd), IFNULL(MAX(bet_link), '')
+        FROM {table} GROUP BY whale_address, IFNULL(market_question, '')''').fetchall())
+    total = source.execute(f"SELECT IFNULL(SUM(size_usd), 0) FROM {table}").fetchone()[0]
+    conn.execute(UPSERT_TOTAL, ("total_volume", total))
+
+
+def rebuild_insider(conn):
+    conn.execute("DELETE FROM rollup_totals WHERE name = 'intel_volume'")
+    conn.execute("INSERT INTO rollup_totals (name, value) SELECT 'intel_volume', IFNULL(SUM(size_usd), 0) FROM intel_bets")
+
+
+def rebuild_rollups(db_main, db_insider):
+    """Regeneração completa (uma transação por banco). As tabelas vêm das migrações, aplicadas antes se pendentes."""
+    for db_path, migrations, rebuild in ((db_main, schema.MAIN_MIGRATIONS, rebuild_main),
+                                         (db_insider, schema.INSIDER_MIGRATIONS, rebuild_insider)):
+        conn = sqlite3.connect(db_path, timeout=30.0)
+        try:
+            schema.migrate(conn, migrations)
+            rebuild(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção dos rollups do dashboard.")
+    parser.add_argument("--rebuild", action="store_true", help="Regenera os rollups a partir de bets/intel_bets")
+    parser.add_argument("--main", default="whale_hunter.db")
+    parser.add_argument("--insider", default="insider_intel.db")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild_rollups(args.main, args.insider)
+        print(">> [Sistema] Rollups regenerados.")
+    else:
+        parser.print_help()
@@ -0,0 +1,527 @@
+"""
+Migrações versionadas do esquema, compartilhadas pelo scanner e pelo servidor.
+
+Cada banco tem uma lista ordenada de migrações (versão, nome, passos). Um passo
+é um comando SQL ou uma função que recebe a conexão. Migrações já publicadas
+não mudam: o DDL fica congelado aqui (não em helpers de outros módulos, que
+evoluem) e mudanças posteriores entram como novas versões. A versão aplicada
+fica em `PRAGMA user_version` e o histórico na tabela `schema_migrations`. Todos os
+passos usam IF NOT EXISTS, então rodar contra bancos de produção existentes
+(criados antes deste módulo) é seguro: cada migração roda uma única vez, em
+uma transação própria.
+"""
+import sqlite3
+import time
+
+# Tabelas de resultado do analytics.py (mesmo formato nos dois bancos)
+ANALYTICS_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS analytics_wallets (
+        address TEXT PRIMARY KEY,
+        bets INTEGER,
+        gross REAL,
+        net_exposure REAL,
+        hedge_ratio REAL,
+        markets INTEGER,
+        top_market TEXT,
+        top_share REAL,
+        first_ts INTEGER,
+        last_ts INTEGER,
+        gaps_1m INTEGER,
+        gaps_10m INTEGER,
+        gaps_1h INTEGER,
+        gaps_1d INTEGER,
+        gaps_long INTEGER,
+        burst_ratio REAL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_analytics_wallets_gross ON analytics_wallets (gross)",
+    '''
+    CREATE TABLE IF NOT EXISTS analytics_markets (
+        market_question TEXT PRIMARY KEY,
+        bets INTEGER,
+        wallets INTEGER,
+        volume REAL,
+        yes_volume REAL,
+        no_volume REAL,
+        skew REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS analytics_comovement (
+        wallet_a TEXT,
+        wallet_b TEXT,
+        shared_markets INTEGER,
+        same_direction INTEGER,
+        score REAL,
+        PRIMARY KEY (wallet_a, wallet_b)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS analytics_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source TEXT,
+        started_ts INTEGER,
+        rows INTEGER,
+        elapsed REAL
+    )
+    ''',
+]
+
+# Populam os rollups a partir de `bets` só se ainda não existirem (bancos criados antes das migrações já os têm)
+_MAIN_ROLLUPS_MISSING = "NOT EXISTS (SELECT 1 FROM rollup_totals WHERE name = 'total_volume')"
+_INSIDER_ROLLUPS_MISSING = "NOT EXISTS (SELECT 1 FROM rollup_totals WHERE name = 'intel_volume')"
+
+MAIN_MIGRATIONS = [
+    (1, "tabelas base do stream", [
+        '''
+        CREATE TABLE IF NOT EXISTS whales (
+            address TEXT PRIMARY KEY,
+            first_seen INTEGER,
+            last_seen INTEGER,
+            total_volume REAL DEFAULT 0,
+            funding_source TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            whale_address TEXT,
+            timestamp INTEGER,
+            market_question TEXT,
+            category TEXT,
+            position TEXT,
+            size_usd REAL,
+            bet_link TEXT,
+            tx_hash TEXT,
+            processed_by_analyst BOOLEAN DEFAULT 0,
+            FOREIGN KEY(whale_address) REFERENCES whales(address)
+        )
+        ''',
+    ]),
+    (2, "rollups do dashboard", [
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_market (
+            market_question TEXT PRIMARY KEY,
+            bet_link TEXT,
+            bet_count INTEGER DEFAULT 0,
+            total_size REAL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_wallet_market (
+            whale_address TEXT,
+            market_question TEXT,
+            total_size REAL DEFAULT 0,
+            bet_link TEXT,
+            PRIMARY KEY (whale_address, market_question)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_rollup_wallet_market_size ON rollup_wallet_market (total_size DESC)",
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_velocity (
+            bucket INTEGER PRIMARY KEY,
+            volume REAL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_totals (
+            name TEXT PRIMARY KEY,
+            value REAL DEFAULT 0
+        )
+        ''',
+        f"DELETE FROM rollup_market WHERE {_MAIN_ROLLUPS_MISSING}",
+        f"DELETE FROM rollup_wallet_market WHERE {_MAIN_ROLLUPS_MISSING}",
+        f"DELETE FROM rollup_velocity WHERE {_MAIN_ROLLUPS_MISSING}",
+        f'''
+        INSERT INTO rollup_market (market_question, bet_link, bet_count, total_size)
+        SELECT IFNULL(market_question, ''), IFNULL(MAX(bet_link), ''), COUNT(*), SUM(size_usd)
+        FROM bets WHERE {_MAIN_ROLLUPS_MISSING} GROUP BY IFNULL(market_question, '')
+        ''',
+        f'''
+        INSERT INTO rollup_wallet_market (whale_address, market_question, total_size, bet_link)
+        SELECT whale_address, IFNULL(market_question, ''), SUM(size_usd), IFNULL(MAX(bet_link), '')
+        FROM bets WHERE {_MAIN_ROLLUPS_MISSING} GROUP BY whale_address, IFNULL(market_question, '')
+        ''',
+        f'''
+        INSERT INTO rollup_velocity (bucket, volume)
+        SELECT (timestamp / 1800) * 1800, SUM(size_usd) FROM bets WHERE {_MAIN_ROLLUPS_MISSING} GROUP BY 1
+        ''',
+        f'''
+        INSERT INTO rollup_totals (name, value)
+        SELECT 'total_volume', (SELECT IFNULL(SUM(size_usd), 0) FROM bets) WHERE {_MAIN_ROLLUPS_MISSING}
+        ''',
+    ]),
+    (3, "cursor de ingestão", [
+        '''
+        CREATE TABLE IF NOT EXISTS ingest_cursor (
+            name TEXT PRIMARY KEY,
+            last_ts INTEGER,
+            floor_ts INTEGER,
+            recent_keys TEXT,
+            updated_ts INTEGER
+        )
+        ''',
+    ]),
+    (4, "índices de bets", [
+        "CREATE INDEX IF NOT EXISTS idx_bets_timestamp ON bets (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_bets_whale_ts ON bets (whale_address, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_bets_market_size ON bets (market_question, size_usd)",
+    ]),
+    (5, "eventos do feed ao vivo", [
+        '''
+        CREATE TABLE IF NOT EXISTS live_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER,
+            kind TEXT,
+            payload TEXT
+        )
+        ''',
+    ]),
+    (6, "buckets de acumulação persistentes", [
+        '''
+        CREATE TABLE IF NOT EXISTS ladder_buckets (
+            wallet TEXT,
+            cid TEXT,
+            side TEXT,
+            value REAL,
+            last_ts INTEGER,
+            tx TEXT,
+            PRIMARY KEY (wallet, cid, side)
+        )
+        ''',
+    ]),
+    (7, "registro de mercados", [
+        '''
+        CREATE TABLE IF NOT EXISTS market_registry (
+            cid TEXT PRIMARY KEY,
+            question TEXT,
+            category TEXT,
+            url TEXT,
+            updated_ts INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS market_registry_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_updated_ts INTEGER,
+            last_full_sync_ts INTEGER
+        )
+        ''',
+    ]),
+    (8, "tabelas de analytics", ANALYTICS_TABLES),
+    (9, "clusters de carteiras", [
+        '''
+        CREATE TABLE IF NOT EXISTS wallet_clusters (
+            wallet TEXT PRIMARY KEY,
+            cluster_id TEXT,
+            size INTEGER,
+            reason TEXT,
+            funder TEXT,
+            volume REAL,
+            last_ts INTEGER
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_wallet_clusters_id ON wallet_clusters (cluster_id)",
+    ]),
+    (10, "saúde dos shards do supervisor", [
+        '''
+        CREATE TABLE IF NOT EXISTS scanner_shards (
+            shard INTEGER PRIMARY KEY,
+            pid INTEGER,
+            alive INTEGER,
+            restarts INTEGER,
+            markets INTEGER,
+            trades INTEGER,
+            queue_depth INTEGER,
+            lag REAL,
+            queue_delay REAL,
+            buckets INTEGER,
+            enrich_backlog INTEGER,
+            heartbeat_ts INTEGER
+        )
+        ''',
+    ]),
+    (11, "partições e resumos de bets", [
+        '''
+        CREATE TABLE IF NOT EXISTS bets_partitions (
+            name TEXT PRIMARY KEY,
+            path TEXT,
+            start_ts INTEGER,
+            end_ts INTEGER,
+            rows INTEGER DEFAULT 0,
+            volume REAL DEFAULT 0,
+            state TEXT,
+            updated_ts INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bets_summary (
+            day INTEGER,
+            whale_address TEXT,
+            market_question TEXT,
+            position TEXT,
+            category TEXT,
+            bet_link TEXT,
+            bets INTEGER,
+            size_usd REAL,
+            first_ts INTEGER,
+            last_ts INTEGER,
+            PRIMARY KEY (day, whale_address, market_question, position)
+        )
+        ''',
+    ]),
+    (12, "linhas de base de anomalia por mercado", [
+        '''
+        CREATE TABLE IF NOT EXISTS market_baselines (
+            cid TEXT PRIMARY KEY,
+            n INTEGER,
+            mean REAL,
+            var REAL,
+            gap REAL,
+            usd REAL,
+            last_ts INTEGER,
+            quantile TEXT,
+            updated_ts INTEGER
+        )
+        ''',
+    ]),
+    (13, "cobertura da ingestão e índices adiados do backfill", [
+        '''
+        CREATE TABLE IF NOT EXISTS ingest_coverage (
+            cid TEXT,
+            start_ts INTEGER,
+            end_ts INTEGER,
+            source TEXT,
+            PRIMARY KEY (cid, start_ts)
+        )
+        ''',
+        # Instalações anteriores: o intervalo do cursor ao vivo vale como coberto
+        '''
+        INSERT OR IGNORE INTO ingest_coverage (cid, start_ts, end_ts, source)
+        SELECT '*', floor_ts, last_ts, 'live' FROM ingest_cursor
+        WHERE name = 'trades' AND floor_ts IS NOT NULL AND last_ts IS NOT NULL
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS backfill_deferred_indexes (
+            db TEXT,
+            name TEXT,
+            sql TEXT,
+            PRIMARY KEY (db, name)
+        )
+        ''',
+    ]),
+    # Substitui rollup_velocity (30 min, só global): as séries são geradas a partir do histórico completo
+    (14, "séries de velocidade em várias resoluções", [
+        "DROP TABLE IF EXISTS rollup_velocity",
+        '''
+        CREATE TABLE IF NOT EXISTS velocity_series (
+            resolution INTEGER,
+            scope TEXT,
+            key TEXT,
+            bucket INTEGER,
+            volume REAL DEFAULT 0,
+            bets INTEGER DEFAULT 0,
+            PRIMARY KEY (resolution, scope, key, bucket)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS velocity_watermarks (
+            resolution INTEGER PRIMARY KEY,
+            ts INTEGER
+        )
+        ''',
+        lambda conn: velocity_history(conn),
+    ]),
+]
+
+INSIDER_MIGRATIONS = [
+    (1, "tabelas base forenses", [
+        '''
+        CREATE TABLE IF NOT EXISTS intel_whales (
+            address TEXT PRIMARY KEY,
+            funding_source TEXT,
+            account_created_ts INTEGER,
+            portfolio_value REAL,
+            total_scanned_volume REAL DEFAULT 0,
+            last_active_ts INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS intel_bets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            whale_address TEXT,
+            timestamp INTEGER,
+            market_question TEXT,
+            position TEXT,
+            size_usd REAL,
+            FOREIGN KEY(whale_address) REFERENCES intel_whales(address)
+        )
+        ''',
+    ]),
+    (2, "rollups forenses", [
+        '''
+        CREATE TABLE IF NOT EXISTS rollup_totals (
+            name TEXT PRIMARY KEY,
+            value REAL DEFAULT 0
+        )
+        ''',
+        f'''
+        INSERT INTO rollup_totals (name, value)
+        SELECT 'intel_volume', (SELECT IFNULL(SUM(size_usd), 0) FROM intel_bets) WHERE {_INSIDER_ROLLUPS_MISSING}
+        ''',
+    ]),
+    (3, "cache de inteligência de carteiras", [
+        '''
+        CREATE TABLE IF NOT EXISTS wallet_intel_cache (
+            address TEXT,
+            field TEXT,
+            value TEXT,
+            fetched_ts INTEGER,
+            fail_count INTEGER DEFAULT 0,
+            retry_after INTEGER DEFAULT 0,
+            PRIMARY KEY (address, field)
+        )
+        ''',
+    ]),
+    (4, "índices de intel_bets", [
+        "CREATE INDEX IF NOT EXISTS idx_intel_bets_timestamp ON intel_bets (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_intel_bets_whale_ts ON intel_bets (whale_address, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_intel_whales_active ON intel_whales (last_active_ts)",
+    ]),
+    (5, "top_market/max_bet desnormalizados", [
+        lambda conn: add_column(conn, "intel_whales", "top_market", "TEXT"),
+        lambda conn: add_column(conn, "intel_whales", "max_bet", "REAL DEFAULT 0"),
+        '''
+        CREATE TABLE IF NOT EXISTS intel_wallet_market (
+            whale_address TEXT,
+            market_question TEXT,
+            total_size REAL DEFAULT 0,
+            PRIMARY KEY (whale_address, market_question)
+        )
+        ''',
+        "DELETE FROM intel_wallet_market",
+        '''
+        INSERT INTO intel_wallet_market (whale_address, market_question, total_size)
+        SELECT whale_address, market_question, SUM(size_usd) FROM intel_bets GROUP BY whale_address, market_question
+        ''',
+        '''
+        UPDATE intel_whales SET
+            max_bet = IFNULL((SELECT MAX(size_usd) FROM intel_bets WHERE whale_address = intel_whales.address), 0),
+            top_market = (SELECT market_question FROM intel_wallet_market
+                          WHERE whale_address = intel_whales.address
+                          ORDER BY total_size DESC LIMIT 1)
+        ''',
+    ]),
+    (6, "tabelas de analytics", ANALYTICS_TABLES),
+]
+
+
+def velocity_history(conn):
+    """
+    Passo da migração 14: popula `velocity_series` com bets, partições arquivadas
+    e resumos diários. Resoluções, retenções e escopos são os da versão 14 (os de
+    timeseries.py podem mudar depois). Não faz nada se já houver marcas d'água.
+    """
+    if conn.execute("SELECT 1 FROM velocity_watermarks LIMIT 1").fetchone() is not None:
+        return
+    now = int(time.time())
+    resolutions = (60, 300, 1800, 3600, 86400)
+    retention = {60: 2 * 86400, 300: 14 * 86400, 1800: 60 * 86400, 3600: 180 * 86400, 86400: None}
+    scopes = {"all": "''", "market": "IFNULL(market_question, '')", "wallet": "whale_address"}
+    # Derivadas começam completas até o último bucket fechado; daí em diante, o downsampler
+    marks = {r: (now // r) * r for r in resolutions[1:]}
+    conn.executemany("INSERT INTO velocity_watermarks (resolution, ts) VALUES (?, ?)", list(marks.items()))
+
+    def add(source, table, count="COUNT(*)", ts="timestamp", only=resolutions):
+        for resolution in only:
+            lower = now - retention[resolution] if retention[resolution] is not None else -1
+            upper = marks.get(resolution, 2 ** 62)
+            for scope, key in scopes.items():
+                rows = source.execute(f'''
+                    SELECT ?, ?, {key}, ({ts} / ?) * ? AS bucket, SUM(size_usd), {count} FROM {table}
+                    WHERE {ts} >= ? AND {ts} < ? GROUP BY 3, 4''',
+                    (resolution, scope, resolution, resolution, (lower // resolution) * resolution, upper)).fetchall()
+                conn.executemany('''
+                    INSERT INTO velocity_series (resolution, scope, key, bucket, volume, bets)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(resolution, scope, key, bucket) DO UPDATE SET
+                        volume = volume + excluded.volume,
+                        bets = bets + excluded.bets
+                ''', rows)
+
+    add(conn, "bets")
+    for (path,) in conn.execute("SELECT path FROM bets_partitions WHERE state = 'archive'").fetchall():
+        part = sqlite3.connect(path, timeout=30.0)
+        try:
+            add(part, "bets")
+        finally:
+            part.close()
+    add(conn, "bets_summary", count="SUM(bets)", ts="day", only=(86400,))
+
+
+def add_column(conn, table, column, decl):
+    """ALTER TABLE ADD COLUMN idempotente (SQLite não suporta IF NOT EXISTS aqui)."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations, target=None):
+    """
+    Aplica as migrações pendentes (versão > user_version) até `target`.
+    Retorna a lista de versões aplicadas.
+    """
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # Controle explícito das transações (DDL incluso)
+    applied = []
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_ts INTEGER
+            )
+        ''')
+        for version, name, steps in migrations:
+            if target is not None and version > target:
+                break
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Relê dentro da transação: outro processo pode ter migrado em paralelo
+                if version <= current_version(conn):
+                    conn.execute("ROLLBACK")
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute("INSERT OR REPLACE INTO schema_migrations (version, name, applied_ts) VALUES (?, ?, ?)",
+                             (version, name, int(time.time())))
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+                applied.append(version)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = previous_isolation
+    return applied
+
+
+def migrate_all(db_main, db_insider):
+    """Migra os dois bancos e informa as versões aplicadas."""
+    for db_path, migrations in ((db_main, MAIN_MIGRATIONS), (db_insider, INSIDER_MIGRATIONS)):
+        conn = sqlite3.connect(db_path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            applied = migrate(conn, migrations)
+            if applied:
+                print(f">> [Sistema] {db_path}: migrações aplicadas {applied} (versão {current_version(conn)})")
+        finally:
+            conn.close()
@@ -0,0 +1,217 @@
+import json
+import math
+import sqlite3
+import threading
+import time
+
+import checkpoint
+
+
+class P2Quantile:
+    """
+    Estimador P² (Jain & Chlamtac) de um quantil: cinco marcadores, memória
+    constante e atualização O(1), sem guardar as amostras.
+    """
+
+    __slots__ = ("p", "q", "pos", "want", "step")
+
+    def __init__(self, p, state=None):
+        self.p = p
+        if state is not None:
+            self.q, self.pos, self.want = state["q"], state["pos"], state["want"]
+        else:
+            self.q, self.pos, self.want = [], [1, 2, 3, 4, 5], [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.step = (0, p / 2, p, (1 + p) / 2, 1)
+
+    def add(self, x):
+        q = self.q
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        pos, want = self.pos, self.want
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            want[i] += self.step[i]
+
+        # Ajusta os marcadores internos em direção às posições desejadas (parabólico, senão linear)
+        for i in (1, 2, 3):
+            d = want[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+                q[i] = qp
+                pos[i] += d
+
+    def value(self):
+        q = self.q
+        if not q:
+            return None
+        if len(q) < 5:
+            return q[min(len(q) - 1, int(self.p * len(q)))]
+        return q[2]
+
+    def state(self):
+        return {"q": self.q, "pos": self.pos, "want": self.want}
+
+
+class MarketBaseline:
+    """Estatísticas móveis de um mercado: log do tamanho (EWMA média/variância), quantil P² e ritmo de trades."""
+
+    __slots__ = ("n", "mean", "var", "gap", "usd", "last_ts", "quantile")
+
+    def __init__(self, p, n=0, mean=0.0, var=0.0, gap=None, usd=0.0, last_ts=None, quantile=None):
+        self.n = n
+        self.mean = mean
+        self.var = var
+        self.gap = gap  # Intervalo médio (s) entre trades
+        self.usd = usd  # Tamanho médio (USD) por trade
+        self.last_ts = last_ts
+        self.quantile = P2Quantile(p, quantile)
+
+
+class AnomalyScorer:
+    """
+    Linhas de base por conditionId para gatilhos adaptativos de detecção insider.
+
+    Cada trade acima do piso de ruído atualiza, em O(1) e memória constante por
+    mercado:
+      - média e variância exponenciais (meia-vida de `halflife` trades) do log
+        do tamanho em USD, já que tamanhos de aposta são aproximadamente
+        log-normais;
+      - um quantil alto (`quantile`, P²) do tamanho por trade;
+      - o ritmo do mercado (intervalo médio entre trades e USD médio por trade).
+
+    Um bucket é pontuado pelo z-score do log do seu valor em relação ao mercado.
+    Os gatilhos em USD de um mercado são
+        max(min_usd, exp(média + z · desvio), quantil)
+    com `z_insider`/`z_critical`; o quantil impede que um desvio colapsado
+    (mercado com trades todos iguais) dispare em qualquer bucket. Até o mercado
+    acumular `warmup` trades, valem os gatilhos fixos (`fixed`).
+
+    O estado é gravado em `market_baselines` junto com os snapshots dos buckets
+    (`db_path=None` mantém tudo em memória, como no replay). Com `owns`, só os
+    mercados do shard são carregados e regravados.
+    """
+
+    def __init__(self, db_path=None, fixed=(3000, 5000), halflife=500, warmup=50, z_insider=3.0, z_critical=4.0,
+                 min_usd=1000, quantile=0.99, min_sigma=0.25, owns=None):
+        self.fixed = tuple(fixed)
+        self.alpha = 1 - 0.5 ** (1 / halflife)
+        self.warmup = warmup
+        self.z_insider = z_insider
+        self.z_critical = z_critical
+        self.min_usd = min_usd
+        self.p = quantile
+        self.min_sigma = min_sigma
+        self.owns = owns
+        self.stats = {"observed": 0, "adaptive": 0, "fallback": 0}
+
+        self._markets = {}
+        self._lock = threading.Lock()  # Só para o snapshot (o caminho quente roda em uma thread)
+
+        self.conn = None
+        if db_path is not None:
+            self.conn = checkpoint.connect(db_path, check_same_thread=False)
+            self._load()
+
+    def __len__(self):
+        return len(self._markets)
+
+    def observe(self, cid, usd, ts):
+        """Atualiza a linha de base do mercado com um trade."""
+        m = self._markets.get(cid)
+        if m is None:
+            m = self._markets[cid] = MarketBaseline(self.p)
+        x = math.log(usd)
+        m.n += 1
+        a = max(self.alpha, 1 / m.n)  # Média exata durante o aquecimento, exponencial depois
+        diff = x - m.mean
+        incr = a * diff
+        m.mean += incr
+        m.var = (1 - a) * (m.var + diff * incr)
+        m.usd += a * (usd - m.usd)
+        if m.last_ts is not None and ts >= m.last_ts:
+            gap = ts - m.last_ts
+            m.gap = gap if m.gap is None else m.gap + a * (gap - m.gap)
+        m.last_ts = ts if m.last_ts is None else max(m.last_ts, ts)
+        m.quantile.add(usd)
+        self.stats["observed"] += 1
+
+    def triggers(self, cid):
+        """(gatilho insider, gatilho crítico) em USD do mercado; os fixos durante o aquecimento."""
+        m = self._markets.get(cid)
+        if m is None or m.n < self.warmup:
+            self.stats["fallback"] += 1
+            return self.fixed
+        self.stats["adaptive"] += 1
+        sigma = max(math.sqrt(m.var), self.min_sigma)
+        floor = max(self.min_usd, m.quantile.value())
+        return (max(floor, math.exp(m.mean + self.z_insider * sigma)),
+                max(floor, math.exp(m.mean + self.z_critical * sigma)))
+
+    def score(self, cid, value):
+        """Pontuação de um valor no mercado: z-score, percentil (modelo log-normal) e ritmo. None no aquecimento."""
+        m = self._markets.get(cid)
+        if m is None or m.n < self.warmup or value <= 0:
+            return None
+        sigma = max(math.sqrt(m.var), self.min_sigma)
+        z = (math.log(value) - m.mean) / sigma
+        rate = 60 / m.gap if m.gap else None
+        return {
+            "z": round(z, 2),
+            "percentile": round(50 * (1 + math.erf(z / math.sqrt(2))), 3),
+            "typical_usd": round(math.exp(m.mean), 2),
+            "trades_per_min": round(rate, 2) if rate is not None else None,
+            # Quantos minutos do fluxo típico do mercado o valor representa
+            "flow_minutes": round(value / (m.usd * rate), 1) if rate and m.usd else None,
+        }
+
+    # --- PERSISTÊNCIA ---
+
+    def _load(self):
+        rows = self.conn.execute(
+            "SELECT cid, n, mean, var, gap, usd, last_ts, quantile FROM market_baselines").fetchall()
+        for cid, n, mean, var, gap, usd, last_ts, quantile in rows:
+            if self.owns is not None and not self.owns(cid):
+                continue
+            self._markets[cid] = MarketBaseline(self.p, n, mean, var, gap, usd, last_ts,
+                                                json.loads(quantile) if quantile else None)
+
+    def save(self):
+        """Grava as linhas de base (UPSERT por mercado; shards nunca tocam mercados alheios)."""
+        if self.conn is None:
+            return
+        now = int(time.time())
+        with self._lock:
+            rows = [(cid, m.n, m.mean, m.var, m.gap, m.usd, m.last_ts, json.dumps(m.quantile.state()), now)
+                    for cid, m in list(self._markets.items())]
+        try:
+            self.conn.executemany(
+                '''INSERT OR REPLACE INTO market_baselines (cid, n, mean, var, gap, usd, last_ts, quantile, updated_ts)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"!! [Erro] Falha ao salvar linhas de base de anomalia: {e}")
+
+    def close(self):
+        self.save()
+        if self.conn is not None:
+            self.conn.close()
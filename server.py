@@ -1,11 +1,26 @@
-from flask import Flask, jsonify, render_template
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, render_template, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import sqlite3
+import os
 import logging
+import queue
 import time
 
-app = Flask(__name__)
-CORS(app)
+import metrics
+import schema
+import timeseries
+from compression import Compressor, negotiate
+from live_feed import EventHub
+from metrics import MetricsPublisher
+from profiler import SamplingProfiler, install_toggle
+from replica import ReadPool, SnapshotReplica
+from response_cache import ResponseCache
+from rollups import VELOCITY_BUCKET
+
+try:
+    import orjson
+except ImportError:  # Opcional: sem o pacote, usa o encoder JSON padrão do Flask
+    orjson = None
 
 # Silenciar logs não críticos do werkzeug para manter o console limpo
 log = logging.getLogger("werkzeug")
@@ -15,265 +30,553 @@ log.setLevel(logging.ERROR)
 DB_MAIN = "whale_hunter.db"
 DB_INSIDER = "insider_intel.db"
 
-def get_db_connection(db_path):
+# Réplica de leitura (opcional): o servidor lê snapshots em vez dos arquivos que o scanner grava
+READ_REPLICA = os.getenv("SERVER_READ_REPLICA", "0") == "1"
+REPLICA_DIR = os.getenv("SERVER_REPLICA_DIR", "replica")
+REPLICA_MAX_STALENESS = float(os.getenv("SERVER_REPLICA_MAX_STALENESS", "5"))  # Acima disto, lê o banco vivo
+READ_MMAP_SIZE = 256 * 2 ** 20
+READ_CACHED_STATEMENTS = 256  # Statements preparados mantidos por conexão
+
+# Compressão das respostas (gzip; brotli se instalado)
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+
+# Séries de velocidade (GET /api/velocity)
+VELOCITY_DEFAULT_POINTS = 120  # Janela padrão, em buckets da resolução pedida
+VELOCITY_MAX_POINTS = 2000
+
+# Feed ao vivo (GET /api/stream): cada cliente SSE prende uma thread do worker até desconectar
+SSE_MAX_CLIENTS = int(os.getenv("SERVER_SSE_MAX_CLIENTS", "0"))  # Por processo; acima disto, 503 (0 = sem limite)
+SSE_RETRY_AFTER = 60  # Segundos até um cliente recusado tentar de novo (o dashboard segue no polling)
+
+# Métricas (GET /metrics): este processo + snapshots publicados pelo scanner, shards e demais workers
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+METRICS_INTERVAL = 10
+METRICS_STALE_AFTER = 60  # Snapshots mais antigos (processo encerrado) não são exportados
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_ON_START = os.getenv("SERVER_PROFILE", "0") == "1"  # Liga já na partida; SIGUSR2 alterna
+
+REQUEST_SECONDS = metrics.REGISTRY.histogram("server_request_seconds", "Latência das requisições (s)",
+                                             ("endpoint", "status"))
+
+bp = Blueprint("dashboard", __name__)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serialização JSON via orjson (jsonify e app.json)."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def dumps_json(obj):
+    """Payload JSON em bytes (sem a ida e volta por str quando o orjson está disponível)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return current_app.json.dumps(obj).encode()
+
+
+def make_pool(db_path, shared_replica=False):
+    replica = None
+    if READ_REPLICA:
+        os.makedirs(REPLICA_DIR, exist_ok=True)
+        replica = SnapshotReplica(db_path, os.path.join(REPLICA_DIR, os.path.basename(db_path)),
+                                  max_staleness=REPLICA_MAX_STALENESS,
+                                  shared=shared_replica)
+        replica.start()
+    return ReadPool(db_path, replica, mmap_size=READ_MMAP_SIZE, cached_statements=READ_CACHED_STATEMENTS)
+
+
+class ServerState:
+    """Recursos de um processo servidor: pools de leitura, cache de respostas, compressão e feed ao vivo."""
+
+    def __init__(self, shared_replica=False):
+        # Uma conexão de leitura por thread e banco, reaproveitada entre requisições (não fechar)
+        self.main_pool = make_pool(DB_MAIN, shared_replica)
+        self.insider_pool = make_pool(DB_INSIDER, shared_replica)
+
+        # Cache compartilhado de respostas: invalidado pela versão dos dois bancos (PRAGMA data_version
+        # do banco vivo ou geração da réplica), ou seja, uma entrada nunca sobrevive a dados novos.
+        self.response_cache = ResponseCache(lambda: (self.main_pool.version(), self.insider_pool.version()))
+        self.compressor = Compressor(COMPRESS_MIN_SIZE, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY)
+
+        # Feed ao vivo: um único leitor de live_events distribui para todos os clientes SSE
+        self.event_hub = EventHub(DB_MAIN, max_clients=SSE_MAX_CLIENTS)
+
+        self.process = f"server-{os.getpid()}"
+        metrics.REGISTRY.register_collector(self.collect_metrics)
+        self.metrics = MetricsPublisher(METRICS_DIR, self.process, interval=METRICS_INTERVAL)
+        self.metrics.start()
+        self.profiler = SamplingProfiler(PROFILE_DIR, self.process)
+        install_toggle(self.profiler)  # Sem efeito fora da thread principal
+        if PROFILE_ON_START:
+            self.profiler.start()
+
+    def collect_metrics(self):
+        families = [
+            metrics.stats_family("server_response_cache_total", "Consultas ao cache de respostas", self.response_cache.stats),
+            metrics.stats_family("server_compression_total", "Compressão de respostas", self.compressor.stats),
+            metrics.stats_family("server_live_feed", "Feed SSE (clientes conectados e eventos)", self.event_hub.stats,
+                                 kind="gauge"),
+        ]
+        staleness, replica = [], []
+        for db, pool in (("main", self.main_pool), ("insider", self.insider_pool)):
+            staleness.append(({"db": db}, pool.staleness()))
+            if pool.replica is not None:
+                replica += [({"db": db, "kind": k}, v) for k, v in pool.replica.stats.items()]
+        families.append(("server_data_staleness_seconds", "gauge", "Defasagem dos dados servidos", staleness))
+        if replica:
+            families.append(("server_replica_refresh", "gauge", "Atualizações da réplica (neste processo)", replica))
+        return families
+
+
+def state():
+    return current_app.extensions["polysentinel"]
+
+
+def create_app(migrate=True, shared_replica=False):
     """
-    Estabelece uma conexão robusta com o SQLite com WAL ativado.
-    WAL (Write-Ahead Logging) melhora a concorrência, permitindo leituras
-    e escritas simultâneas sem bloquear o banco.
+    Fábrica da aplicação. Sob o gunicorn (gunicorn.conf.py) cada worker cria a
+    sua após o fork; as migrações ficam com o master e as réplicas são
+    atualizadas por um único worker (`shared_replica`, ver replica.py).
     """
-    conn = sqlite3.connect(db_path, timeout=30.0)  # Timeout aumentado para lidar com locks concorrentes
-    conn.execute("PRAGMA journal_mode=WAL;")       # Ativa o Write-Ahead Logging
-    conn.execute("PRAGMA synchronous=NORMAL;")     # Otimiza a sincronização para performance
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Garante índices e tabelas de rollup mesmo que o scanner ainda não tenha rodado a versão atual
+    if migrate:
+        schema.migrate_all(DB_MAIN, DB_INSIDER)
+
+    app = Flask(__name__)
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    CORS(app)
+    app.extensions["polysentinel"] = ServerState(shared_replica)
+    app.register_blueprint(bp)
+    return app
+
+
+@bp.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+def query_failed(e):
+    """Conta a falha de consulta do endpoint atual e responde o erro em JSON."""
+    metrics.error("server_" + (request.endpoint or "").rsplit(".", 1)[-1])
+    return jsonify({"error": str(e)})
+
 
 def get_main_db():
-    return get_db_connection(DB_MAIN)
+    return state().main_pool.connection()
 
 def get_insider_db():
-    return get_db_connection(DB_INSIDER)
+    return state().insider_pool.connection()
+
+
+@bp.after_app_request
+def report_staleness(response):
+    """Informa a origem e a defasagem (s) dos dados servidos e comprime respostas fora do cache."""
+    if request.path.startswith("/api/") and request.endpoint != "dashboard.stream":
+        st = state()
+        replica = st.main_pool.using_replica() and st.insider_pool.using_replica()
+        response.headers["X-Data-Source"] = "replica" if replica else "live"
+        response.headers["X-Data-Staleness"] = f"{max(st.main_pool.staleness(), st.insider_pool.staleness()):.2f}"
+    if "request_start" in g and request.endpoint != "dashboard.stream":
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                endpoint=request.endpoint or "404", status=response.status_code)
+    return state().compressor.apply(request, response)
+
+
+def cached_json(compute, *key_parts):
+    """
+    Serve o payload de `compute()` a partir do cache (chave: endpoint + argumentos),
+    comprimido conforme o Accept-Encoding (uma compressão por versão dos dados).
+    Responde 304 quando o ETag do cliente corresponde ao conteúdo atual. A latência
+    de cada requisição (hit ou miss) vai no cabeçalho Server-Timing, fora do corpo cacheado.
+    """
+    st = state()
+    key = (request.endpoint, request.query_string) + key_parts
+    body, etag = st.response_cache.get(key, lambda: dumps_json(compute()))
+    encoding = negotiate(request.headers.get("Accept-Encoding"))
+    if encoding is not None and len(body) >= st.compressor.min_size:
+        body = st.compressor.encode(body, encoding, etag)
+        etag = f"{etag}-{encoding}"
+    else:
+        encoding = None
+    response = current_app.response_class(body, mimetype="application/json")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    response = response.make_conditional(request)
+    response.headers["Server-Timing"] = f"app;dur={(time.perf_counter() - g.request_start) * 1000:.2f}"
+    return response
 
 
 # --- ROTAS (FRONTEND) ---
 
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("home.html")
 
 
-@app.route("/insider")
+@bp.route("/insider")
 def insider():
     return render_template("insider.html")
 
 
-@app.route("/about")
+@bp.route("/about")
 def about():
     return render_template("about.html")
 
 
-@app.route("/disclaimer")
+@bp.route("/disclaimer")
 def disclaimer():
     return render_template("disclaimer.html")
 
 
-@app.route('/dev')
+@bp.route('/dev')
 def dev():
     return render_template('dev.html')
 
 
 # --- API: DASHBOARD ---
 
-@app.route("/api/stats")
+def stats_payload():
+    """Agregações do dashboard (calculadas apenas em cache miss)."""
+    # 1. OPERAÇÕES NO BANCO PRINCIPAL (STREAM)
+    # Inicializa o contexto de conexão
+    conn = get_main_db()
+    cur = conn.cursor()
+
+    # Recupera Jogadas de Alta Convicção (Comportamento de aposta repetida)
+    # Lido dos rollups mantidos pelo scanner: uma linha por mercado
+    cur.execute("""
+        SELECT
+            NULLIF(market_question, '') AS market_question,
+            NULLIF(bet_link, '') AS link,
+            bet_count AS count,
+            total_size / bet_count AS avg_size
+        FROM rollup_market
+        WHERE bet_count >= 1
+        ORDER BY avg_size DESC
+        LIMIT 5
+    """)
+    conviction = [dict(r) for r in cur.fetchall()]
+
+    # Recupera Atividade Agregada de Baleias (Maiores volumes por carteira)
+    cur.execute("""
+        SELECT
+            r.whale_address,
+            NULLIF(r.market_question, '') AS market_question,
+            r.total_size,
+            w.funding_source,
+            NULLIF(r.bet_link, '') AS bet_link
+        FROM rollup_wallet_market r
+        JOIN whales w ON r.whale_address = w.address
+        ORDER BY r.total_size DESC
+        LIMIT 10
+    """)
+    whales = [dict(r) for r in cur.fetchall()]
+
+    # Feed de Ticker em Tempo Real (Últimas apostas)
+    cur.execute("""
+        SELECT b.*, w.funding_source
+        FROM bets b
+        JOIN whales w ON b.whale_address = w.address
+        ORDER BY b.timestamp DESC
+        LIMIT 20
+    """)
+    feed = [dict(r) for r in cur.fetchall()]
+
+    # Cálculo do Gráfico de Velocidade (Janela de 24h / Buckets de 30min, o último em andamento)
+    # Lido das séries pré-computadas (timeseries.py), já com os buckets vazios zerados
+    num_points = 48  # 24 horas * 2 pontos/hora
+    current_bucket = (int(time.time()) // VELOCITY_BUCKET) * VELOCITY_BUCKET
+    chart_data = timeseries.series(conn, VELOCITY_BUCKET, current_bucket - (num_points - 1) * VELOCITY_BUCKET,
+                                   current_bucket + VELOCITY_BUCKET)["volume"]
+
+    # Análise de Sentimento (Razão Bull/Bear baseada em atividade recente)
+    cur.execute("""
+        SELECT
+            SUM(CASE WHEN position LIKE '%Yes%' THEN 1 ELSE 0 END) AS bull_count,
+            SUM(CASE WHEN position LIKE '%No%' THEN 1 ELSE 0 END) AS bear_count,
+            AVG(size_usd) AS avg_bet
+        FROM (
+            SELECT position, size_usd
+            FROM bets
+            ORDER BY timestamp DESC
+            LIMIT 100
+        )
+    """)
+    sent_data = cur.fetchone()
+    sentiment = {
+        "bulls": sent_data["bull_count"] or 0,
+        "bears": sent_data["bear_count"] or 0,
+        "avg_size": sent_data["avg_bet"] or 0,
+    }
+
+    # Calcula o Volume Total do Mercado monitorado
+    cur.execute("SELECT value FROM rollup_totals WHERE name = 'total_volume'")
+    row = cur.fetchone()
+    total_market_vol = (row[0] if row else 0) or 0
+
+    # 2. OPERAÇÕES NO BANCO INSIDER (FORENSE)
+    # Cruzamento de dados com informações verificadas de insiders
+    conn_in = get_insider_db()
+    cur_in = conn_in.cursor()
+    cur_in.execute("SELECT value FROM rollup_totals WHERE name = 'intel_volume'")
+    row = cur_in.fetchone()
+    verified_whale_vol = (row[0] if row else 0) or 0
+
+    retail_vol = max(0, total_market_vol - verified_whale_vol)
+    volume_split = {
+        "whale": verified_whale_vol,
+        "retail": retail_vol,
+    }
+
+    return {
+        "conviction_plays": conviction,
+        "largest_whales": whales,
+        "feed": feed,
+        "volume_chart": volume_split,
+        "velocity_chart": chart_data,
+        "velocity_bucket": current_bucket,  # Bucket do último ponto (o SSE desloca a série a partir dele)
+        "sentiment": sentiment,
+    }
+
+
+@bp.route("/api/stats")
 def stats():
-    start_time = time.time()
+    try:
+        return cached_json(stats_payload, int(time.time()) // VELOCITY_BUCKET)
+    except Exception as e:
+        return query_failed(e)
 
+
+# --- API: SÉRIES DE VELOCIDADE ---
+
+@bp.route("/api/velocity")
+def velocity():
+    """
+    Volume e número de apostas por bucket. Parâmetros: resolution (1m, 5m, 30m,
+    1h, 1d ou segundos), start/end (epoch) ou hours, e market (market_question)
+    ou wallet para filtrar. Sem filtro, a série global.
+    """
     try:
-        # 1. OPERAÇÕES NO BANCO PRINCIPAL (STREAM)
-        # Inicializa o contexto de conexão
-        conn = get_main_db()
-        cur = conn.cursor()
-
-        # Recupera Jogadas de Alta Convicção (Comportamento de aposta repetida)
-        cur.execute("""
-            SELECT
-                market_question,
-                MAX(bet_link) AS link,
-                COUNT(*) AS count,
-                AVG(size_usd) AS avg_size
-            FROM bets
-            GROUP BY market_question
-            HAVING count >= 1
-            ORDER BY avg_size DESC
-            LIMIT 5
-        """)
-        conviction = [dict(r) for r in cur.fetchall()]
-
-        # Recupera Atividade Agregada de Baleias (Maiores volumes por carteira)
-        cur.execute("""
-            SELECT
-                b.whale_address,
-                b.market_question,
-                SUM(b.size_usd) AS total_size,
-                w.funding_source,
-                b.bet_link
-            FROM bets b
-            JOIN whales w ON b.whale_address = w.address
-            GROUP BY b.whale_address, b.market_question
-            ORDER BY total_size DESC
-            LIMIT 10
-        """)
-        whales = [dict(r) for r in cur.fetchall()]
-
-        # Feed de Ticker em Tempo Real (Últimas apostas)
-        cur.execute("""
-            SELECT b.*, w.funding_source
-            FROM bets b
-            JOIN whales w ON b.whale_address = w.address
-            ORDER BY b.timestamp DESC
-            LIMIT 20
-        """)
-        feed = [dict(r) for r in cur.fetchall()]
-
-        # Cálculo do Gráfico de Velocidade (Janela de 24h / Buckets de 30min)
-        current_ts = int(time.time())
-        twenty_four_hours_ago = current_ts - 86400
-        bucket_size = 1800  # Resolução de 30 minutos
-
-        cur.execute("""
-            SELECT
-                (timestamp / ?) * ? AS bucket,
-                SUM(size_usd) AS volume
-            FROM bets
-            WHERE timestamp > ?
-            GROUP BY bucket
-            ORDER BY bucket ASC
-        """, (bucket_size, bucket_size, twenty_four_hours_ago))
-
-        velocity_rows = [dict(r) for r in cur.fetchall()]
-        velocity_map = {row["bucket"]: row["volume"] for row in velocity_rows}
-
-        # Preenche buckets vazios com zero para continuidade do gráfico
-        chart_data = []
-        num_points = 48  # 24 horas * 2 pontos/hora
-
-        for i in range(num_points):
-            t = current_ts - (bucket_size * (num_points - 1 - i))
-            bucket = (t // bucket_size) * bucket_size
-            chart_data.append(velocity_map.get(bucket, 0))
-
-        # Análise de Sentimento (Razão Bull/Bear baseada em atividade recente)
-        cur.execute("""
-            SELECT
-                SUM(CASE WHEN position LIKE '%Yes%' THEN 1 ELSE 0 END) AS bull_count,
-                SUM(CASE WHEN position LIKE '%No%' THEN 1 ELSE 0 END) AS bear_count,
-                AVG(size_usd) AS avg_bet
-            FROM (
-                SELECT position, size_usd
-                FROM bets
-                ORDER BY timestamp DESC
-                LIMIT 100
-            )
-        """)
-        sent_data = cur.fetchone()
-        sentiment = {
-            "bulls": sent_data["bull_count"] or 0,
-            "bears": sent_data["bear_count"] or 0,
-            "avg_size": sent_data["avg_bet"] or 0,
-        }
-
-        # Calcula o Volume Total do Mercado monitorado
-        cur.execute("SELECT SUM(size_usd) FROM bets")
-        total_market_vol = cur.fetchone()[0] or 0
-        conn.close()
-
-        # 2. OPERAÇÕES NO BANCO INSIDER (FORENSE)
-        # Cruzamento de dados com informações verificadas de insiders
-        conn_in = get_insider_db()
-        cur_in = conn_in.cursor()
-        cur_in.execute("SELECT SUM(size_usd) FROM intel_bets")
-        verified_whale_vol = cur_in.fetchone()[0] or 0
-        conn_in.close()
-
-        retail_vol = max(0, total_market_vol - verified_whale_vol)
-        volume_split = {
-            "whale": verified_whale_vol,
-            "retail": retail_vol,
-        }
-
-        latency = round((time.time() - start_time) * 1000, 2)
-
-        return jsonify({
-            "conviction_plays": conviction,
-            "largest_whales": whales,
-            "feed": feed,
-            "volume_chart": volume_split,
-            "velocity_chart": chart_data,
-            "sentiment": sentiment,
-            "latency": latency,
-        })
+        resolution = timeseries.parse_resolution(request.args.get("resolution", "30m"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    now = int(time.time())
+    end = request.args.get("end", now, type=int)
+    hours = request.args.get("hours", type=float)
+    start = request.args.get("start", int(end - hours * 3600) if hours else end - VELOCITY_DEFAULT_POINTS * resolution,
+                             type=int)
+    if -(-(end - start) // resolution) > VELOCITY_MAX_POINTS:
+        return jsonify({"error": f"intervalo acima de {VELOCITY_MAX_POINTS} pontos; use uma resolução maior"}), 400
+
+    market, wallet = request.args.get("market"), request.args.get("wallet")
+    if market is not None and wallet is not None:
+        return jsonify({"error": "use market ou wallet, não os dois"}), 400
+    scope, key = ("market", market) if market is not None else ("wallet", wallet.lower()) if wallet else ("all", "")
+
+    def payload():
+        points = timeseries.series(get_main_db(), resolution, start, end, scope, key)
+        return dict(points, resolution=resolution, scope=scope, key=key)
 
+    try:
+        return cached_json(payload, now // resolution)
     except Exception as e:
-        return jsonify({"error": str(e)})
+        return query_failed(e)
 
 
 # --- API: DADOS INSIDER ---
 
-@app.route("/api/insider_data")
+def insider_payload():
+    """Roster de carteiras institucionais monitoradas."""
+    conn = get_insider_db()
+    cur = conn.cursor()
+
+    # Recupera lista de carteiras monitoradas por ordem de atividade.
+    # Principal mercado de atuação e maior aposta são mantidos pelo scanner
+    # em colunas desnormalizadas: uma única consulta por requisição.
+    cur.execute("""
+        SELECT
+            address,
+            total_scanned_volume,
+            last_active_ts,
+            funding_source,
+            account_created_ts,
+            IFNULL(top_market, 'Analisando...') AS top_market,
+            IFNULL(max_bet, 0) AS max_bet
+        FROM intel_whales
+        ORDER BY last_active_ts DESC
+        LIMIT 50
+    """)
+    return {"roster": [dict(r) for r in cur.fetchall()]}
+
+
+@bp.route("/api/insider_data")
 def insider_data():
-    start_time = time.time()
-
     try:
-        conn = get_insider_db()
-        cur = conn.cursor()
-
-        # Recupera lista de carteiras monitoradas por ordem de atividade
-        cur.execute("""
-            SELECT
-                address,
-                total_scanned_volume,
-                last_active_ts,
-                funding_source,
-                account_created_ts
-            FROM intel_whales
-            ORDER BY last_active_ts DESC
-            LIMIT 50
-        """)
-        roster = [dict(r) for r in cur.fetchall()]
-
-        # Enriquece a lista com o principal mercado de atuação e a maior aposta
-        for r in roster:
-            cur.execute("""
-                SELECT market_question
-                FROM intel_bets
-                WHERE whale_address = ?
-                GROUP BY market_question
-                ORDER BY SUM(size_usd) DESC
-                LIMIT 1
-            """, (r["address"],))
-            top = cur.fetchone()
-            r["top_market"] = top["market_question"] if top else "Analisando..."
-
-            cur.execute("""
-                SELECT MAX(size_usd) AS big_bet
-                FROM intel_bets
-                WHERE whale_address = ?
-            """, (r["address"],))
-            mb = cur.fetchone()
-            r["max_bet"] = mb["big_bet"] if mb["big_bet"] else 0
-
-        conn.close()
-
-        latency = round((time.time() - start_time) * 1000, 2)
-        return jsonify({"roster": roster, "latency": latency})
-
+        return cached_json(insider_payload)
     except Exception as e:
-        return jsonify({"error": str(e)})
+        return query_failed(e)
+
+
+def whale_history_payload(address):
+    """Histórico detalhado de apostas para uma carteira específica."""
+    conn = get_insider_db()
+    cur = conn.cursor()
 
+    cur.execute("""
+        SELECT *
+        FROM intel_bets
+        WHERE whale_address = ?
+        ORDER BY timestamp DESC
+        LIMIT 50
+    """, (address,))
+    history = [dict(r) for r in cur.fetchall()]
 
-@app.route("/api/whale/<address>")
+    return {"history": history}
+
+
+@bp.route("/api/whale/<address>")
 def whale_history(address):
     try:
-        conn = get_insider_db()
-        cur = conn.cursor()
-
-        # Histórico detalhado de apostas para uma carteira específica
-        cur.execute("""
-            SELECT *
-            FROM intel_bets
-            WHERE whale_address = ?
-            ORDER BY timestamp DESC
-            LIMIT 50
-        """, (address,))
-        history = [dict(r) for r in cur.fetchall()]
-        conn.close()
+        return cached_json(lambda: whale_history_payload(address), address)
+    except Exception as e:
+        query_failed(e)
+        return jsonify({"history": []})
 
-        return jsonify({"history": history})
 
-    except Exception:
-        return jsonify({"history": []})
+# --- API: CLUSTERS DE CARTEIRAS ---
+
+def clusters_payload(min_size, limit):
+    """Clusters de carteiras ligadas (co-movimento ou financiador comum), por volume."""
+    conn = get_main_db()
+    top = conn.execute("""
+        SELECT cluster_id, MAX(size) AS size, MAX(volume) AS volume, MAX(last_ts) AS last_ts
+        FROM wallet_clusters
+        GROUP BY cluster_id
+        HAVING MAX(size) >= ?
+        ORDER BY volume DESC
+        LIMIT ?
+    """, (min_size, limit)).fetchall()
+    clusters = []
+    for c in top:
+        members = conn.execute(
+            "SELECT wallet, reason, funder FROM wallet_clusters WHERE cluster_id = ? ORDER BY wallet",
+            (c["cluster_id"],)).fetchall()
+        clusters.append(dict(c, members=[dict(m) for m in members]))
+    return {"clusters": clusters}
+
+
+@bp.route("/api/clusters")
+def clusters():
+    min_size = max(request.args.get("min_size", 2, type=int), 2)
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    try:
+        return cached_json(lambda: clusters_payload(min_size, limit))
+    except Exception as e:
+        return query_failed(e)
+
+
+# --- API: SAÚDE DOS SHARDS (supervisor.py) ---
+
+@bp.route("/api/shards")
+def shards():
+    try:
+        rows = [dict(r) for r in get_main_db().execute("SELECT * FROM scanner_shards ORDER BY shard")]
+    except Exception as e:
+        return query_failed(e)
+    now = time.time()
+    for r in rows:
+        r["heartbeat_age"] = round(now - r["heartbeat_ts"], 1) if r["heartbeat_ts"] else None
+    return jsonify({"shards": rows})
+
+
+# --- API: ANALYTICS (tabelas geradas pelo analytics.py) ---
+
+ANALYTICS_VIEWS = {
+    # visão: (tabela, colunas de ordenação permitidas, ordenação padrão)
+    "wallets": ("analytics_wallets", ("gross", "net_exposure", "hedge_ratio", "bets", "markets", "burst_ratio", "last_ts"), "gross"),
+    "markets": ("analytics_markets", ("volume", "skew", "bets", "wallets"), "volume"),
+    "comovement": ("analytics_comovement", ("score", "same_direction", "shared_markets"), "same_direction"),
+}
+
+
+def analytics_payload(view, source, sort, order, limit):
+    """Linhas de uma tabela de analytics, com a data da última execução."""
+    table, _, _ = ANALYTICS_VIEWS[view]
+    conn = get_insider_db() if source == "insider" else get_main_db()
+    rows = [dict(r) for r in conn.execute(
+        f"SELECT * FROM {table} ORDER BY {sort} {order} LIMIT ?", (limit,))]
+    run = conn.execute("SELECT started_ts, rows, elapsed FROM analytics_runs ORDER BY id DESC LIMIT 1").fetchone()
+    return {"rows": rows, "run": dict(run) if run else None}
+
+
+@bp.route("/api/analytics/<view>")
+def analytics(view):
+    if view not in ANALYTICS_VIEWS:
+        return jsonify({"error": f"visão desconhecida: {view}"}), 404
+    _, sortable, default_sort = ANALYTICS_VIEWS[view]
+    source = "insider" if request.args.get("source") == "insider" else "main"
+    sort = request.args.get("sort", default_sort)
+    if sort not in sortable:
+        sort = default_sort
+    order = "ASC" if request.args.get("order") == "asc" else "DESC"
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    try:
+        return cached_json(lambda: analytics_payload(view, source, sort, order, limit), view)
+    except Exception as e:
+        return query_failed(e)
+
+
+# --- MÉTRICAS (PROMETHEUS) ---
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    st = state()
+    own = {"process": st.process, "families": metrics.REGISTRY.snapshot()}
+    others = metrics.collect_dir(METRICS_DIR, max_age=METRICS_STALE_AFTER, exclude={st.process})
+    return Response(metrics.render([own] + others), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# --- API: FEED AO VIVO (SSE) ---
+
+@bp.route("/api/stream")
+def stream():
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    event_hub = state().event_hub
+    q = event_hub.subscribe(int(last_id) if last_id and last_id.isdigit() else None)
+    if q is None:
+        # Threads do worker reservadas para a API: o cliente fica no polling e tenta de novo depois
+        return Response(f"retry: {SSE_RETRY_AFTER * 1000}\n\n", status=503, mimetype="text/event-stream",
+                        headers={"Retry-After": str(SSE_RETRY_AFTER), "Cache-Control": "no-cache"})
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    frame = q.get(timeout=15)
+                except queue.Empty:
+                    yield ": ping\n\n"  # Mantém a conexão viva através de proxies
+                    continue
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            event_hub.unsubscribe(q)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
-    print(">> Servidor Online na Porta 5000")
+    print(">> Servidor Online na Porta 5000 (desenvolvimento; produção: gunicorn -c gunicorn.conf.py)")
     # Em produção, debug deve ser False para evitar vulnerabilidades de execução de código
-    app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=5000, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,518 @@
+"""
+Modo supervisor: N processos de scanner, cada um dono de um shard de conditionIds.
+
+    python supervisor.py --shards 4
+
+Topologia (uma máquina, sem broker externo, apenas filas do multiprocessing):
+
+    supervisor  -- pagina /trades, mantém o registro de mercados, o cursor e a fita;
+                   filtra pelo registro e despacha lotes por crc32(conditionId) % N
+    shard i     -- DualPipeline + buckets + forense dos mercados do shard
+    escritor    -- único processo que grava apostas/eventos (BetWriter), recebendo
+                   as operações de todos os shards por uma fila
+
+Como cada (conditionId, lado) pertence a um único shard, buckets de acumulação e
+co-movimento de clusters ficam inteiros dentro de um processo. Ligações por
+financiador são repassadas a todos os shards, e o supervisor funde os clusters
+reportados em um índice global, o único gravado em `wallet_clusters`.
+
+Cada shard envia heartbeats com lag e profundidade de fila; o supervisor grava a
+saúde na tabela `scanner_shards` (lida pelo /api/shards) e reinicia processos mortos.
+O cursor é salvo após o despacho: lotes ainda na fila de um shard que morrer são perdidos.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+import zlib
+from datetime import datetime
+
+from PolyInsideScanner import (
+    API_LIMITS, DB_INSIDER, DB_MAIN, DEAD_LETTER_PATH, FLUSH_MAX_LATENCY, FLUSH_MAX_RETRIES, FLUSH_MAX_ROWS,
+    LADDER_MAX_BUCKETS, LADDER_SNAPSHOT_INTERVAL, METRICS_DIR, METRICS_INTERVAL, POLL_SECONDS, PROFILE_DIR,
+    PROFILE_INTERVAL, PROFILE_ON_START, SHARD_COUNT, SHARD_HEALTH_INTERVAL, SHARD_QUEUE_SIZE, SHARD_SHUTDOWN_TIMEOUT,
+    SHARD_STALE_AFTER, SHARD_TICK_INTERVAL, TRADES_PAGE_SIZE, TRADES_PER_CYCLE, WAL_CHECKPOINT_INTERVAL,
+    WAL_TRUNCATE_BYTES, WRITER_QUEUE_SIZE, WhaleSentinel, configure_wal,
+)
+from bet_writer import BetWriter
+from checkpoint import WalCheckpointer
+from metrics import MetricsPublisher
+from profiler import SamplingProfiler, install_toggle
+import metrics
+
+
+def shard_of(cid, count):
+    """Shard dono de um conditionId (crc32 é estável entre processos, ao contrário de hash())."""
+    return zlib.crc32(cid.encode()) % count
+
+
+def queue_depth(q):
+    try:
+        return q.qsize()
+    except NotImplementedError:  # macOS
+        return -1
+
+
+# ==========================================
+# PROCESSO ESCRITOR
+# ==========================================
+
+class QueueWriter:
+    """
+    Substituto do BetWriter dentro dos shards: cada chamada vira uma operação na
+    fila do processo escritor. `put` bloqueia com a fila cheia (backpressure em
+    vez de descartar detecções).
+    """
+
+    def __init__(self, ops):
+        self.ops = ops
+
+    def add_bet(self, b, intel):
+        self.ops.put(("add_bet", b, intel))
+
+    def add_insider(self, b, intel):
+        self.ops.put(("add_insider", b, intel))
+
+    def update_intel(self, wallet, intel):
+        self.ops.put(("update_intel", wallet, intel))
+
+    def emit(self, kind, payload):
+        self.ops.put(("emit", kind, payload))
+
+    def flush(self):
+        pass  # O escritor grava por tamanho de lote e latência
+
+    def close(self):
+        pass  # O processo escritor é encerrado pelo supervisor
+
+
+def run_writer(ops, db_main, db_insider, max_rows, max_latency):
+    """Processo escritor: aplica as operações de todos os shards em um único BetWriter."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C é coordenado pelo supervisor
+    configure_wal()
+    checkpointer = None
+    if WAL_CHECKPOINT_INTERVAL:
+        checkpointer = WalCheckpointer([db_main, db_insider], interval=WAL_CHECKPOINT_INTERVAL,
+                                       truncate_bytes=WAL_TRUNCATE_BYTES)
+        checkpointer.start()
+    writer = BetWriter(db_main, db_insider, max_rows=max_rows, max_latency=max_latency, max_retries=FLUSH_MAX_RETRIES,
+                       dead_letter=DEAD_LETTER_PATH)
+    publisher = MetricsPublisher(METRICS_DIR, "writer", interval=METRICS_INTERVAL)
+    publisher.start()
+    profiler = SamplingProfiler(PROFILE_DIR, "writer", interval=PROFILE_INTERVAL)
+    install_toggle(profiler)
+    if PROFILE_ON_START:
+        profiler.start()
+    try:
+        while True:
+            op = ops.get()
+            if op is None:
+                break
+            try:
+                getattr(writer, op[0])(*op[1:])
+            except Exception as e:
+                print(f"!! [Erro] Operação de escrita inválida ({op[0]}): {e}")
+    finally:
+        writer.close()
+        if checkpointer is not None:
+            checkpointer.close()
+        profiler.stop()
+        publisher.close()
+
+
+# ==========================================
+# SHARD
+# ==========================================
+
+class ShardWorker(WhaleSentinel):
+    """
+    Scanner de um shard. Reaproveita a classificação e a forense do
+    WhaleSentinel, mas recebe os trades já paginados pelo supervisor, grava pelo
+    processo escritor e divide os limites de API com os demais shards.
+    """
+
+    def __init__(self, shard, count, inbox, outbox, writer):
+        configure_wal()  # O checkpointer do processo escritor cuida também das conexões dos shards
+        self.shard = shard
+        self.count = count
+        self.inbox = inbox
+        self.outbox = outbox
+        # Snapshot do registro (sincronizado pelo supervisor); relido quando um lote traz mercados alterados
+        self.open_markets(None)
+        self.markets.load()
+        self.open_ladder(max(1000, LADDER_MAX_BUCKETS // count), owns=self.owns)
+        self.writer = writer
+        self.open_api({name: (max(1, c // count), r / count) for name, (c, r) in API_LIMITS.items()})
+        self.open_clusters(readonly=True)
+        self.tape = None
+        self.open_pipeline(owns=self.owns)
+        self.dropped = 0
+        self.seq = 0
+        self.lag = None
+        self.queue_delay = 0.0
+        self.start_instrumentation(f"shard-{shard}")
+
+    def owns(self, cid):
+        return shard_of(cid, self.count) == self.shard
+
+    def on_intel(self, wallet, intel):
+        super().on_intel(wallet, intel)
+        if intel.get('funder'):
+            # O supervisor repassa a ligação aos outros shards e ao índice global
+            self.outbox.put(("funder", self.shard, wallet, intel['funder']))
+
+    def ingest_batch(self, seq, sent, batch):
+        self.queue_delay = time.time() - sent
+        # Mercado novo ou alterado: relê o registro gravado pelo supervisor, o que também retira
+        # os mercados encerrados desde o último lote (o conjunto de ids não só cresce)
+        if any(self.market_cache.get(t['conditionId']) != entry for _, t, entry in batch):
+            self.markets.load()
+        for ts, t, entry in batch:
+            cid = t['conditionId']
+            if self.market_cache.get(cid) != entry:
+                self.market_cache[cid] = entry
+                self.politics_ids.add(cid)
+            try:
+                self.pipeline.ingest(t, ts)
+            except (KeyError, TypeError, ValueError):
+                self.dropped += 1
+        self.lag = time.time() - batch[-1][0]
+        self.seq = seq
+
+    def health(self):
+        st = self.pipeline.stats
+        return {
+            "pid": os.getpid(), "seq": self.seq, "trades": st["trades"], "dropped": self.dropped,
+            "lag": self.lag, "queue_delay": self.queue_delay, "buckets": len(self.ladder_buckets),
+            "enrich_backlog": self.enricher.backlog(),
+            "detections": st["settled_insider"] + st["critical"] + st["cluster"], "heartbeat": time.time(),
+        }
+
+    def run(self):
+        """Loop do shard: processa lotes e mensagens de controle até receber "stop"."""
+        self.ladder_buckets.resolve_markets()
+        last_tick = last_health = last_snapshot = time.time()
+        while True:
+            try:
+                msg = self.inbox.get(timeout=1.0)
+            except queue.Empty:
+                msg = None
+            if msg is not None:
+                if msg[0] == "stop":
+                    break
+                if msg[0] == "trades":
+                    self.ingest_batch(*msg[1:])
+                elif msg[0] == "funder":
+                    self.clusters.link_funder(msg[1], msg[2])
+
+            now = time.time()
+            if now - last_tick >= SHARD_TICK_INTERVAL:
+                self.process_ladders()
+                last_tick = now
+            if now - last_health >= SHARD_HEALTH_INTERVAL:
+                self.outbox.put(("health", self.shard, self.health()))
+                last_health = now
+            if now - last_snapshot >= LADDER_SNAPSHOT_INTERVAL:
+                self.ladder_buckets.save()
+                if self.scorer is not None:
+                    self.scorer.save()
+                self.outbox.put(("clusters", self.shard, self.clusters.clusters()))
+                last_snapshot = now
+
+    def shutdown(self):
+        self.markets.close()
+        self.ladder_buckets.close()
+        if self.scorer is not None:
+            self.scorer.close()
+        self.enricher.close()
+        self.api.close()
+        self.outbox.put(("clusters", self.shard, self.clusters.clusters()))
+        self.outbox.put(("health", self.shard, self.health()))
+        self.intel_cache.close()
+        self.stop_instrumentation()
+
+
+def run_shard(shard, count, inbox, outbox, ops):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C é coordenado pelo supervisor
+    worker = ShardWorker(shard, count, inbox, outbox, QueueWriter(ops))
+    try:
+        worker.run()
+    finally:
+        worker.shutdown()
+
+
+# ==========================================
+# SUPERVISOR
+# ==========================================
+
+class ShardSupervisor(WhaleSentinel):
+    """
+    Processo principal do modo multiprocesso: ingestão, registro de mercados,
+    despacho por shard, índice global de clusters e monitoramento de saúde.
+    """
+
+    def __init__(self, count):
+        configure_wal()
+        self.count = count
+        self.initialize_databases()
+        self.open_markets(self.fetch_events_page)
+        self.open_ingest()
+        self.open_api(API_LIMITS)
+        self.open_clusters()  # Índice global: funde os clusters dos shards e é o único gravado em disco
+        self.open_tape()
+        self.open_maintenance()
+        self.health_conn = self.get_db_connection(DB_MAIN)
+
+        ctx = mp.get_context("spawn")  # Sem fork de um processo com threads ativas
+        self.ctx = ctx
+        self.ops = ctx.Queue(WRITER_QUEUE_SIZE)
+        self.outbox = ctx.Queue()
+        self.inboxes = [ctx.Queue(SHARD_QUEUE_SIZE) for _ in range(count)]
+        self.procs = [None] * count
+        self.spawned = [0.0] * count
+        self.restarts = [0] * count
+        self.health = [{} for _ in range(count)]
+        self.writer_proc = None
+        self.seq = 0
+        self.stats = {"dispatched": 0, "filtered": 0, "writer_restarts": 0}
+        self.start_instrumentation("supervisor")
+
+    # --- PROCESSOS ---
+
+    def _spawn_writer(self):
+        self.writer_proc = self.ctx.Process(
+            target=run_writer, args=(self.ops, DB_MAIN, DB_INSIDER, FLUSH_MAX_ROWS, FLUSH_MAX_LATENCY),
+            name="sentinel-writer")
+        self.writer_proc.start()
+
+    def _spawn(self, i):
+        p = self.ctx.Process(target=run_shard, args=(i, self.count, self.inboxes[i], self.outbox, self.ops),
+                             name=f"sentinel-shard-{i}")
+        p.start()
+        self.procs[i] = p
+        self.spawned[i] = time.time()
+
+    def start(self):
+        self._spawn_writer()
+        for i in range(self.count):
+            self._spawn(i)
+
+    def check_processes(self):
+        """Reinicia processos que morreram (o estado do shard volta do último snapshot)."""
+        if not self.writer_proc.is_alive():
+            self.stats["writer_restarts"] += 1
+            print(f"\n!! [Erro] Processo escritor encerrou (código {self.writer_proc.exitcode}). Reiniciando.")
+            self._spawn_writer()
+        for i, p in enumerate(self.procs):
+            if not p.is_alive():
+                self.restarts[i] += 1
+                lost = queue_depth(self.inboxes[i])
+                print(f"\n!! [Erro] Shard {i} encerrou (código {p.exitcode}); {lost} lote(s) descartados. Reiniciando.")
+                # Fila nova: o processo morto pode ter levado o lock de leitura da antiga
+                self.inboxes[i] = self.ctx.Queue(SHARD_QUEUE_SIZE)
+                self._spawn(i)
+
+    # --- DESPACHO ---
+
+    def dispatch(self, fresh):
+        """Filtra pelo registro de mercados e envia um lote por shard."""
+        batches = [[] for _ in range(self.count)]
+        for key, ts, t in fresh:
+            cid = t.get('conditionId')
+            entry = self.market_cache.get(cid)
+            if entry is None:
+                self.stats["filtered"] += 1
+            else:
+                batches[shard_of(cid, self.count)].append((ts, t, entry))
+            self.cursor.mark(key, ts)
+
+        self.seq += 1
+        sent = time.time()
+        for i, batch in enumerate(batches):
+            if not batch:
+                continue
+            while True:
+                try:
+                    self.inboxes[i].put(("trades", self.seq, sent, batch), timeout=5)
+                    break
+                except queue.Full:
+                    # Shard saturado: segue consumindo mensagens para não travar os processos
+                    self.drain()
+                    self.check_processes()
+            self.stats["dispatched"] += len(batch)
+
+    def drain(self, timeout=0.0):
+        """Processa as mensagens dos shards (heartbeats, clusters, financiadores) por até `timeout` segundos."""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                msg = self.outbox.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                return
+            kind, shard = msg[0], msg[1]
+            if kind == "health":
+                self.health[shard] = msg[2]
+            elif kind == "clusters":
+                self.clusters.merge(msg[2])
+            elif kind == "funder":
+                wallet, funder = msg[2], msg[3]
+                self.clusters.link_funder(wallet, funder)
+                for i, inbox in enumerate(self.inboxes):
+                    if i != shard:
+                        inbox.put(("funder", wallet, funder))
+
+    # --- SAÚDE ---
+
+    def shard_rows(self):
+        now = time.time()
+        markets = [0] * self.count
+        for cid in list(self.politics_ids):
+            markets[shard_of(cid, self.count)] += 1
+        rows = []
+        for i in range(self.count):
+            h, p = self.health[i], self.procs[i]
+            heartbeat = max(h.get("heartbeat", 0), self.spawned[i])
+            alive = p is not None and p.is_alive() and now - heartbeat < SHARD_STALE_AFTER
+            rows.append((i, h.get("pid", p.pid if p else None), int(alive), self.restarts[i], markets[i],
+                         h.get("trades", 0), queue_depth(self.inboxes[i]), h.get("lag"),
+                         h.get("queue_delay"), h.get("buckets", 0), h.get("enrich_backlog", 0), int(heartbeat)))
+        return rows
+
+    def report(self, warn=True):
+        """Grava a saúde dos shards em `scanner_shards`. Retorna as linhas."""
+        rows = self.shard_rows()
+        try:
+            self.health_conn.execute("DELETE FROM scanner_shards WHERE shard >= ?", (self.count,))
+            self.health_conn.executemany(
+                '''INSERT OR REPLACE INTO scanner_shards (shard, pid, alive, restarts, markets, trades, queue_depth,
+                       lag, queue_delay, buckets, enrich_backlog, heartbeat_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                rows)
+            self.health_conn.commit()
+        except Exception as e:
+            print(f"\n!! [Erro] Falha ao gravar saúde dos shards: {e}")
+        for r in rows if warn else ():
+            if not r[2]:
+                print(f"\n!! [Aviso] Shard {r[0]} sem heartbeat há {time.time() - r[11]:.0f}s.")
+        return rows
+
+    def collect_metrics(self):
+        families = super().collect_metrics()
+        families.append(metrics.stats_family("sentinel_supervisor_total", "Despacho de trades para os shards", self.stats))
+        families.append(("sentinel_writer_queue_depth", "gauge", "Operações pendentes no processo escritor",
+                         [({}, queue_depth(self.ops))]))
+        lag, depth, alive = [], [], []
+        for r in self.shard_rows():
+            labels = {"shard": r[0]}
+            alive.append((labels, r[2]))
+            depth.append((labels, r[6]))
+            if r[7] is not None:
+                lag.append((labels, r[7]))
+        families += [
+            ("sentinel_shard_up", "gauge", "Shard vivo e com heartbeat recente", alive),
+            ("sentinel_shard_queue_depth", "gauge", "Lotes na fila de entrada do shard", depth),
+            ("sentinel_shard_lag_seconds", "gauge", "Atraso do último trade processado pelo shard", lag),
+        ]
+        return families
+
+    def status_line(self, rows):
+        lags = " ".join(f"#{r[0]}:{r[7]:.0f}s" if r[7] is not None else f"#{r[0]}:-" for r in rows)
+        return (f"\rSupervisor | Mercados: {len(self.politics_ids)} | Trades: {self.stats['dispatched']} despachados / "
+                f"{self.stats['filtered']} fora do registro | Lag: {lags} | Fila escritor: {queue_depth(self.ops)} "
+                f"| Intervalo: {self.poller.interval:.0f}s   ")
+
+    # --- LOOP PRINCIPAL ---
+
+    def watch(self):
+        print(f">> SUPERVISOR SENTINEL ONLINE ({self.count} shards + processo escritor)")
+        if self.cursor.last_ts is None:
+            self.cursor.start_at(int(time.time()))
+        else:
+            print(f">> [Sistema] Retomando ingestão a partir do cursor {datetime.fromtimestamp(self.cursor.last_ts)}")
+
+        self.start()
+        self.archive.start()
+        self.downsampler.start()
+        last_health = last_snapshot = time.time()
+        rows = self.shard_rows()
+        while True:
+            try:
+                print(self.status_line(rows), end="", flush=True)
+                with POLL_SECONDS.time():
+                    fresh, pages = self.pager.fetch_new(self.cursor)
+                TRADES_PER_CYCLE.observe(len(fresh))
+                if self.tape is not None:
+                    self.tape.record(t for _, _, t in fresh)
+                self.dispatch(fresh)
+                self.cursor.save()
+
+                # Espera o próximo ciclo atendendo os shards
+                deadline = time.time() + self.poller.update(len(fresh), pages, TRADES_PAGE_SIZE)
+                while True:
+                    now = time.time()
+                    if now - last_health >= SHARD_HEALTH_INTERVAL:
+                        self.check_processes()
+                        rows = self.report()
+                        last_health = now
+                    if now - last_snapshot >= LADDER_SNAPSHOT_INTERVAL:
+                        self.clusters.save()
+                        last_snapshot = now
+                    if now >= deadline:
+                        break
+                    self.drain(min(1.0, deadline - now))
+
+            except KeyboardInterrupt:
+                print("\n>> Encerrando Supervisor Sentinel...")
+                break
+            except Exception as e:
+                self.cycle_error(e)
+                time.sleep(self.poller.interval)
+
+    def shutdown(self):
+        """Esvazia as filas dos shards e do escritor antes de encerrar."""
+        self.markets.close()
+        self.archive.close()
+        self.downsampler.close()
+        started = [p for p in self.procs if p is not None]
+        for i, p in enumerate(self.procs):
+            if p is not None:
+                self.inboxes[i].put(("stop",))
+        deadline = time.time() + SHARD_SHUTDOWN_TIMEOUT
+        while any(p.is_alive() for p in started) and time.time() < deadline:
+            self.drain(0.5)  # Os shards só terminam após entregar as últimas mensagens
+        self.drain()
+        for i, p in enumerate(self.procs):
+            if p is not None and p.is_alive():
+                print(f"!! [Aviso] Shard {i} não encerrou a tempo; finalizando à força.")
+                p.terminate()
+        if self.writer_proc is not None:
+            self.ops.put(None)
+            self.writer_proc.join(timeout=SHARD_SHUTDOWN_TIMEOUT)
+            if self.writer_proc.is_alive():
+                print("!! [Aviso] Processo escritor não encerrou a tempo; finalizando à força.")
+                self.writer_proc.terminate()
+        if started:
+            for r in self.report(warn=False):
+                print(f">> [Sistema] Shard {r[0]}: {r[5]} trades, {r[3]} reinícios, {r[4]} mercados")
+        self.clusters.close()
+        self.cursor.close()
+        self.api.close()
+        self.health_conn.close()
+        if self.tape is not None:
+            self.tape.close()
+            print(f">> [Sistema] Fita bruta: {self.tape.report()}")
+        self.stop_instrumentation()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PolySentinel em modo multiprocesso (shards por conditionId)")
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT, help="Processos de scanner (padrão: SCANNER_SHARDS ou CPUs - 2)")
+    args = parser.parse_args()
+
+    supervisor = ShardSupervisor(max(1, args.shards))
+    supervisor.map_markets()
+    try:
+        supervisor.watch()
+    finally:
+        supervisor.shutdown()
@@ -0,0 +1,357 @@
+"""
+Fita bruta de trades em formato colunar comprimido (.ptape).
+
+Cada arquivo cobre uma hora ou um dia (UTC) e é uma sequência append-only de
+chunks independentes:
+
+    cabeçalho  <4sIIIIqq>  magic "PTC1", linhas, bytes comprimidos, bytes brutos,
+                           crc32, menor timestamp, maior timestamp
+    payload    zlib(JSON do layout + buffers das colunas)
+
+Dentro do chunk cada campo do /trades vira uma coluna: inteiros em int64 com
+codificação delta, decimais em float64 e textos por dicionário (lista JSON de
+valores únicos + índices uint32). Campos ausentes são preservados. Um chunk
+truncado por queda do processo é detectado pelo tamanho/crc e ignorado.
+
+A leitura usa mmap e descomprime um chunk por vez; chunks fora do intervalo de
+tempo pedido são pulados sem descompressão.
+
+Uso:
+    python tape.py info tapes/                 # resumo (trades, bytes/trade, período)
+    python tape.py cat tapes/arquivo.ptape     # exporta JSONL para stdout
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime, timezone
+
+CHUNK_HEADER = struct.Struct("<4sIIIIqq")
+CHUNK_MAGIC = b"PTC1"
+MISSING = 0xFFFFFFFF  # Índice de dicionário para campo ausente no registro
+
+ROTATIONS = {"hour": "%Y%m%d-%H", "day": "%Y%m%d"}
+
+
+def _column_type(values):
+    """'i' (int64), 'f' (float64) ou 's' (dicionário de valores JSON)."""
+    if all(type(v) is int and -2 ** 62 < v < 2 ** 62 for v in values):  # Folga para os deltas
+        return "i"
+    if all(type(v) in (int, float) for v in values):
+        return "f"
+    return "s"
+
+
+def encode_chunk(trades):
+    """Serializa uma lista de trades (dicts) em bytes de chunk (cabeçalho + payload)."""
+    names = []
+    seen = set()
+    for t in trades:
+        for k in t:
+            if k not in seen:
+                seen.add(k)
+                names.append(k)
+
+    layout = []
+    buffers = []
+    for name in names:
+        present = [name in t for t in trades]
+        values = [t.get(name) for t in trades]
+        kind = _column_type(values) if all(present) else "s"
+
+        if kind == "i":
+            deltas = array("q", [values[0]] + [b - a for a, b in zip(values, values[1:])])
+            buf = deltas.tobytes()
+        elif kind == "f":
+            buf = array("d", values).tobytes()
+        else:
+            index = {}
+            codes = array("I")
+            for v, p in zip(values, present):
+                if not p:
+                    codes.append(MISSING)
+                    continue
+                key = json.dumps(v, separators=(",", ":"))
+                code = index.get(key)
+                if code is None:
+                    code = index[key] = len(index)
+                codes.append(code)
+            dictionary = ("[" + ",".join(index) + "]").encode()
+            buf = struct.pack("<I", len(dictionary)) + dictionary + codes.tobytes()
+        layout.append([name, kind, len(buf)])
+        buffers.append(buf)
+
+    head = json.dumps({"n": len(trades), "cols": layout}, separators=(",", ":")).encode()
+    raw = struct.pack("<I", len(head)) + head + b"".join(buffers)
+    comp = zlib.compress(raw, 6)
+
+    stamps = [int(t["timestamp"]) for t in trades if isinstance(t.get("timestamp"), (int, float))]
+    header = CHUNK_HEADER.pack(CHUNK_MAGIC, len(trades), len(comp), len(raw), zlib.crc32(comp),
+                               min(stamps, default=0), max(stamps, default=0))
+    return header + comp, len(raw)
+
+
+def decode_columns(payload):
+    """Descomprime um payload e retorna (linhas, {coluna: lista de valores}); ausentes viram MISSING_VALUE."""
+    raw = zlib.decompress(payload)
+    (head_len,) = struct.unpack_from("<I", raw, 0)
+    head = json.loads(raw[4:4 + head_len])
+    n = head["n"]
+    offset = 4 + head_len
+    columns = {}
+    for name, kind, size in head["cols"]:
+        buf = raw[offset:offset + size]
+        offset += size
+        if kind == "i":
+            deltas = array("q")
+            deltas.frombytes(buf)
+            values, acc = [], 0
+            for d in deltas:
+                acc += d
+                values.append(acc)
+        elif kind == "f":
+            arr = array("d")
+            arr.frombytes(buf)
+            values = arr.tolist()
+        else:
+            (dict_len,) = struct.unpack_from("<I", buf, 0)
+            dictionary = json.loads(buf[4:4 + dict_len])
+            codes = array("I")
+            codes.frombytes(buf[4 + dict_len:])
+            values = [MISSING_VALUE if c == MISSING else dictionary[c] for c in codes]
+        columns[name] = values
+    return n, columns
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING_VALUE = _Missing()
+
+
+def _valid_length(mm):
+    """Tamanho do prefixo com chunks íntegros (para descartar um final truncado)."""
+    offset = 0
+    size = len(mm)
+    while offset + CHUNK_HEADER.size <= size:
+        magic, _, comp_len, _, crc, _, _ = CHUNK_HEADER.unpack_from(mm, offset)
+        end = offset + CHUNK_HEADER.size + comp_len
+        if magic != CHUNK_MAGIC or end > size or zlib.crc32(mm[offset + CHUNK_HEADER.size:end]) != crc:
+            break
+        offset = end
+    return offset
+
+
+def _repair(path):
+    """Trunca um chunk final incompleto (queda durante a gravação) antes de anexar novos chunks."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "r+b") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            valid = _valid_length(mm)
+        if valid < size:
+            f.truncate(valid)
+            print(f"!! [Aviso] {path}: {size - valid} bytes de chunk incompleto descartados.", file=sys.stderr)
+
+
+class TapeRecorder:
+    """
+    Gravador append-only da fita. Os trades ficam em buffer e viram um chunk ao
+    atingir `chunk_rows`, após `max_latency` segundos ou na troca de período
+    (rotação por hora/dia do timestamp do trade).
+    """
+
+    def __init__(self, directory, rotation="hour", chunk_rows=5000, max_latency=300, prefix="trades"):
+        if rotation not in ROTATIONS:
+            raise ValueError(f"Rotação inválida: {rotation} (use {', '.join(ROTATIONS)})")
+        self.directory = directory
+        self.rotation = rotation
+        self.chunk_rows = chunk_rows
+        self.max_latency = max_latency
+        self.prefix = prefix
+        self.stats = {"trades": 0, "chunks": 0, "bytes": 0, "raw_bytes": 0, "write_s": 0.0, "files": 0}
+        os.makedirs(directory, exist_ok=True)
+
+        self._buffer = []
+        self._period = None
+        self._oldest = None
+        self._file = None
+        self._file_period = None
+
+    def _period_of(self, t):
+        try:
+            ts = int(float(t["timestamp"]))
+        except (KeyError, TypeError, ValueError):
+            ts = int(time.time())
+        return datetime.fromtimestamp(ts, timezone.utc).strftime(ROTATIONS[self.rotation])
+
+    def path_for(self, period):
+        return os.path.join(self.directory, f"{self.prefix}-{period}.ptape")
+
+    def record(self, trades):
+        """Enfileira trades brutos (como vieram da API). Grava chunks quando necessário."""
+        for t in trades:
+            period = self._period_of(t)
+            if self._buffer and period != self._period:
+                self.flush()
+            self._period = period
+            self._buffer.append(t)
+            if len(self._buffer) >= self.chunk_rows:
+                self.flush()
+        if self._buffer:
+            if self._oldest is None:
+                self._oldest = time.time()
+            elif time.time() - self._oldest >= self.max_latency:
+                self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        started = time.perf_counter()
+        data, raw_len = encode_chunk(self._buffer)
+        if self._file_period != self._period:
+            if self._file is not None:
+                self._file.close()
+            path = self.path_for(self._period)
+            if os.path.exists(path):
+                _repair(path)
+            self._file = open(path, "ab")
+            self._file_period = self._period
+            self.stats["files"] += 1
+        self._file.write(data)
+        self._file.flush()
+
+        self.stats["write_s"] += time.perf_counter() - started
+        self.stats["trades"] += len(self._buffer)
+        self.stats["chunks"] += 1
+        self.stats["bytes"] += len(data)
+        self.stats["raw_bytes"] += raw_len
+        self._buffer = []
+        self._oldest = None
+
+    def report(self):
+        st = self.stats
+        per_trade = st["bytes"] / st["trades"] if st["trades"] else 0
+        rate = st["trades"] / st["write_s"] if st["write_s"] else 0
+        return {"trades": st["trades"], "chunks": st["chunks"], "files": st["files"],
+                "bytes_per_trade": round(per_trade, 1), "trades_per_s": round(rate),
+                "compression": round(st["raw_bytes"] / st["bytes"], 2) if st["bytes"] else None}
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TapeReader:
+    """Leitura de um arquivo .ptape via mmap, um chunk por vez."""
+
+    def __init__(self, path):
+        self.path = path
+        self.truncated = False
+
+    def chunks(self, start_ts=None, end_ts=None):
+        """Itera (linhas, colunas) dos chunks que intersectam [start_ts, end_ts]."""
+        if os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            size = len(mm)
+            while offset + CHUNK_HEADER.size <= size:
+                magic, rows, comp_len, raw_len, crc, min_ts, max_ts = CHUNK_HEADER.unpack_from(mm, offset)
+                start = offset + CHUNK_HEADER.size
+                end = start + comp_len
+                if magic != CHUNK_MAGIC or end > size:
+                    self.truncated = True
+                    break
+                offset = end
+                if (start_ts is not None and max_ts < start_ts) or (end_ts is not None and min_ts > end_ts):
+                    continue
+                payload = mm[start:end]
+                if zlib.crc32(payload) != crc:
+                    self.truncated = True
+                    break
+                yield decode_columns(payload)
+            if offset < size and not self.truncated:
+                self.truncated = True
+        if self.truncated:
+            print(f"!! [Aviso] {self.path}: chunk final incompleto ignorado.", file=sys.stderr)
+
+    def trades(self, start_ts=None, end_ts=None):
+        """Itera os trades como dicts (mesmo formato da API)."""
+        for n, columns in self.chunks(start_ts, end_ts):
+            names = list(columns)
+            cols = [columns[k] for k in names]
+            for i in range(n):
+                t = {}
+                for name, col in zip(names, cols):
+                    v = col[i]
+                    if v is not MISSING_VALUE:
+                        t[name] = v
+                if start_ts is not None or end_ts is not None:
+                    ts = t.get("timestamp")
+                    if isinstance(ts, (int, float)) and ((start_ts is not None and ts < start_ts)
+                                                         or (end_ts is not None and ts > end_ts)):
+                        continue
+                yield t
+
+
+def tape_files(path):
+    """Um arquivo .ptape ou todos os de um diretório, em ordem cronológica."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".ptape"))
+    return [path]
+
+
+def iter_trades(path, start_ts=None, end_ts=None):
+    for file in tape_files(path):
+        yield from TapeReader(file).trades(start_ts, end_ts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspeção de fitas .ptape")
+    parser.add_argument("command", choices=["info", "cat"])
+    parser.add_argument("path", help="Arquivo .ptape ou diretório de fitas")
+    parser.add_argument("--from", dest="start", type=int, help="Timestamp inicial (epoch)")
+    parser.add_argument("--to", dest="end", type=int, help="Timestamp final (epoch)")
+    args = parser.parse_args()
+
+    if args.command == "cat":
+        for t in iter_trades(args.path, args.start, args.end):
+            sys.stdout.write(json.dumps(t, ensure_ascii=False) + "\n")
+        return
+
+    total_trades = total_bytes = total_chunks = 0
+    first = last = None
+    started = time.perf_counter()
+    for file in tape_files(args.path):
+        total_bytes += os.path.getsize(file)
+        for n, columns in TapeReader(file).chunks(args.start, args.end):
+            total_trades += n
+            total_chunks += 1
+            stamps = [v for v in columns.get("timestamp", []) if isinstance(v, (int, float))]
+            if stamps:
+                first = min(stamps) if first is None else min(first, min(stamps))
+                last = max(stamps) if last is None else max(last, max(stamps))
+    elapsed = time.perf_counter() - started
+
+    print(f">> Arquivos: {len(tape_files(args.path))} | Chunks: {total_chunks} | Trades: {total_trades:,}")
+    if total_trades:
+        print(f">> Bytes/trade: {total_bytes / total_trades:.1f} | Leitura: {total_trades / elapsed:,.0f} trades/s")
+    if first is not None:
+        print(f">> Período: {datetime.fromtimestamp(first)} -> {datetime.fromtimestamp(last)}")
+
+
+if __name__ == "__main__":
+    main()
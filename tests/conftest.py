@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import schema  # noqa: E402
+
+
+@pytest.fixture
+def dbs(tmp_path):
+    """Bancos principal e insider vazios, já migrados (caminhos)."""
+    db_main, db_insider = str(tmp_path / "main.db"), str(tmp_path / "insider.db")
+    schema.migrate_all(db_main, db_insider)
+    return db_main, db_insider
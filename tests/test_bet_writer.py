@@ -0,0 +1,75 @@
+import json
+import sqlite3
+
+import pytest
+
+from bet_writer import BetWriter, is_busy
+
+BET = {"wallet": "0xw", "question": "Q", "category": "Politics", "position": "BUY Yes", "link": "#", "value": 30.0,
+       "last_ts": 100, "tx": "0xt"}
+INTEL = {"source": "Varejo", "created": 100, "portfolio": 0}
+
+
+@pytest.fixture
+def writer(dbs, tmp_path):
+    writer = BetWriter(*dbs, max_latency=3600, max_retries=2, dead_letter=str(tmp_path / "dead_letter.jsonl"))
+    yield writer
+    writer.close()
+
+
+def failing(exc):
+    def write(*batch):
+        raise exc
+    return write
+
+
+def dead_letters(writer):
+    with open(writer.dead_letter) as f:
+        return [json.loads(line) for line in f]
+
+
+def count_bets(writer):
+    return writer.conn_main.execute("SELECT COUNT(*) FROM bets").fetchone()[0]
+
+
+def test_is_busy_only_for_lock_contention():
+    assert is_busy(sqlite3.OperationalError("database is locked"))
+    assert not is_busy(sqlite3.OperationalError("disk I/O error"))
+    assert not is_busy(sqlite3.OperationalError("no such table: bets"))
+    assert not is_busy(sqlite3.IntegrityError("UNIQUE constraint failed"))
+
+
+def test_busy_batches_are_requeued_up_to_the_retry_cap(writer, monkeypatch):
+    monkeypatch.setattr(writer, "_write_main", failing(sqlite3.OperationalError("database is locked")))
+    writer.add_bet(BET, INTEL)
+    assert not writer.flush() and not writer.flush()
+    assert writer.pending() == 1 and writer.stats["requeued"] == 2
+    assert writer.flush()  # Terceira falha seguida: lote descartado, nada fica na fila
+    assert writer.pending() == 0 and writer.stats["dropped"] == 1
+    assert [entry["db"] for entry in dead_letters(writer)] == ["main"]
+
+
+def test_permanent_errors_go_to_the_dead_letter_file(writer, monkeypatch):
+    monkeypatch.setattr(writer, "_write_insider", failing(sqlite3.OperationalError("database or disk is full")))
+    writer.add_insider(BET, INTEL)
+    writer.add_bet(BET, INTEL)
+    assert writer.flush()
+    assert writer.pending() == 0
+    assert writer.stats == {"requeued": 0, "dropped": 1}
+    # Só o lote do banco que falhou é descartado; o principal é gravado normalmente
+    assert count_bets(writer) == 1
+    entry, = dead_letters(writer)
+    assert entry["db"] == "insider" and entry["error"] == "database or disk is full"
+    assert entry["insider_rows"][0][0] == "0xw" and entry["insider_updates"] == []
+
+
+def test_requeued_batch_is_written_once_the_lock_is_released(writer, dbs):
+    blocker = sqlite3.connect(dbs[0])
+    blocker.execute("BEGIN IMMEDIATE")
+    writer.conn_main.execute("PRAGMA busy_timeout = 50")
+    writer.add_bet(BET, INTEL)
+    assert not writer.flush()
+    blocker.rollback()
+    blocker.close()
+    assert writer.flush()
+    assert count_bets(writer) == 1
@@ -0,0 +1,106 @@
+from clusters import ClusterIndex
+from ladder import LadderBook
+from pipeline import DualPipeline
+from replay import MemorySink
+
+T0 = 1_700_000_000
+THRESHOLDS = {"STREAM_NOISE_FLOOR": 9, "STREAM_MIN_SIZE": 10, "ACCUMULATION_FLOOR": 500, "LADDER_WINDOW": 600,
+              "INSIDER_TRIGGER": 3000, "CRITICAL_TRIGGER": 5000}
+MARKETS = {"0xc": {"q": "Mercado", "c": "Politics", "url": "#"}}
+
+
+def linked(index, a, b, ts=T0):
+    """Liga `a` e `b` por co-trade (min_hits=1) num mercado à parte."""
+    index.observe(a, f"0xlink{a}", "BUY Yes", 1, ts)
+    index.observe(b, f"0xlink{a}", "BUY Yes", 1, ts)
+    return index.find(a) == index.find(b)
+
+
+def test_expire_drops_only_idle_buckets():
+    index = ClusterIndex(min_hits=1, bucket_window=600)
+    assert linked(index, "0xa", "0xb")
+    index.observe("0xa", "0xc1", "BUY Yes", 100, T0)
+    index.observe("0xa", "0xc2", "BUY Yes", 100, T0)
+    index.observe("0xb", "0xc2", "BUY Yes", 100, T0 + 500)  # Entrada antiga de 0xc2 fica obsoleta
+
+    index.expire(T0 + 601)
+    root = index.find("0xa")
+    assert (root, "0xc1", "BUY Yes") not in index._buckets
+    assert index._buckets[(root, "0xc2", "BUY Yes")].value == 200
+
+    index.expire(T0 + 1101)
+    assert (root, "0xc2", "BUY Yes") not in index._buckets
+    assert not index._root_buckets[root]
+
+
+def test_expire_follows_buckets_moved_by_a_merge():
+    index = ClusterIndex(min_hits=1, bucket_window=600)
+    assert linked(index, "0xa", "0xb")
+    assert linked(index, "0xc", "0xd")
+    index.observe("0xa", "0xm", "BUY Yes", 100, T0)
+    index.observe("0xc", "0xm", "BUY Yes", 100, T0 + 300)
+    assert index.union("0xa", "0xc", "funder")
+
+    root = index.find("0xa")
+    index.expire(T0 + 601)  # As entradas das raízes antigas são descartadas sem efeito
+    assert index._buckets[(root, "0xm", "BUY Yes")].value == 200
+    index.expire(T0 + 901)
+    assert (root, "0xm", "BUY Yes") not in index._buckets
+
+
+def test_heap_is_compacted():
+    index = ClusterIndex(min_hits=1, bucket_window=600)
+    assert linked(index, "0xa", "0xb")
+    for k in range(5000):
+        index.observe("0xa", "0xm", "BUY Yes", 1, T0 + k)
+    assert len(index._heap) <= 4 * len(index._buckets) + 1024
+
+
+def test_least_recent_clusters_are_evicted():
+    index = ClusterIndex(min_hits=1, max_wallets=4)
+    assert linked(index, "0xa", "0xb", T0)
+    assert linked(index, "0xc", "0xd", T0 + 1)
+    index.observe("0xa", "0xm", "BUY Yes", 100, T0 + 2)  # 0xa/0xb passa a ser o mais recente
+    assert linked(index, "0xe", "0xf", T0 + 3)
+
+    assert index.find("0xc") is None and index.find("0xd") is None
+    assert index.find("0xa") == index.find("0xb")
+    assert index.find("0xe") == index.find("0xf")
+    assert len(index._parent) <= 4
+    assert index.stats["evicted"] == 1
+
+
+def test_funder_map_is_bounded():
+    index = ClusterIndex(max_wallets=3)
+    for k in range(10):
+        index.link_funder(f"0xw{k}", f"0xf{k}")
+    assert len(index._funded) == 3
+    assert len(index._parent) == 0  # Nenhuma ligação: carteiras sem par não entram no índice
+    assert index.link_funder("0xw10", "0xf9") and index.find("0xw10") == index.find("0xw9")
+
+
+class FixedScorer:
+    def observe(self, cid, usd, ts):
+        pass
+
+    def triggers(self, cid):
+        return THRESHOLDS["INSIDER_TRIGGER"], THRESHOLDS["CRITICAL_TRIGGER"]
+
+    def score(self, cid, value):
+        return {"z": 4.0}
+
+
+def test_cluster_members_are_flagged_and_counted():
+    sink = MemorySink()
+    ladder = LadderBook(None, THRESHOLDS["LADDER_WINDOW"], market_lookup=MARKETS.get)
+    clusters = ClusterIndex(min_hits=1, trigger=5000)
+    engine = DualPipeline(THRESHOLDS, MARKETS, set(MARKETS), ladder, sink, clusters=clusters, scorer=FixedScorer())
+    for k in range(3):
+        for wallet in ("0xa", "0xb"):
+            engine.ingest({"conditionId": "0xc", "proxyWallet": wallet, "side": "BUY", "outcome": "Yes",
+                           "size": 2000, "price": 0.5, "transactionHash": f"0x{wallet}{k}"}, T0 + k)
+
+    assert engine.stats["cluster"] == 1
+    assert engine.stats["settled_insider"] == 2
+    assert engine.stats["anomaly"] == 2
+    assert {d["wallet"] for d in sink.detections} == {"0xa", "0xb"}
@@ -0,0 +1,99 @@
+from ingest import TradeCursor, TradePager, trade_key
+
+
+def make_trade(n, ts, **extra):
+    return dict({"transactionHash": f"0xt{n}", "asset": "a", "proxyWallet": f"0xw{n}", "side": "BUY",
+                 "size": 10, "price": 0.5, "timestamp": ts}, **extra)
+
+
+class FakeTape:
+    """Resposta do /trades: mais novo primeiro, paginada por limit/offset."""
+
+    def __init__(self):
+        self.trades = []
+
+    def publish(self, *trades):
+        self.trades[:0] = sorted(trades, key=lambda t: t["timestamp"], reverse=True)
+
+    def page(self, limit, offset):
+        return self.trades[offset:offset + limit]
+
+
+def drain(pager, cursor):
+    fresh, _ = pager.fetch_new(cursor)
+    for key, ts, _ in fresh:
+        cursor.mark(key, ts)
+    cursor.save()
+    return [t["transactionHash"] for _, _, t in fresh]
+
+
+def test_trade_key_prefers_api_id():
+    assert trade_key({"id": 7, "transactionHash": "0x1"}) == "7"
+    assert trade_key(make_trade(1, 100)) != trade_key(make_trade(1, 100, size=11))
+
+
+def test_trades_sharing_the_cursor_second_are_not_dropped(dbs):
+    tape = FakeTape()
+    cursor = TradeCursor(dbs[0])
+    cursor.start_at(99)
+    pager = TradePager(tape.page, page_size=3, max_pages=10)
+
+    tape.publish(make_trade(1, 100), make_trade(2, 101))
+    assert drain(pager, cursor) == ["0xt1", "0xt2"]
+    # Novo trade no mesmo segundo do cursor e repetição dos já vistos
+    tape.publish(make_trade(3, 101), make_trade(4, 102))
+    assert drain(pager, cursor) == ["0xt3", "0xt4"]
+    assert drain(pager, cursor) == []
+    assert pager.stats["deduped"] >= 4
+    cursor.close()
+
+
+def test_overlapping_pages_are_deduplicated_within_a_cycle(dbs):
+    cursor = TradeCursor(dbs[0])
+    cursor.start_at(0)
+    # Um trade novo desloca o offset: a segunda página repete o último da primeira
+    pages = [[make_trade(3, 30), make_trade(2, 20)], [make_trade(2, 20), make_trade(1, 10)]]
+    pager = TradePager(lambda limit, offset: pages[offset // limit] if offset // limit < len(pages) else [],
+                       page_size=2, max_pages=5)
+    assert drain(pager, cursor) == ["0xt1", "0xt2", "0xt3"]
+    cursor.close()
+
+
+def test_cursor_survives_restart(dbs):
+    tape = FakeTape()
+    cursor = TradeCursor(dbs[0], overlap=120)
+    cursor.start_at(99)
+    pager = TradePager(tape.page, page_size=10)
+    tape.publish(make_trade(1, 100), make_trade(2, 100))
+    drain(pager, cursor)
+    cursor.close()
+
+    cursor = TradeCursor(dbs[0], overlap=120)
+    assert cursor.last_ts == 100
+    tape.publish(make_trade(3, 100))
+    assert drain(pager, cursor) == ["0xt3"]
+    cursor.close()
+
+
+def test_floor_and_overlap_window(dbs):
+    cursor = TradeCursor(dbs[0], overlap=60)
+    cursor.start_at(1000)
+    assert cursor.is_seen("x", 1000)  # Início sem histórico: nada até o piso
+    cursor.mark("a", 1100)
+    assert cursor.is_seen("a", 1100)
+    assert not cursor.is_seen("b", 1100)
+    assert cursor.is_seen("b", 1100 - 61)  # Abaixo da janela de sobreposição
+    cursor.close()
+
+
+def test_gap_when_pages_do_not_reach_the_cursor(dbs):
+    tape = FakeTape()
+    cursor = TradeCursor(dbs[0])
+    cursor.start_at(0)
+    pager = TradePager(tape.page, page_size=2, max_pages=2)
+    tape.publish(*(make_trade(i, 100 + i) for i in range(10)))
+    fresh, pages = pager.fetch_new(cursor)
+    assert pages == 2 and len(fresh) == 4
+    assert pager.stats["gaps"] == 1
+    assert cursor.covered_from == 107  # Mais antigo lido (106) + 1
+    cursor.close()
@@ -0,0 +1,55 @@
+import pytest
+
+from intel_cache import WalletIntelCache
+
+
+@pytest.fixture
+def cache(dbs):
+    cache = WalletIntelCache(dbs[1], {"portfolio": 10, "profile": None}, neg_base=300)
+    yield cache
+    cache.close()
+
+
+def expire(cache, seconds=100):
+    cache.conn.execute("UPDATE wallet_intel_cache SET fetched_ts = fetched_ts - ?", (seconds,))
+    cache.conn.commit()
+
+
+def test_hit_within_ttl(cache):
+    calls = []
+    fetch = lambda w: calls.append(w) or 5.0
+    assert cache.get_or_fetch("0xw", "portfolio", fetch) == 5.0
+    assert cache.get_or_fetch("0xw", "portfolio", fetch) == 5.0
+    assert calls == ["0xw"]
+    assert cache.stats["hits"] == 1
+
+
+def test_failed_refetch_serves_stale_value_with_backoff(cache):
+    cache.get_or_fetch("0xw", "portfolio", lambda w: 5.0)
+    expire(cache)
+    calls = []
+    failing = lambda w: calls.append(w)
+    assert cache.get_or_fetch("0xw", "portfolio", failing) == 5.0
+    # Em backoff: o valor antigo continua servido sem nova consulta à API
+    assert cache.get_or_fetch("0xw", "portfolio", failing) == 5.0
+    assert calls == ["0xw"]
+    assert cache.stats["stale"] == 1 and cache.stats["failures"] == 1 and cache.stats["negative_hits"] == 1
+
+
+def test_failure_without_value_is_negative_cached(cache):
+    calls = []
+    failing = lambda w: calls.append(w)
+    assert cache.get_or_fetch("0xw", "profile", failing) is None
+    assert cache.get_or_fetch("0xw", "profile", failing) is None
+    assert calls == ["0xw"]
+    assert cache.lookup("0xw", "profile") == ("negative", None)
+
+
+def test_backoff_grows_and_success_resets_it(cache):
+    for _ in range(2):
+        cache.get_or_fetch("0xw", "profile", lambda w: None)
+        cache.conn.execute("UPDATE wallet_intel_cache SET retry_after = 1")  # Backoff vencido
+        cache.conn.commit()
+    assert cache.conn.execute("SELECT fail_count FROM wallet_intel_cache").fetchone()[0] == 2
+    assert cache.get_or_fetch("0xw", "profile", lambda w: 1234) == 1234
+    assert cache.conn.execute("SELECT fail_count, retry_after FROM wallet_intel_cache").fetchone() == (0, 0)
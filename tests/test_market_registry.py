@@ -0,0 +1,31 @@
+import sqlite3
+
+from market_registry import MarketRegistry
+
+
+def write(db, *cids):
+    conn = sqlite3.connect(db)
+    conn.execute("DELETE FROM market_registry")
+    conn.executemany("INSERT INTO market_registry (cid, question, category, url, updated_ts) "
+                     "VALUES (?, ?, 'c', '#', 0)", [(cid, f"Mercado {cid}") for cid in cids])
+    conn.commit()
+    conn.close()
+
+
+def test_load_replaces_the_live_views_in_place(dbs):
+    write(dbs[0], "0xa", "0xb")
+    registry = MarketRegistry(dbs[0], None, ["politics"])
+    ids, markets = registry.ids, registry.markets
+    assert registry.load() == 2
+
+    # Outro processo sincronizou: 0xa encerrou, 0xc entrou e 0xb mudou de pergunta
+    write(dbs[0], "0xb", "0xc")
+    conn = sqlite3.connect(dbs[0])
+    conn.execute("UPDATE market_registry SET question = 'Nova' WHERE cid = '0xb'")
+    conn.commit()
+    conn.close()
+    assert registry.load() == 2
+    assert registry.ids is ids and registry.markets is markets
+    assert ids == {"0xb", "0xc"} and set(markets) == ids
+    assert markets["0xb"]["q"] == "Nova"
+    registry.close()
@@ -0,0 +1,129 @@
+import json
+import random
+
+from clusters import ClusterIndex
+from ingest import TradeCursor, TradePager
+from ladder import LadderBook
+from pipeline import DualPipeline
+from replay import DEFAULT_TICK, MemorySink, VirtualClock, load_tape, make_clusters, replay
+
+THRESHOLDS = {"STREAM_NOISE_FLOOR": 9, "STREAM_MIN_SIZE": 10, "ACCUMULATION_FLOOR": 500, "LADDER_WINDOW": 600,
+              "INSIDER_TRIGGER": 3000, "CRITICAL_TRIGGER": 5000,
+              "CLUSTER_WINDOW": 60, "CLUSTER_MIN_HITS": 2, "CLUSTER_MAX_SIZE": 25, "CLUSTER_TRIGGER": 5000}
+MARKETS = {f"0xc{i}": {"q": f"Mercado {i}", "c": "Politics", "url": f"https://polymarket.com/event/{i}"}
+           for i in range(4)}
+T0 = 1_700_000_000
+LADDERS = ((4, 600), (6, 600), (6, 1000))  # (trades, USD): abaixo do limite, insider na liquidação, crítica
+
+
+def trade(n, ts, cid, wallet, usd, outcome="Yes"):
+    return {"transactionHash": f"0xt{n}", "asset": cid, "conditionId": cid, "proxyWallet": wallet, "side": "BUY",
+            "outcome": outcome, "size": round(usd / 0.5, 2), "price": 0.5, "timestamp": ts}
+
+
+def make_tape(seed=7):
+    """
+    Varejo aleatório (vários trades por segundo, incluindo mercados fora do filtro)
+    e, em sessões separadas por mais de uma janela, acumulações de carteiras únicas:
+    abaixo do limite, insider na liquidação, críticas e pares coordenados (cluster).
+    """
+    r = random.Random(seed)
+    cids = list(MARKETS) + ["0xfora"]
+    trades = []
+    ts = T0
+    for session in range(12):
+        end = ts + 900
+        while ts < end:
+            ts += r.randint(0, 2)
+            trades.append(trade(len(trades), ts, r.choice(cids), f"0xw{r.randint(0, 300)}", r.uniform(1, 450),
+                                r.choice(["Yes", "No"])))
+        cid = r.choice(list(MARKETS))
+        kind = session % 4
+        if kind == 3:  # Par coordenado: cada carteira abaixo dos gatilhos, juntas acima do de cluster
+            for k in range(6):
+                for wallet in (f"0xpa{session}", f"0xpb{session}"):
+                    trades.append(trade(len(trades), ts + 20 * k, cid, wallet, 550))
+        else:
+            count, usd = LADDERS[kind]
+            for k in range(count):
+                trades.append(trade(len(trades), ts + 20 * k, cid, f"0xl{session}", usd))
+        ts += 1500
+    return [(t["timestamp"], t) for t in trades]
+
+
+def run_live(trades, db_main, page_size=40, interval=DEFAULT_TICK):
+    """Mesmo ciclo do WhaleSentinel.watch: avalia buckets, pagina o /trades, ingere, marca e salva o cursor."""
+    clock = VirtualClock()
+    sink = MemorySink()
+    ladder = LadderBook(db_main, THRESHOLDS["LADDER_WINDOW"], market_lookup=MARKETS.get)
+    clusters = ClusterIndex(db_main, window=THRESHOLDS["CLUSTER_WINDOW"], min_hits=THRESHOLDS["CLUSTER_MIN_HITS"],
+                            max_size=THRESHOLDS["CLUSTER_MAX_SIZE"], trigger=THRESHOLDS["CLUSTER_TRIGGER"],
+                            bucket_window=THRESHOLDS["LADDER_WINDOW"])
+    engine = DualPipeline(THRESHOLDS, MARKETS, set(MARKETS), ladder, sink, clock=clock, clusters=clusters)
+    cursor = TradeCursor(db_main)
+    cursor.start_at(trades[0][0] - 1)
+    published = []  # Em ordem de chegada; a API responde do mais novo para o mais antigo
+
+    def fetch_page(limit, offset):
+        newest_first = published[::-1]
+        return newest_first[offset:offset + limit]
+
+    pager = TradePager(fetch_page, page_size=page_size, max_pages=50)
+
+    i = 0
+    now = trades[0][0]
+    while i < len(trades):
+        clock.now = now
+        engine.tick()
+        while i < len(trades) and trades[i][0] <= now:
+            published.append(trades[i][1])
+            i += 1
+        # Atraso da API: só o primeiro trade do segundo seguinte já aparece (o resto vem no próximo ciclo)
+        if i < len(trades) and trades[i][0] == now + 1:
+            published.append(trades[i][1])
+            i += 1
+        fresh, _ = pager.fetch_new(cursor)
+        for key, ts, t in fresh:
+            engine.ingest(t, ts)
+            cursor.mark(key, ts)
+        cursor.save()
+        now += interval
+    clock.now = trades[-1][0] + THRESHOLDS["LADDER_WINDOW"] + 1
+    engine.tick()
+    ladder.close()
+    clusters.close()
+    cursor.close()
+    assert pager.stats["gaps"] == 0
+    return engine.stats, sink
+
+
+def test_replay_matches_the_live_engine(dbs):
+    trades = make_tape()
+    live_stats, live_sink = run_live(trades, dbs[0])
+
+    sink = MemorySink()
+    result = replay(trades, THRESHOLDS, MARKETS, set(MARKETS), sink=sink, clusters=make_clusters(THRESHOLDS))
+
+    assert live_stats["trades"] == len(trades)
+    assert result["stats"]["malformed"] == 0 and result["stats"]["open_buckets"] == 0
+    assert {k: result["stats"][k] for k in live_stats} == live_stats
+    assert result["sink"] == live_sink.summary()
+    key = lambda d: (d["last_ts"], d["wallet"], d["position"])
+    assert sorted(sink.detections, key=key) == sorted(live_sink.detections, key=key)
+
+    # Todas as classes de acumulação aparecem na fita
+    for name in ("stream", "filtered", "settled_retail", "settled_insider", "critical", "cluster"):
+        assert live_stats[name] > 0, name
+
+
+def test_replay_deduplicates_repeated_tape_rows(tmp_path):
+    trades = make_tape()
+    path = tmp_path / "fita.jsonl"
+    # Respostas sobrepostas do /trades repetem trades na fita gravada
+    with open(path, "w") as f:
+        for _, t in trades + trades[-50:]:
+            f.write(json.dumps(t) + "\n")
+    loaded, dropped = load_tape(str(path))
+    assert dropped == 0
+    assert [t for _, t in loaded] == [t for _, t in sorted(trades, key=lambda item: item[0])]
+    assert replay(loaded, THRESHOLDS, MARKETS, set(MARKETS))["stats"]["trades"] == len(trades)
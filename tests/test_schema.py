@@ -0,0 +1,124 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import schema
+import timeseries
+from conftest import ROOT
+
+SHIPPED = ("whale_hunter.db", "insider_intel.db")
+
+
+@pytest.fixture
+def shipped(tmp_path):
+    """Cópias dos bancos publicados no repositório (criados antes das migrações)."""
+    paths = []
+    for name in SHIPPED:
+        src = os.path.join(ROOT, name)
+        if not os.path.exists(src):
+            pytest.skip(f"{name} não encontrado")
+        shutil.copy(src, tmp_path / name)
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def scalar(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_shipped_dbs_migrate_to_latest(shipped):
+    db_main, db_insider = shipped
+    bets = scalar(db_main, "SELECT COUNT(*) FROM bets")
+    volume = scalar(db_main, "SELECT SUM(size_usd) FROM bets")
+    intel_volume = scalar(db_insider, "SELECT SUM(size_usd) FROM intel_bets")
+
+    schema.migrate_all(db_main, db_insider)
+
+    assert scalar(db_main, "PRAGMA user_version") == schema.MAIN_MIGRATIONS[-1][0]
+    assert scalar(db_insider, "PRAGMA user_version") == schema.INSIDER_MIGRATIONS[-1][0]
+    assert scalar(db_main, "SELECT COUNT(*) FROM schema_migrations") == len(schema.MAIN_MIGRATIONS)
+    assert scalar(db_main, "SELECT COUNT(*) FROM bets") == bets
+    # Rollups e séries populados a partir do histórico existente
+    assert scalar(db_main, "SELECT value FROM rollup_totals WHERE name = 'total_volume'") == pytest.approx(volume)
+    assert scalar(db_main, "SELECT SUM(total_size) FROM rollup_market") == pytest.approx(volume)
+    assert scalar(db_main, "SELECT SUM(bet_count) FROM rollup_market") == bets
+    assert scalar(db_main, '''SELECT SUM(volume) FROM velocity_series
+                              WHERE resolution = 86400 AND scope = 'all' ''') == pytest.approx(volume)
+    assert scalar(db_insider, "SELECT value FROM rollup_totals WHERE name = 'intel_volume'") == pytest.approx(intel_volume)
+
+
+def test_migrations_are_idempotent(shipped):
+    schema.migrate_all(*shipped)
+    for path, migrations in zip(shipped, (schema.MAIN_MIGRATIONS, schema.INSIDER_MIGRATIONS)):
+        conn = sqlite3.connect(path)
+        try:
+            before = conn.execute("SELECT * FROM rollup_totals ORDER BY name").fetchall()
+            assert schema.migrate(conn, migrations) == []
+            assert conn.execute("SELECT * FROM rollup_totals ORDER BY name").fetchall() == before
+        finally:
+            conn.close()
+
+
+def test_fresh_dbs_match_migrated_schema(dbs, shipped):
+    schema.migrate_all(*shipped)
+    for fresh, migrated in zip(dbs, shipped):
+        tables = "SELECT name FROM sqlite_master WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        conn_a, conn_b = sqlite3.connect(fresh), sqlite3.connect(migrated)
+        try:
+            assert conn_a.execute(tables).fetchall() == conn_b.execute(tables).fetchall()
+        finally:
+            conn_a.close()
+            conn_b.close()
+
+
+def test_existing_rollups_are_not_rebuilt(tmp_path):
+    """Bancos que já tinham os rollups antes das migrações mantêm os valores (a migração 2 só cria o que falta)."""
+    conn = sqlite3.connect(str(tmp_path / "main.db"))
+    schema.migrate(conn, schema.MAIN_MIGRATIONS, target=1)
+    conn.execute("INSERT INTO bets (whale_address, timestamp, market_question, size_usd) VALUES ('0xa', 100, 'Q', 50)")
+    conn.execute("CREATE TABLE rollup_totals (name TEXT PRIMARY KEY, value REAL DEFAULT 0)")
+    conn.execute("INSERT INTO rollup_totals VALUES ('total_volume', 42)")
+    conn.commit()
+    schema.migrate(conn, schema.MAIN_MIGRATIONS)
+    assert conn.execute("SELECT value FROM rollup_totals WHERE name = 'total_volume'").fetchone()[0] == 42
+    assert conn.execute("SELECT COUNT(*) FROM rollup_market").fetchone()[0] == 0
+    conn.close()
+
+
+def test_velocity_migration_matches_rebuild(tmp_path, monkeypatch):
+    """A cópia congelada da migração 14 gera as mesmas séries que timeseries.rebuild (bets, partições e resumos)."""
+    now = 1_760_000_000
+    monkeypatch.setattr(schema.time, "time", lambda: now + 0.5)
+    archive = sqlite3.connect(str(tmp_path / "archive.db"))
+    schema.migrate(archive, schema.MAIN_MIGRATIONS, target=1)
+    archive.executemany("INSERT INTO bets (whale_address, timestamp, market_question, size_usd) VALUES (?, ?, ?, ?)",
+                        [(f"0xw{i % 7}", now - i * 977, f"Q{i % 3}", i % 50 + 1.0) for i in range(2000)])
+    archive.commit()
+    archive.close()
+
+    conn = sqlite3.connect(str(tmp_path / "main.db"))
+    schema.migrate(conn, schema.MAIN_MIGRATIONS, target=13)
+    conn.executemany("INSERT INTO bets (whale_address, timestamp, market_question, size_usd) VALUES (?, ?, ?, ?)",
+                     [(f"0xw{i % 5}", now - i * 61, None if i % 4 == 0 else f"Q{i % 3}", i % 30 + 1.0)
+                      for i in range(2000)])
+    conn.execute("INSERT INTO bets_partitions (name, path, state) VALUES ('p1', ?, 'archive')",
+                 (str(tmp_path / "archive.db"),))
+    conn.executemany('''INSERT INTO bets_summary (day, whale_address, market_question, position, bets, size_usd)
+                        VALUES (?, ?, ?, 'Yes', ?, ?)''',
+                     [((now // 86400 - 400 + i) * 86400, f"0xw{i % 3}", f"Q{i % 2}", i + 1, i * 10.0)
+                      for i in range(100)])
+    conn.commit()
+    assert schema.migrate(conn, schema.MAIN_MIGRATIONS) == [14]
+
+    dump = lambda: (sorted(conn.execute("SELECT * FROM velocity_series")),
+                    sorted(conn.execute("SELECT * FROM velocity_watermarks")))
+    migrated = dump()
+    timeseries.rebuild(conn, now=now)
+    assert migrated == dump()
+    conn.close()
@@ -0,0 +1,24 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def client(dbs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Caminhos relativos dos bancos e do diretório de métricas
+    monkeypatch.setattr(server, "DB_MAIN", dbs[0])
+    monkeypatch.setattr(server, "DB_INSIDER", dbs[1])
+    return server.create_app().test_client()
+
+
+@pytest.mark.parametrize("path", ["/api/stats", "/api/insider_data"])
+def test_latency_is_measured_per_request(client, path):
+    miss = client.get(path)
+    hit = client.get(path)
+    revalidated = client.get(path, headers={"If-None-Match": hit.headers["ETag"]})
+
+    assert miss.status_code == 200 and hit.status_code == 200 and revalidated.status_code == 304
+    assert "latency" not in miss.get_json()  # Fora do corpo cacheado
+    assert hit.get_data() == miss.get_data()
+    for response in (miss, hit, revalidated):
+        assert response.headers["Server-Timing"].startswith("app;dur=")
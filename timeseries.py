@@ -0,0 +1,257 @@
+"""
+Séries temporais de volume (velocidade) em várias resoluções.
+
+A tabela `velocity_series` guarda, para cada resolução (1 min, 5 min, 30 min,
+1 h e 1 dia) e escopo (`all`, `market` por market_question, `wallet` por
+carteira), o volume e o número de apostas de cada bucket. A leitura de uma
+janela é uma varredura pela chave primária: O(pontos), sem tocar em `bets`.
+
+- Só a resolução mais fina é gravada pelo escritor, na mesma transação das
+  apostas (`apply_bets`, chamado por rollups.apply_bets).
+- As mais grossas são derivadas da imediatamente mais fina por
+  `VelocityDownsampler`, que soma os buckets já fechados e avança a marca
+  d'água (`velocity_watermarks`) de cada resolução. Antes da marca a resolução
+  está completa; depois dela, `series` completa a janela com a mais fina.
+- Apostas atrasadas (backfill) cujo bucket já passou da marca vão direto para
+  aquela resolução, então nada é somado duas vezes nem perdido.
+- Cada resolução tem uma retenção (`RETENTION`): buckets mais antigos são
+  apagados depois de derivados, como um buffer circular. A diária não expira.
+
+A movimentação de `bets` para partições (partitions.py) não afeta as séries;
+`rebuild` as regenera a partir de bets + partições + resumos diários.
+"""
+import sqlite3
+import threading
+import time
+
+import checkpoint
+
+RESOLUTIONS = (60, 300, 1800, 3600, 86400)  # Da mais fina para a mais grossa
+RETENTION = {  # Segundos mantidos por resolução (None = para sempre)
+    60: 2 * 86400,
+    300: 14 * 86400,
+    1800: 60 * 86400,
+    3600: 180 * 86400,
+    86400: None,
+}
+ALIASES = {"1m": 60, "5m": 300, "30m": 1800, "1h": 3600, "1d": 86400}
+SCOPES = {  # escopo: expressão da chave sobre as colunas de bets
+    "all": "''",
+    "market": "IFNULL(market_question, '')",
+    "wallet": "whale_address",
+}
+
+UPSERT_POINT = '''
+    INSERT INTO velocity_series (resolution, scope, key, bucket, volume, bets) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(resolution, scope, key, bucket) DO UPDATE SET
+        volume = volume + excluded.volume,
+        bets = bets + excluded.bets
+'''
+# Deriva uma resolução a partir da imediatamente mais fina
+DOWNSAMPLE = '''
+    INSERT INTO velocity_series (resolution, scope, key, bucket, volume, bets)
+    SELECT ?, scope, key, (bucket / ?) * ?, SUM(volume), SUM(bets) FROM velocity_series
+    WHERE resolution = ? AND bucket >= ? AND bucket < ?
+    GROUP BY scope, key, 4
+    ON CONFLICT(resolution, scope, key, bucket) DO UPDATE SET
+        volume = volume + excluded.volume,
+        bets = bets + excluded.bets
+'''
+
+
+def parse_resolution(value):
+    """'5m', '1h' ou segundos (uma das RESOLUTIONS). Levanta ValueError."""
+    try:
+        resolution = ALIASES[value] if value in ALIASES else int(value)
+    except (TypeError, ValueError):
+        resolution = None
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolução inválida: {value} (use {', '.join(ALIASES)})")
+    return resolution
+
+
+def watermarks(conn):
+    """{resolução: ts} até onde cada resolução derivada está completa."""
+    return dict(conn.execute("SELECT resolution, ts FROM velocity_watermarks").fetchall())
+
+
+def apply_bets(conn, bets):
+    """
+    Soma um lote de apostas às séries (mesma transação do INSERT em bets).
+    `bets` é uma sequência de (whale_address, timestamp, market_question, size_usd).
+    """
+    if not bets:
+        return
+    marks = watermarks(conn)
+    finest = RESOLUTIONS[0]
+    points = {}
+    for wallet, ts, question, size in bets:
+        for resolution in RESOLUTIONS:
+            bucket = (ts // resolution) * resolution
+            # Resoluções derivadas só recebem direto o que o downsampler já deixou para trás
+            if resolution != finest and bucket >= marks.get(resolution, 0):
+                continue
+            for scope, key in (("all", ""), ("market", question or ""), ("wallet", wallet)):
+                point = points.setdefault((resolution, scope, key, bucket), [0.0, 0])
+                point[0] += size
+                point[1] += 1
+    conn.executemany(UPSERT_POINT, [k + tuple(v) for k, v in points.items()])
+
+
+def downsample(conn, now=None):
+    """
+    Deriva cada resolução da mais fina até o último bucket fechado, avançando as
+    marcas d'água (chamador abre e fecha a transação). Retorna {resolução: buckets gravados}.
+    """
+    now = int(time.time() if now is None else now)
+    marks = watermarks(conn)
+    rolled = {}
+    for fine, coarse in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+        upto = (now // coarse) * coarse
+        if fine in marks:  # A mais fina só está completa até a própria marca
+            upto = min(upto, (marks[fine] // coarse) * coarse)
+        start = marks.get(coarse, 0)
+        if upto <= start:
+            continue
+        cur = conn.execute(DOWNSAMPLE, (coarse, coarse, coarse, fine, start, upto))
+        conn.execute("INSERT OR REPLACE INTO velocity_watermarks (resolution, ts) VALUES (?, ?)", (coarse, upto))
+        marks[coarse] = upto
+        rolled[coarse] = cur.rowcount
+    return rolled
+
+
+def prune(conn, now=None):
+    """Apaga os buckets fora da retenção que já foram derivados na resolução seguinte. Retorna as linhas."""
+    now = int(time.time() if now is None else now)
+    marks = watermarks(conn)
+    deleted = 0
+    for resolution, coarser in zip(RESOLUTIONS, RESOLUTIONS[1:] + (None,)):
+        if RETENTION[resolution] is None:
+            continue
+        horizon = now - RETENTION[resolution]
+        if coarser is not None:
+            horizon = min(horizon, marks.get(coarser, 0))
+        deleted += conn.execute("DELETE FROM velocity_series WHERE resolution = ? AND bucket < ?",
+                                (resolution, horizon)).rowcount
+    return deleted
+
+
+def add_history(conn, source, table, now, count="COUNT(*)", ts="timestamp", resolutions=RESOLUTIONS):
+    """
+    Soma às séries de `conn` os agregados de `table`, lida pela conexão `source`
+    (pode ser outro arquivo). Respeita a retenção e as marcas d'água de `conn`;
+    resumos diários passam `ts="day"` e só a resolução diária.
+    """
+    marks = watermarks(conn)
+    for resolution in resolutions:
+        lower = now - RETENTION[resolution] if RETENTION[resolution] is not None else -1
+        upper = marks.get(resolution, 2 ** 62)
+        for scope, key in SCOPES.items():
+            rows = source.execute(f'''
+                SELECT ?, ?, {key}, ({ts} / ?) * ? AS bucket, SUM(size_usd), {count} FROM {table}
+                WHERE {ts} >= ? AND {ts} < ? GROUP BY 3, 4''',
+                (resolution, scope, resolution, resolution, (lower // resolution) * resolution, upper)).fetchall()
+            conn.executemany(UPSERT_POINT, rows)
+
+
+def rebuild(conn, now=None):
+    """
+    Regenera as séries de bets, partições arquivadas e resumos diários (chamador faz o commit).
+    As tabelas vêm da migração 14 de schema.py.
+    """
+    now = int(time.time() if now is None else now)
+    conn.execute("DELETE FROM velocity_series")
+    conn.execute("DELETE FROM velocity_watermarks")
+    # Derivadas começam completas até o último bucket fechado; daí em diante, o downsampler
+    conn.executemany("INSERT INTO velocity_watermarks (resolution, ts) VALUES (?, ?)",
+                     [(r, (now // r) * r) for r in RESOLUTIONS[1:]])
+
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "bets" in tables:
+        add_history(conn, conn, "bets", now)
+    if "bets_partitions" in tables:
+        for (path,) in conn.execute("SELECT path FROM bets_partitions WHERE state = 'archive'").fetchall():
+            part = sqlite3.connect(path, timeout=30.0)
+            try:
+                add_history(conn, part, "bets", now)
+            finally:
+                part.close()
+    if "bets_summary" in tables:
+        add_history(conn, conn, "bets_summary", now, count="SUM(bets)", ts="day", resolutions=(86400,))
+
+
+def series(conn, resolution, start, end, scope="all", key=""):
+    """
+    Pontos de [start, end) na resolução pedida, com buckets vazios zerados:
+    {"t": [...], "volume": [...], "bets": [...]}.
+    """
+    start = (start // resolution) * resolution
+    count = max(0, -(-(end - start) // resolution))
+    volume, bets = [0.0] * count, [0] * count
+    for bucket, vol, n in _points(conn, resolution, start, start + count * resolution, scope, key, watermarks(conn)):
+        i = (bucket - start) // resolution
+        volume[i] += vol
+        bets[i] += n
+    return {"t": [start + i * resolution for i in range(count)], "volume": volume, "bets": bets}
+
+
+def _points(conn, resolution, start, end, scope, key, marks):
+    """Linhas da resolução até a marca d'água; o restante vem (recursivamente) da mais fina."""
+    split = end if resolution not in marks else min(max(marks[resolution], start), end)
+    rows = conn.execute(
+        '''SELECT bucket, volume, bets FROM velocity_series
+           WHERE resolution = ? AND scope = ? AND key = ? AND bucket >= ? AND bucket < ?''',
+        (resolution, scope, key, start, split)).fetchall()
+    if split < end:
+        finer = RESOLUTIONS[RESOLUTIONS.index(resolution) - 1]
+        rows += [((bucket // resolution) * resolution, vol, n)
+                 for bucket, vol, n in _points(conn, finer, split, end, scope, key, marks)]
+    return rows
+
+
+class VelocityDownsampler:
+    """Deriva as resoluções grossas e aplica a retenção em segundo plano (uma transação curta por execução)."""
+
+    def __init__(self, db_path, interval=60):
+        self.db_path = db_path
+        self.interval = interval
+        self.stats = {"runs": 0, "rolled": 0, "pruned": 0}
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, now=None):
+        conn = checkpoint.connect(self.db_path, isolation_level=None)
+        try:
+            # IMMEDIATE: escritores e outros downsamplers veem a marca d'água já avançada
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rolled = downsample(conn, now)
+                pruned = prune(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self.stats["runs"] += 1
+            self.stats["rolled"] += sum(rolled.values())
+            self.stats["pruned"] += pruned
+        except sqlite3.Error as e:
+            print(f"\n!! [Erro] Falha na derivação das séries de velocidade: {e}")
+        finally:
+            conn.close()
+
+    def start(self, initial_delay=5):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(initial_delay,), name="velocity-downsampler",
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self, delay):
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = self.interval
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)